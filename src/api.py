@@ -1,27 +1,37 @@
 # src/api.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Body, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse, HTMLResponse
+from fastapi.responses import JSONResponse, StreamingResponse, HTMLResponse, Response
 from pydantic import BaseModel, Field
-from neo4j import GraphDatabase
 
 from llama_index.llms.openai import OpenAI
 from llama_index.program.openai import OpenAIPydanticProgram
 from llama_index.core.prompts.base import ChatPromptTemplate
 from llama_index.core.chat_engine.types import ChatMessage
+from llama_index.core.callbacks import CallbackManager, CBEventType, EventPayload
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
 
 from .config import Settings
-from .graph_store import graph_store
-from pyvis.network import Network
+from .cypher_guard import QueryRejected, acheck, bound, paged, query
+from .events import EventHub, delta_size
+from .graph_store import backend, async_driver, close_async_driver
+from .ingest import AddressError
+from .intents import answer as answer_intent
+from . import metrics
+from .metrics import CYPHER_REJECTED, CYPHER_ROWS, EVENTS, LLM_REQUESTS, LLM_TOKENS, RUNS, Gauge, stage
+from .result_pages import decode_cursor, encode_cursor, ndjson, read_page
+from .translation_cache import TranslationCache
+from .viewport import CursorError, StaleCursor, graph_page, neighbourhood_page
 
-import networkx as nx
 import asyncio
+import hashlib
+import json
+import logging
+from contextlib import asynccontextmanager
 
-from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
-
-update_listeners = []
+log = logging.getLogger(__name__)
 
 # ──────────────────────────────────────────────────────────────
 # 1) Our “function‐style” Pydantic schema for any Cypher query
@@ -34,13 +44,41 @@ class CypherQuery(BaseModel):
 
 
 class Instruction(BaseModel):
-    instruction: str
+    instruction: str = ""
+    limit: int | None = Field(None, ge=1)   # rows per page of a read (RUN_PAGE_ROWS)
+    cursor: str | None = None               # the previous page's cursor; instruction is then ignored
+    stream: bool = False                    # all rows as NDJSON instead of one page
 
 
 # ──────────────────────────────────────────────────────────────
 # 2) Spin up the LLM + Pydantic program for NL→Cypher
 # ──────────────────────────────────────────────────────────────
-_llm = OpenAI(model="gpt-4", temperature=0)
+class _TokenUsage(BaseCallbackHandler):
+    """Adds each LLM response's reported token counts to LLM_TOKENS."""
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+
+    def on_event_start(self, event_type, payload=None, event_id="", parent_id="", **kwargs):
+        return event_id
+
+    def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+        if event_type != CBEventType.LLM or not payload:
+            return
+        response = payload.get(EventPayload.RESPONSE) or payload.get(EventPayload.COMPLETION)
+        usage = getattr(response, "additional_kwargs", None) or {}
+        for kind in ("prompt", "completion"):
+            if usage.get(f"{kind}_tokens"):
+                LLM_TOKENS.inc(usage[f"{kind}_tokens"], kind=kind)
+
+    def start_trace(self, trace_id=None):
+        pass
+
+    def end_trace(self, trace_id=None, trace_map=None):
+        pass
+
+
+_llm = OpenAI(model="gpt-4", temperature=0, callback_manager=CallbackManager([_TokenUsage()]))
 _prompt = ChatPromptTemplate(
      message_templates=[
          ChatMessage(
@@ -48,7 +86,14 @@ _prompt = ChatPromptTemplate(
              content=(
                  "Your graph models every spreadsheet cell as a node labeled `entity` "
                      "and every formula dependency as `DEPENDS_ON`, where\n"
-                     "  (A)-[:DEPENDS_ON]->(B)  means  B depends on A.\n\n"
+                     "  (A)-[:DEPENDS_ON]->(B)  means  B depends on A.\n"
+                     "Ranges used in formulas (e.g. Sheet1!A1:A100) are single nodes labeled "
+                     "`range` with properties sheet, min_row, max_row, min_col, max_col (1-based); "
+                     "(R:range)-[:DEPENDS_ON]->(B) means B depends on every cell inside R.  "
+                     "A cell is inside R when it is on R.sheet within those bounds.\n"
+                     "A block of cells filled with one formula is a single node labeled `block` "
+                     "(same bound properties plus `formula`, written for its top-left cell); "
+                     "its member cells have no incoming DEPENDS_ON edges of their own.\n\n"
                      "When generating Cypher:\n"
                      " • Never use the internal id() function—always match on the `name` property.\n"
                      " • For read queries use  MATCH … RETURN.\n"
@@ -72,213 +117,423 @@ _program = OpenAIPydanticProgram.from_defaults(
 # ──────────────────────────────────────────────────────────────
 # 3) FastAPI setup
 # ──────────────────────────────────────────────────────────────
-app = FastAPI(title="Spreadsheet Brain API")
+def _warm_impacts():
+    """Precompute dependents of the hottest input cells for the new graph version."""
+    try:
+        backend().warm()
+    except Exception:
+        log.exception("Impact cache warm-up failed")
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    asyncio.get_running_loop().run_in_executor(None, _warm_impacts)
+    yield
+    # hand pooled Bolt connections back cleanly on shutdown
+    await close_async_driver()
+
+
+app = FastAPI(title="Spreadsheet Brain API", lifespan=_lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
 )
 
-# helper to get a neo4j Driver
 _settings = Settings()
-def _neo4j_driver():
-    return GraphDatabase.driver(
-        _settings.NEO4J_URI,
-        auth=(_settings.NEO4J_USER, _settings.NEO4J_PASSWORD),
-    )
+_translations = TranslationCache(_settings.CYPHER_CACHE_SIZE, _settings.CYPHER_CACHE_TTL,
+                                 _settings.CYPHER_CACHE_PATH)
+_schema = [None, ""]    # [graph version, fingerprint]
+_events = EventHub(_settings.EVENT_QUEUE_SIZE, _settings.EVENT_BACKLOG)
+
+# read at scrape time, so they are never stale
+Gauge("sse_clients", "Connected /events clients.", fn=lambda: {(): _events.stats()["clients"]})
+Gauge("sse_queued_events", "Events waiting in client queues, in all and in the fullest one.", ("queue",),
+      fn=lambda: {("all",): _events.stats()["queued"], ("max",): _events.stats()["max_queue"]})
+Gauge("sse_dropped_clients", "Clients sent a resync for falling behind.",
+      fn=lambda: {(): _events.dropped})
+Gauge("impact_cache", "Memoised dependents: entries, bytes, hits and misses.", ("field",),
+      fn=lambda: {(k,): v for k, v in backend().impact.stats().items() if k != "version"})
+
+
+async def _schema_fingerprint() -> str:
+    """
+    Digest of everything a translation depends on: model, prompt, and the
+    graph's labels / relationship types (re-read once per graph version).
+    """
+    version = backend().impact.version
+    if _schema[0] != version:
+        labels = await backend().alabels()
+        text = json.dumps([_llm.model, [m.content for m in _prompt.message_templates],
+                           sorted(labels["nodeLabels"]), sorted(labels["relTypes"])])
+        _schema[:] = [version, hashlib.blake2b(text.encode(), digest_size=8).hexdigest()]
+    return _schema[1]
+
+
+@app.get("/health", response_class=JSONResponse)
+async def health():
+    """Liveness of the pooled Neo4j connection."""
+    caches = {"impact_cache": backend().impact.stats(), "cypher_cache": _translations.stats(),
+              "events": _events.stats()}
+    if backend().name != "neo4j":
+        return {backend().name: "ok", **caches}
+    try:
+        await async_driver().verify_connectivity()
+    except Exception as e:
+        raise HTTPException(503, detail=f"Neo4j unavailable: {e}")
+    return {"neo4j": "ok", **caches}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Counters, gauges and stage timings in the Prometheus text format (src/metrics.py)."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/labels", response_class=JSONResponse)
-def labels():
+async def labels():
     """
     Return current node‐labels & relationship‐types for the viewer legend.
     """
-    CYPHER = """
-      MATCH (n) RETURN DISTINCT labels(n) AS labs
-      UNION
-      MATCH ()-[r]->() RETURN DISTINCT type(r) AS labs
-    """
-    nodes, rels = set(), set()
-    drv = _neo4j_driver()
-    with drv.session(database=_settings.NEO4J_DATABASE) as ses:
-        for rec in ses.run(CYPHER):
-            v = rec["labs"]
-            if isinstance(v, list):
-                nodes.update(v)
-            else:
-                rels.add(v)
-    return {"nodeLabels": sorted(nodes), "relTypes": sorted(rels)}
+    return await backend().alabels()
 
 
-@app.post("/run")
-def run_cypher(cmd: Instruction):
-    """
-    Single “run” endpoint that:
-      • NL → Cypher (via our Pydantic program)
-      • auto‐detect read vs write
-      • execute against Neo4j
-      • return { cypher, rows } for reads or { cypher, status } for writes
-    """
-    # 1) Generate Cypher
+# ──────────────────────────────────────────────────────────────
+# /run pipeline.  LLM calls are bounded by a semaphore (waiters queue up to
+# LLM_QUEUE_TIMEOUT, then get 503), and identical instructions in flight at
+# the same time share one pipeline run: one LLM call, one query.
+# ──────────────────────────────────────────────────────────────
+_llm_slots = asyncio.Semaphore(_settings.LLM_MAX_INFLIGHT)
+_inflight: dict[str, asyncio.Task] = {}
+
+
+async def _translate(instruction: str) -> str:
+    try:
+        await asyncio.wait_for(_llm_slots.acquire(), _settings.LLM_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        LLM_REQUESTS.inc(outcome="busy")
+        raise HTTPException(503, detail="Too many questions in flight, try again shortly")
     try:
-        out: CypherQuery = _program(instruction=cmd.instruction)
+        with stage("llm"):
+            out: CypherQuery = await asyncio.wait_for(
+                _program.acall(instruction=instruction), _settings.LLM_TIMEOUT)
+    except asyncio.TimeoutError:
+        LLM_REQUESTS.inc(outcome="timeout")
+        raise HTTPException(504, detail=f"LLM timed out after {_settings.LLM_TIMEOUT:g}s")
     except Exception as e:
+        LLM_REQUESTS.inc(outcome="error")
         raise HTTPException(400, detail=f"LLM error: {e}")
+    finally:
+        _llm_slots.release()
+    LLM_REQUESTS.inc(outcome="ok")
+    return out.cypher.strip()
 
-    cy = out.cypher.strip()
-    if not cy:
-        raise HTTPException(400, detail="LLM returned empty Cypher")
 
+def _is_read(cy: str) -> bool:
     upper = cy.upper()
-    is_read = (
+    return (
         not any(w in upper for w in (" SET ", " CREATE ", " MERGE ", " DELETE "))
         and upper.split(None, 1)[0] in {"MATCH", "OPTIONAL", "UNWIND", "CALL", "WITH", "RETURN"}
     )
-    # 2) Execute
-    drv = _neo4j_driver()
-    with drv.session(database=_settings.NEO4J_DATABASE) as ses:
+
+
+def _session():
+    return async_driver().session(database=_settings.NEO4J_DATABASE,
+                                  fetch_size=_settings.RUN_FETCH_SIZE)
+
+
+async def _plan(instruction: str, schema: str) -> tuple[str, dict, bool]:
+    """(cypher, params, cached?) for the instruction: a cached translation, or a fresh one."""
+    cached = _translations.get(schema, instruction)
+    RUNS.inc(route="cache" if cached else "llm")
+    cy, params = cached or (await _translate(instruction), {})
+    if not cy:
+        raise HTTPException(400, detail="LLM returned empty Cypher")
+    return cy, params, bool(cached)
+
+
+async def _guard(cy: str, params: dict, read: bool) -> tuple[str, list[str]]:
+    """
+    The query with its traversals and rows bounded, and its columns, once
+    EXPLAIN finds it affordable.
+    """
+    try:
+        cy = bound(cy, read)
+        async with _session() as ses:
+            with stage("guard"):
+                columns = await acheck(ses, cy, params)
+    except QueryRejected as e:
+        CYPHER_REJECTED.inc()
+        raise HTTPException(422, detail=f"Query rejected: {e}")
+    except Exception as e:
+        raise HTTPException(400, detail=f"Cypher failed: {e}")
+    return cy, columns
+
+
+def _paged(cy: str, columns: list[str], params: dict) -> tuple[str, tuple[int, int]]:
+    """The read rewritten to page on the server, and the window (first, end) of rows it may return."""
+    try:
+        text, skip, limit = paged(cy, columns, params)
+    except QueryRejected as e:
+        CYPHER_REJECTED.inc()
+        raise HTTPException(422, detail=f"Query rejected: {e}")
+    # one row past the cap, like bound(), so a cut result still shows as truncated
+    span = _settings.RUN_MAX_ROWS + 1
+    return text, (skip, skip + (span if limit is None else min(limit, span)))
+
+
+async def _read_page(cy: str, params: dict, offset: int, window: tuple[int, int],
+                     limit: int | None) -> dict:
+    """
+    One page of a paged read, starting at row `offset` of `window`; Neo4j
+    skips to it and sends at most one row past the page.  `cursor` is None
+    on the last.
+    """
+    first, end = window
+    stop = first + _settings.RUN_MAX_ROWS
+    limit = max(min(limit or _settings.RUN_PAGE_ROWS, stop - offset), 0)
+    fetch = min(limit + 1, end - offset)
+    async with _session() as ses:
         try:
-            result = ses.run(cy)
+            with stage("cypher"):
+                result = await ses.run(query(cy), {**params, "_skip": offset, "_limit": fetch})
+                rows, more = await read_page(result, limit)
         except Exception as e:
             raise HTTPException(400, detail=f"Cypher failed: {e}")
+    CYPHER_ROWS.inc(len(rows))
+    reached = offset + len(rows)
+    capped = more and reached >= stop
+    cursor = (encode_cursor(cy, params, reached, window, backend().impact.version)
+              if more and not capped else None)
+    return {"cypher": cy, "rows": rows, "cursor": cursor, "truncated": capped}
+
+
+async def _run_pipeline(instruction: str, schema: str, key: str, limit: int | None) -> dict:
+    # 1) Generate Cypher, or reuse a cached translation of the same question
+    cy, params, cached = await _shared(f"plan {key}", lambda: _plan(instruction, schema))
+    extra = {"params": params, "cached": cached}
+    read = _is_read(cy)
+    cy, columns = await _guard(cy, params, read)
+
+    # 2) Execute: a read comes back one page at a time, cut out by the server
+    if read:
+        text, window = _paged(cy, columns, params)
+        page = await _read_page(text, params, window[0], window, limit)
+        if not cached:
+            _translations.put(schema, instruction, cy)
+        return {**page, **extra}
+    return await _write(cy, instruction, schema, extra)
+
+
+async def _write(cy: str, instruction: str, schema: str, extra: dict) -> dict:
+    async with _session() as ses:
+        try:
+            with stage("cypher", write=True):
+                await (await ses.run(query(cy), extra["params"])).consume()
+        except Exception as e:
+            raise HTTPException(400, detail=f"Cypher failed: {e}")
+    # only translations that ran are worth remembering
+    if not extra["cached"]:
+        _translations.put(schema, instruction, cy)
+    backend().refresh()
+    asyncio.get_running_loop().run_in_executor(None, _warm_impacts)
+    # free-form Cypher can touch anything: viewers re-fetch their view
+    _publish("resync", {"reason": "cypher write"})
+    return {"cypher": cy, "status": "✅ write applied", **extra}
+
+
+async def _stream(instruction: str, schema: str, key: str):
+    """Every row of a read as NDJSON, up to RUN_MAX_ROWS; a write runs as usual."""
+    cy, params, cached = await _shared(f"plan {key}", lambda: _plan(instruction, schema))
+    read = _is_read(cy)
+    cy, _ = await _guard(cy, params, read)
+    if not read:
+        return await _write(cy, instruction, schema, {"params": params, "cached": cached})
+    ses = _session()
+    try:
+        result = await ses.run(query(cy), params)
+    except Exception as e:
+        await ses.close()
+        raise HTTPException(400, detail=f"Cypher failed: {e}")
+    if not cached:
+        _translations.put(schema, instruction, cy)
+    head = {"cypher": cy, "params": params, "cached": cached, "columns": list(result.keys())}
+
+    async def lines():
+        # the session lives as long as the response, which pulls from it row by row
+        try:
+            with stage("cypher_stream"):
+                async for line in ndjson(result, head, _settings.RUN_MAX_ROWS):
+                    yield line
+        finally:
+            await ses.close()
 
-        if is_read:
-            rows = [list(rec.values()) for rec in result]
-            response = {"cypher": cy, "rows": rows}
-            print('response', response)
-            return response 
-        else:
-            print(f"📣 Broadcasting reload to {len(update_listeners)} listener(s)")
-            for q in update_listeners:
-                try:
-                    q.put_nowait("reload")
-                except Exception as e:
-                    print("❌ Failed to notify a listener:", e)
-            return {"cypher": cy, "status": "✅ write applied"}
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _publish(kind: str, data: dict):
+    data = {"version": backend().impact.version, **data}
+    if kind == "delta" and delta_size(data) > _settings.EVENT_MAX_DELTA:
+        kind, data = "resync", {"version": data["version"], "reason": "large change"}
+    print(f"📣 Emitting {kind} #{_events.seq + 1} to {_events.stats()['clients']} listener(s)")
+    _events.publish(kind, data)
+    EVENTS.inc(kind=kind)
+
+
+def _forget(key: str, task: asyncio.Task):
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()    # mark retrieved even if every caller went away
+
+
+def _shared(key: str, make):
+    """The in-flight run of `key`, started from `make()` if there is none."""
+    task = _inflight.get(key)
+    if task is not None:
+        RUNS.inc(route="joined")
+    else:
+        # the run belongs to no single caller: one disconnecting doesn't cancel it for the rest
+        task = _inflight[key] = asyncio.ensure_future(make())
+        task.add_done_callback(lambda t: _forget(key, t))
+    return asyncio.shield(task)
+
+
+@app.post("/run")
+async def run_cypher(cmd: Instruction):
+    """
+    Single “run” endpoint that:
+      • answers common questions from the graph directly (src/intents.py)
+      • otherwise NL → Cypher (via our Pydantic program)
+      • auto‐detect read vs write
+      • execute against Neo4j
+      • return { cypher, rows, cursor } for reads or { cypher, status } for writes
+
+    Reads come back `limit` rows at a time; send the returned `cursor` back
+    for the next page.  With `stream`, a read's rows are sent as NDJSON.
+    """
+    if cmd.cursor:
+        if backend().name != "neo4j":
+            raise HTTPException(400, detail="cursors page free-form Cypher and need GRAPH_BACKEND=neo4j")
+        try:
+            cy, params, offset, window = decode_cursor(cmd.cursor, backend().impact.version)
+        except StaleCursor as e:
+            raise HTTPException(409, detail=str(e))
+        except CursorError as e:
+            raise HTTPException(400, detail=str(e))
+        RUNS.inc(route="page")
+        return await _read_page(cy, params, offset, window, cmd.limit)
+    if not cmd.instruction.strip():
+        raise HTTPException(422, detail="send an instruction or a cursor")
+
+    # backend walks are blocking, so they run off the event loop
+    try:
+        with stage("intent"):
+            routed = await asyncio.get_running_loop().run_in_executor(None, answer_intent, cmd.instruction)
+    except AddressError as e:
+        raise HTTPException(400, detail=str(e))
+    if routed is not None:
+        RUNS.inc(route="intent")
+        if routed["write"]:
+            # colours don't change dependencies: no refresh, just recolour viewers
+            _publish("delta", {"recolored": [{"id": n, "color": routed["color"]} for n in routed["cells"]]})
+            routed["status"] = f"✅ {routed['answer']}"
+        return routed
+
+    if backend().name != "neo4j":
+        raise HTTPException(400, detail="free-form /run executes Cypher and needs GRAPH_BACKEND=neo4j")
+
+    schema = await _schema_fingerprint()
+    key = _translations.keys(schema, cmd.instruction)[1]
+    if cmd.stream:
+        return await _stream(cmd.instruction, schema, key)
+    return await _shared(f"{key} {cmd.limit}",
+                         lambda: _run_pipeline(cmd.instruction, schema, key, cmd.limit))
 
 
 @app.get("/events")
-async def events():
+async def events(last_event_id: str | None = Header(None)):
+    """
+    SSE stream of `delta` / `resync` events (src/events.py).  A reconnecting
+    EventSource sends Last-Event-ID and gets what it missed.
+    """
+    q = _events.subscribe(last_event_id)
+    print("👂  New SSE client connected… currently", _events.stats()["clients"], "listeners")
+
     async def event_stream():
-        print("👂  New SSE client connecting… currently", len(update_listeners), "listeners")
-        q = asyncio.Queue()
-        update_listeners.append(q)
         try:
+            yield "retry: 3000\n\n"
             while True:
-                msg = await q.get()
-                yield f"data: {msg}\n\n"
+                try:
+                    yield await asyncio.wait_for(q.get(), _settings.EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
         except asyncio.CancelledError:
             pass
         finally:
-            update_listeners.remove(q)
+            _events.unsubscribe(q)
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
+
+def _sync_delta(change: dict) -> dict:
+    """Refresh after the watcher's sync and describe it as a delta, with full added nodes."""
+    backend().refresh()
+    added = change.get("added_nodes", [])
+    if len(added) > _settings.EVENT_MAX_DELTA:
+        return change       # goes out as resync anyway
+    return {**change, "added_nodes": backend().nodes(added)}
+
+
 @app.post("/notify_update")
-def notify_update():
-    print("📣 Emitting reload to", len(update_listeners), "listeners")
-    for q in update_listeners:
-        q.put_nowait("reload")
+async def notify_update(change: dict | None = Body(None)):
+    """
+    Called by the watcher after a sync.  `change` is the applied diff
+    (added/removed node ids and edges); it goes out as a `delta` event, or
+    as `resync` when no diff was given.
+    """
+    loop = asyncio.get_running_loop()
+    if change:
+        _publish("delta", await loop.run_in_executor(None, _sync_delta, change))
+    else:
+        await loop.run_in_executor(None, backend().refresh)
+        _publish("resync", {"reason": "notify"})
+    loop.run_in_executor(None, _warm_impacts)
     return {"ok": True}
 
-@app.get("/graph", response_class=HTMLResponse)
-def graph_view():
-    # ─── Build the graph from Neo4j ──────────────────────────────────────────
-    NODE_CYPHER = "MATCH (n:entity) RETURN n.name AS id, n.color AS color"
-    EDGE_CYPHER = "MATCH (a:entity)-[:DEPENDS_ON]->(b:entity) RETURN a.name AS source, b.name AS target"
-
-    G = nx.DiGraph()
-    drv = _neo4j_driver()
-    with drv.session(database=_settings.NEO4J_DATABASE) as ses:
-        for rec in ses.run(NODE_CYPHER):
-            nid, col = rec["id"], rec["color"]
-            G.add_node(nid, title=nid, label=nid, color=col or "#97c2fc")
-        for rec in ses.run(EDGE_CYPHER):
-            G.add_edge(rec["source"], rec["target"])
-
-    # ─── Generate the PyVis HTML ────────────────────────────────────────────
-    net = Network(height="750px", width="100%", directed=True, notebook=False)
-    net.from_nx(G)
-    for n in net.nodes:
-        n["size"] = 20
-    html = net.generate_html()
-
-    # ─── Swap out broken /lib/… for CDN assets ───────────────────────────────
-    html = (
-      html
-      .replace(
-        '<link rel="stylesheet" href="/lib/vis-network.min.css">',
-        '<link rel="stylesheet" '
-        'href="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/vis-network.min.css">'
-      )
-      .replace(
-        '<script src="/lib/vis-network.min.js"></script>',
-        '<script '
-        'src="https://cdnjs.cloudflare.com/ajax/libs/vis-network/9.1.2/vis-network.min.js">'
-        '</script>'
-      )
-      .replace('src="/lib/bindings/utils.js"', '')
-      .replace('src="lib/bindings/utils.js"', '')
-    )
 
-    # ─── Inject the toolbar + dynamic‐highlighting JS ────────────────────────
-    tool_ui = """
-      <div style="padding:8px; background:#fafafa; border-bottom:1px solid #ddd;">
-        <input id="query" placeholder="Enter question or update…"
-               style="width:60%;padding:6px;font-size:14px" />
-        <button id="runBtn" style="padding:6px 12px;font-size:14px">Run</button>
-        <span id="status" style="margin-left:8px;color:#555"></span>
-      </div>
-      <script>
-        // Capture the PyVis network instance
-        let pyvisNetwork;
-        const prevOnload = window.onload || (()=>{});
-        window.onload = () => {
-          prevOnload();
-          pyvisNetwork = network;  // 'network' is the global from PyVis
-        };
-
-        // Remember what we highlighted last
-        let lastHighlights = [];
-
-        document.getElementById("runBtn").onclick = async () => {
-          const q = document.getElementById("query").value.trim();
-          if (!q) return;
-          document.getElementById("status").textContent = "⏳ running…";
-          const res = await fetch("/run", {
-            method: "POST",
-            headers: {"Content-Type":"application/json"},
-            body: JSON.stringify({instruction: q})
-          });
-          const j = await res.json();
-
-          if (j.rows) {
-            // Clear old highlights
-            lastHighlights.forEach(id => {
-              pyvisNetwork.body.data.nodes.update({ id, color: undefined });
-            });
-            // Highlight new results in yellow
-            const hits = j.rows.flat();
-            hits.forEach(id => {
-              pyvisNetwork.body.data.nodes.update({
-                id,
-                color: { background: "#ffff00" }
-              });
-            });
-            lastHighlights = hits;
-            document.getElementById("status").textContent = "✅ highlighted";
-          } else {
-            // It's a write: rely on SSE to reload the page
-            document.getElementById("status").textContent = j.status || "✅ done";
-          }
-        };
-
-        // SSE listener for external or write-triggered reloads
-        const es = new EventSource("/events");
-        es.onmessage = () => window.location.reload();
-      </script>
+@app.get("/subgraph", response_class=JSONResponse)
+async def subgraph(center: str | None = None,
+                   hops: int = Query(2, ge=0),
+                   sheet: str | None = None,
+                   limit: int = Query(None, ge=1),
+                   cursor: str | None = None):
     """
+    One page of the graph for the viewer (src/viewport.py): the
+    neighbourhood of `center` out to `hops`, or the whole graph in name
+    order; either optionally restricted to `sheet`.  Pass the returned
+    `cursor` back for the next page; 409 means the graph changed and the
+    neighbourhood should be reloaded from the start.
+    """
+    s = _settings
+    limit = min(limit or s.VIEW_PAGE_NODES, s.VIEW_MAX_NODES)
+    if center:
+        job = lambda: neighbourhood_page(backend(), center, min(hops, s.VIEW_MAX_HOPS), sheet, cursor,
+                                         limit, s.VIEW_PAGE_EDGES, s.VIEW_MAX_NODES, s.VIEW_FANOUT)
+    else:
+        job = lambda: graph_page(backend(), sheet, cursor, limit, s.VIEW_PAGE_EDGES, s.VIEW_FANOUT)
+    try:
+        # backend reads are blocking, so they run off the event loop
+        with stage("subgraph"):
+            return await asyncio.get_running_loop().run_in_executor(None, job)
+    except StaleCursor as e:
+        raise HTTPException(409, detail=str(e))
+    except CursorError as e:
+        raise HTTPException(400, detail=str(e))
+
 
-    # Splice the toolbar into the HTML just after <body>
-    html = html.replace("<body>", "<body>" + tool_ui)
+_VIEWER = Path(__file__).with_name("static") / "graph.html"
 
-    return HTMLResponse(html)
\ No newline at end of file
+
+@app.get("/graph", response_class=HTMLResponse)
+async def graph_view():
+    """The viewer shell; it pages the graph in from /subgraph."""
+    return HTMLResponse(_VIEWER.read_text(encoding="utf-8"))
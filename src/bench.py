@@ -0,0 +1,246 @@
+# src/bench.py
+"""
+Reproducible benchmarks for the ingest → store → query pipeline.
+
+`generate` writes a synthetic workbook shaped by a `WorkbookSpec` (sheet
+and cell counts, formula density, SUM window widths, cross-sheet refs,
+formula chain depth), deterministic for a given seed.  `run` times each
+stage against it — formula parsing, `build_nx_graph` with and without
+the sheet cache, the bulk load, impact / precedent / path queries — on
+the in-memory backend (and, if asked, a real Neo4j), optionally with the
+peak traced allocation of one extra run, and returns a JSON-ready dict.
+`compare` lines two such results up, so a commit's numbers can be checked
+against its parent's:
+
+    python -m src.cli bench --out head.json --compare base.json
+"""
+
+import json, platform, random, shutil, statistics, subprocess, tempfile, time, tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from . import parser
+from .ingest import build_nx_graph
+from .memory_store import MemoryBackend
+from .parse_cache import SheetCache
+
+
+@dataclass(frozen=True)
+class WorkbookSpec:
+    sheets: int = 4
+    cells: int = 100_000        # in all, inputs included
+    cols: int = 10              # per sheet; rows follow from `cells`
+    formula_ratio: float = 0.6  # share of columns (after A) filled with a formula
+    range_width: int = 10       # rows in each windowed SUM; 0 = no range refs
+    range_ratio: float = 0.3    # share of formula columns that also SUM a window
+    cross_sheet: float = 0.2    # share of formula columns that also read an earlier sheet
+    chain_depth: int = 4        # longest formula → formula chain along a row
+    scatter: float = 0.05       # share of formula cells with a one-off constant (breaks blocks)
+    seed: int = 0
+
+    @property
+    def rows(self) -> int:
+        return max(1, self.cells // (self.sheets * self.cols))
+
+
+def _sheet(i: int) -> str:
+    return f"Sheet{i + 1}"
+
+
+def _plan(spec: WorkbookSpec, rng: random.Random):
+    """Per sheet, per column: None for inputs, else (left, window, cross) refs of its formula."""
+    depth, plans = {}, []
+    for s in range(spec.sheets):
+        plan = [None]
+        depth[s, 1] = 0                       # column A is always inputs
+        for c in range(2, spec.cols + 1):
+            if rng.random() >= spec.formula_ratio:
+                plan.append(None)
+                depth[s, c] = 0
+                continue
+            # extend the deepest chain to the left that still has room
+            left = max((k for k in range(1, c) if depth[s, k] < spec.chain_depth),
+                       key=lambda k: (depth[s, k], k))
+            d = depth[s, left] + 1
+            inputs = [k for k in range(1, c) if depth[s, k] == 0]
+            window = (rng.choice(inputs) if spec.range_width and rng.random() < spec.range_ratio
+                      else None)
+            cross = None
+            if s and rng.random() < spec.cross_sheet:
+                s2 = rng.randrange(s)
+                k2 = rng.choice([k for k in range(1, spec.cols + 1) if depth[s2, k] < spec.chain_depth])
+                cross, d = (s2, k2), max(d, depth[s2, k2] + 1)
+            plan.append((left, window, cross))
+            depth[s, c] = d
+        plans.append(plan)
+    return plans
+
+
+def generate(spec: WorkbookSpec, path: str):
+    """Write the workbook; returns (stats, [(formula, row, col, sheet)…])."""
+    rng = random.Random(spec.seed)
+    plans = _plan(spec, rng)
+    letters = [None] + [get_column_letter(c) for c in range(1, spec.cols + 1)]
+    wb = Workbook(write_only=True)
+    formulas = []
+    for s, plan in enumerate(plans):
+        ws = wb.create_sheet(_sheet(s))
+        for r in range(1, spec.rows + 1):
+            row = []
+            for c, refs in enumerate(plan, start=1):
+                if refs is None:
+                    row.append(round(rng.random() * 100, 2))
+                    continue
+                left, window, cross = refs
+                f = f"={letters[left]}{r}*2"
+                if window:
+                    f += f"+SUM({letters[window]}{r}:{letters[window]}{r + spec.range_width - 1})"
+                if cross:
+                    f += f"+{_sheet(cross[0])}!{letters[cross[1]]}{r}"
+                if rng.random() < spec.scatter:
+                    f += f"+{r}"
+                row.append(f)
+                formulas.append((f, r, c, _sheet(s)))
+            ws.append(row)
+    wb.save(path)
+    stats = {"rows": spec.rows, "cells": spec.rows * spec.cols * spec.sheets,
+             "formulas": len(formulas), "bytes": Path(path).stat().st_size}
+    return stats, formulas
+
+
+# ── measuring ─────────────────────────────────────────────────────────────────
+def _measure(fn, repeat: int, memory: bool) -> tuple[dict, object]:
+    """Best / median wall time of `repeat` calls, plus peak traced MB of one more."""
+    times, out = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    res = {"seconds": min(times), "median": statistics.median(times), "runs": repeat}
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            res["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        finally:
+            tracemalloc.stop()
+    return res, out
+
+
+def _clear_parse_caches():
+    parser._plain_dependencies.cache_clear()
+    parser._TEMPLATES.clear()
+
+
+def _commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, timeout=5, cwd=Path(__file__).parent)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run(spec: WorkbookSpec, repeat: int = 3, queries: int = 20, memory: bool = True,
+        neo4j: bool = False) -> dict:
+    """
+    Benchmark every stage on a workbook generated from `spec`.  With
+    `neo4j`, `upsert_graph` is timed too — against the configured
+    database, which it wipes.
+    """
+    tmp = Path(tempfile.mkdtemp(prefix="bench-"))
+    stages = {}
+    try:
+        path = str(tmp / "bench.xlsx")
+        t0 = time.perf_counter()
+        book, formulas = generate(spec, path)
+        stages["generate"] = {"seconds": time.perf_counter() - t0, "runs": 1}
+
+        def plain():
+            _clear_parse_caches()
+            for f, *_ in formulas:
+                parser.extract_dependencies(f)
+
+        def templated():
+            _clear_parse_caches()
+            for f, r, c, _ in formulas:
+                parser.extract_dependencies(f, r, c)
+
+        for name, fn in (("extract_dependencies", plain), ("extract_dependencies_templated", templated)):
+            stages[name], _ = _measure(fn, repeat, memory)
+            stages[name]["us_per_formula"] = round(stages[name]["seconds"] / max(len(formulas), 1) * 1e6, 2)
+
+        def build():
+            _clear_parse_caches()
+            return build_nx_graph(path)
+
+        stages["build_nx_graph"], G = _measure(build, repeat, memory)
+        stages["build_nx_graph"].update(nodes=G.number_of_nodes(), edges=G.number_of_edges())
+
+        cold = iter(range(repeat + 1))
+        stages["build_cache_cold"], _ = _measure(
+            lambda: build_nx_graph(path, cache=SheetCache(str(tmp / f"cache{next(cold)}"), 1024)),
+            repeat, memory)
+        warm = SheetCache(str(tmp / "cache0"), 1024)
+        stages["build_cache_warm"], _ = _measure(lambda: build_nx_graph(path, cache=warm), repeat, memory)
+
+        store = MemoryBackend(str(tmp / "snapshot.pkl.gz"))
+        stages["load_memory"], _ = _measure(lambda: store.load(G, fresh=True), repeat, memory)
+        if neo4j:
+            from .graph_store import clear_db, upsert_graph
+
+            def upsert():
+                clear_db()
+                return upsert_graph(G, fresh=True)
+            stages["upsert_neo4j"], _ = _measure(upsert, repeat, False)
+
+        # impact queries from inputs spread over every sheet
+        rng = random.Random(spec.seed)
+        sources = [f"{_sheet(rng.randrange(spec.sheets))}!A{rng.randint(1, spec.rows)}"
+                   for _ in range(queries)]
+        sinks = [f"{s}!{get_column_letter(c)}{r}"
+                 for _, r, c, s in rng.sample(formulas, min(queries, len(formulas)))]
+
+        def impact_cold():
+            store.impact.invalidate()
+            return sum(len(store.dependents(s)) for s in sources)
+
+        stages["dependents_cold"], reached = _measure(impact_cold, repeat, memory)
+        stages["dependents_cold"].update(queries=len(sources), cells_reached=reached)
+        stages["dependents_warm"], _ = _measure(
+            lambda: [store.dependents(s) for s in sources], repeat, memory)
+        stages["precedents"], _ = _measure(lambda: [store.precedents(s) for s in sinks], repeat, memory)
+        stages["dependency_path"], _ = _measure(
+            lambda: [store.dependency_path(a, b) for a, b in zip(sources, sinks)], repeat, memory)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        "meta": {"commit": _commit(), "python": platform.python_version(),
+                 "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S%z")},
+        "spec": asdict(spec), "workbook": book, "stages": stages,
+    }
+
+
+def compare(base: dict, head: dict, tolerance: float = 0.2) -> list[dict]:
+    """
+    Per timed stage both best times and head/base; `regressed` when slower
+    by more than `tolerance`.  One-off setup (generating the workbook) is
+    left out.
+    """
+    rows = []
+    for name, h in head["stages"].items():
+        b = base["stages"].get(name)
+        if b is None or "median" not in h:
+            continue
+        ratio = h["seconds"] / b["seconds"] if b["seconds"] else float("inf")
+        rows.append({"stage": name, "base": b["seconds"], "head": h["seconds"],
+                     "ratio": round(ratio, 3), "regressed": ratio > 1 + tolerance})
+    return rows
+
+
+def save(result: dict, path: str):
+    Path(path).write_text(json.dumps(result, indent=2))
@@ -1,6 +1,8 @@
-import typer, pathlib, json
-from .ingest import build_nx_graph
-from .graph_store import clear_db, upsert_graph
+import typer, pathlib, json, logging
+from .ingest import AddressError, build_nx_graph
+from .parse_cache import sheet_cache
+from .graph_store import backend
+from .recalc import RecalcEngine
 from .sync_watch import main as watch_main
 from .api import app as fastapi_app
 import uvicorn
@@ -9,24 +11,92 @@ cli = typer.Typer(help="🧠 Spreadsheet-Brain CLI")
 
 
 @cli.command()
-def load(xlsx: str):
-    """One-shot: parse spreadsheet & push to Neo4j."""
-    g = build_nx_graph(xlsx)
-    clear_db(); upsert_graph(g)
-    typer.echo("✅  Graph loaded")
+def load(xlsx: str, streaming: bool = True, blocks: bool = True, cache: bool = True):
+    """One-shot: parse spreadsheet & push to the graph backend."""
+    sheets = sheet_cache() if cache else None
+    g = build_nx_graph(xlsx, streaming=streaming, blocks=blocks, cache=sheets)
+    if sheets and sheets.stats["hits"]:
+        typer.echo(f"♻️  {sheets.stats['hits']} of {sum(sheets.stats.values())} sheets unchanged, read from the cache")
+    stats = backend().load(g, fresh=True)
+    secs = sum(stats["seconds"].values())
+    typer.echo(f"✅  Graph loaded: {stats['cells']:,} cells, {stats['ranges']:,} ranges, "
+               f"{stats['blocks']:,} formula blocks, "
+               f"{stats['edges']:,} edges in {secs:.1f}s")
 
 
 @cli.command()
 def impact(cell: str):
-    """Print all dependents of CELL using Cypher."""
-    from .api import impact
-    print(json.dumps(impact({"cell": cell}), indent=2))
+    """Print all dependents of CELL."""
+    try:
+        deps = backend().dependents(cell)
+    except AddressError as e:
+        raise typer.BadParameter(str(e), param_hint="CELL")
+    print(json.dumps({"cell": cell, "dependents": deps}, indent=2))
+
+
+def _literal(text: str):
+    """CLI value: number, TRUE/FALSE, or text."""
+    if text.upper() in ("TRUE", "FALSE"):
+        return text.upper() == "TRUE"
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+@cli.command()
+def whatif(xlsx: str,
+           inputs: list[str] = typer.Option(..., "--set", help='Input override, e.g. "Inputs!B2=10"'),
+           targets: list[str] = typer.Option(..., "--target", help='Cell to report, e.g. "Summary!F9"')):
+    """Recalculate TARGETs as if the --set inputs had changed (the file is not modified)."""
+    eng = RecalcEngine.from_workbook(xlsx)
+    changes = {cell: _literal(v) for cell, v in (i.rsplit("=", 1) for i in inputs)}
+    result = eng.what_if(changes, targets)
+    result["before"] = {t: eng.get(t) for t in targets}
+    result["engine"] = eng.stats
+    result["stale"] = eng.stale
+    print(json.dumps(result, indent=2, default=str))
+
+
+@cli.command()
+def watch(target: str):
+    """Watch a workbook, a directory of them or a glob ("share/**/*.xlsx") and auto-sync the graph."""
+    # the watcher reports from its worker thread through logging
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)-7s %(message)s")
+    watch_main(target)
 
 
 @cli.command()
-def watch(xlsx: str):
-    """Watch XLSX and auto-sync to Neo4j."""
-    watch_main(xlsx)
+def bench(out: str = "bench.json",
+          compare: str = typer.Option(None, help="Earlier results to compare against"),
+          sheets: int = 4, cells: int = 100_000, cols: int = 10, formula_ratio: float = 0.6,
+          range_width: int = 10, range_ratio: float = 0.3, cross_sheet: float = 0.2,
+          chain_depth: int = 4, scatter: float = 0.05, seed: int = 0,
+          repeat: int = 3, queries: int = 20, memory: bool = True,
+          neo4j: bool = typer.Option(False, help="Also time upsert_graph (wipes the configured database)"),
+          tolerance: float = 0.2):
+    """Benchmark parse / ingest / load / query on a synthetic workbook; results as JSON."""
+    from . import bench as bm
+    spec = bm.WorkbookSpec(sheets, cells, cols, formula_ratio, range_width, range_ratio,
+                           cross_sheet, chain_depth, scatter, seed)
+    result = bm.run(spec, repeat=repeat, queries=queries, memory=memory, neo4j=neo4j)
+    bm.save(result, out)
+    wb = result["workbook"]
+    typer.echo(f"📊  {wb['cells']:,} cells, {wb['formulas']:,} formulas → {out}")
+    for name, st in result["stages"].items():
+        peak = f"  peak {st['peak_mb']:,.1f} MB" if "peak_mb" in st else ""
+        typer.echo(f"   {name:<32}{st['seconds'] * 1000:>10.1f} ms{peak}")
+    if compare:
+        base = json.loads(pathlib.Path(compare).read_text())
+        if base["spec"] != result["spec"]:
+            typer.echo("⚠️  Different workbook specs – ratios are not like for like")
+        rows = bm.compare(base, result, tolerance)
+        for r in rows:
+            mark = "❌" if r["regressed"] else "✅"
+            typer.echo(f"{mark}  {r['stage']:<32}{r['ratio']:>7.2f}×  "
+                       f"({r['base'] * 1000:.1f} → {r['head'] * 1000:.1f} ms)")
+        if any(r["regressed"] for r in rows):
+            raise typer.Exit(1)
 
 
 @cli.command()
@@ -0,0 +1,80 @@
+# src/compact.py
+"""
+Compact, integer-encoded adjacency of the dependency graph.
+
+Every node name is interned once to an int id; edges are CSR arrays in both
+directions (forward = dependents, reverse = precedents), so a walk hop over
+a whole frontier is one dict lookup per name plus a few NumPy gathers,
+instead of a NetworkX adjacency dict per node.  The in-memory backend walks
+over this; node attributes stay on the NetworkX graph.
+
+    cg = CompactGraph.from_nx(build_nx_graph(path))
+    cg.successors(["Sheet1!A2", "Sheet1!A1:A9"]);  cg.to_nx()
+"""
+
+import numpy as np
+import networkx as nx
+
+
+def _csr(n, src, dst):
+    """CSR (indptr, indices) of the edges src → dst over n nodes."""
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32)
+
+
+def _gather(indptr, indices, nodes):
+    """Concatenated neighbour lists of `nodes`, without a Python loop."""
+    starts, ends = indptr[nodes], indptr[nodes + 1]
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=indices.dtype)
+    # position i of the output reads indices[starts[k] + (i - first_i_of_k)]
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return indices[offsets + np.arange(total)]
+
+
+class CompactGraph:
+    def __init__(self, names, fwd, rev):
+        self.names = np.array(names, dtype=object)     # id -> name
+        self.ids = {n: i for i, n in enumerate(names)}  # name -> id
+        self.fwd_indptr, self.fwd_indices = fwd         # dependents
+        self.rev_indptr, self.rev_indices = rev         # precedents
+
+    @classmethod
+    def from_nx(cls, G):
+        names = list(G)
+        ids = {n: i for i, n in enumerate(names)}
+        m = G.number_of_edges()
+        src = np.fromiter((ids[s] for s, _ in G.edges), dtype=np.int64, count=m)
+        dst = np.fromiter((ids[t] for _, t in G.edges), dtype=np.int64, count=m)
+        return cls(names, _csr(len(names), src, dst), _csr(len(names), dst, src))
+
+    def to_nx(self) -> nx.DiGraph:
+        """The structure back as a DiGraph (nodes and edges; attributes live elsewhere)."""
+        G = nx.DiGraph()
+        G.add_nodes_from(self.names.tolist())
+        src = np.repeat(np.arange(len(self.names)), np.diff(self.fwd_indptr))
+        G.add_edges_from(zip(self.names[src].tolist(), self.names[self.fwd_indices].tolist()))
+        return G
+
+    def _step(self, indptr, indices, names) -> list[str]:
+        ids = [i for i in map(self.ids.get, names) if i is not None]
+        if not ids:
+            return []
+        return self.names[_gather(indptr, indices, np.array(ids, dtype=np.int64))].tolist()
+
+    def successors(self, names) -> list[str]:
+        """Direct dependents of every node in `names` (unknown names are skipped), repeats kept."""
+        return self._step(self.fwd_indptr, self.fwd_indices, names)
+
+    def predecessors(self, names) -> list[str]:
+        """Direct precedents of every node in `names`, repeats kept."""
+        return self._step(self.rev_indptr, self.rev_indices, names)
+
+    def nbytes(self) -> int:
+        """Bytes held by the CSR arrays (the name table not counted)."""
+        return sum(a.nbytes for a in (self.fwd_indptr, self.fwd_indices,
+                                      self.rev_indptr, self.rev_indices))
@@ -12,8 +12,62 @@ class Settings:
     NEO4J_USER: str      = os.getenv("NEO4J_USER", "neo4j")
     NEO4J_PASSWORD: str  = os.getenv("NEO4J_PASSWORD", "password")
     NEO4J_DATABASE: str  = os.getenv("NEO4J_DATABASE", "neo4j")
+    NEO4J_BATCH_SIZE: int = int(os.getenv("NEO4J_BATCH_SIZE", "10000"))  # rows per UNWIND tx
+    NEO4J_POOL_SIZE: int = int(os.getenv("NEO4J_POOL_SIZE", "50"))
+    NEO4J_ACQUIRE_TIMEOUT: float = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT", "30"))    # s to wait for a pooled conn
+    NEO4J_LIVENESS_CHECK: float = float(os.getenv("NEO4J_LIVENESS_CHECK", "30"))      # ping conns idle longer than this
+    NEO4J_MAX_CONN_LIFETIME: float = float(os.getenv("NEO4J_MAX_CONN_LIFETIME", "3600"))
+
+    # Graph backend: "neo4j" or "memory" (in-process, snapshot on disk)
+    GRAPH_BACKEND: str   = os.getenv("GRAPH_BACKEND", "neo4j")
+    GRAPH_SNAPSHOT: str  = os.getenv("GRAPH_SNAPSHOT", ".graph_snapshot.pkl.gz")
+    IMPACT_CACHE_MB: int = int(os.getenv("IMPACT_CACHE_MB", "64"))   # memoised dependents
+    IMPACT_WARM_TOP: int = int(os.getenv("IMPACT_WARM_TOP", "50"))   # hot inputs precomputed after a change
+    PARSE_CACHE_DIR: str = os.getenv("PARSE_CACHE_DIR", ".parse_cache")   # per-sheet parse results; "" = off
+    PARSE_CACHE_MB: int = int(os.getenv("PARSE_CACHE_MB", "1024"))       # oldest entries pruned past this
+
+    # File watcher
+    WATCH_DEBOUNCE: float = float(os.getenv("WATCH_DEBOUNCE", "0.5"))              # s of quiet before a sync
+    WATCH_STABLE_INTERVAL: float = float(os.getenv("WATCH_STABLE_INTERVAL", "0.25"))  # size/mtime poll step
+    WATCH_STABLE_TIMEOUT: float = float(os.getenv("WATCH_STABLE_TIMEOUT", "30"))   # give up on a file still being written
+    WATCH_WORKERS: int = int(os.getenv("WATCH_WORKERS", "4"))                     # workbooks parsed at once
+
+    # Observability
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))           # watcher's /metrics; 0 = off (the API always has one)
+    OTEL_TRACING: bool = os.getenv("OTEL_TRACING", "0") == "1"        # spans via the opentelemetry API, if installed
+
+    # /subgraph pages for the viewer
+    VIEW_PAGE_NODES: int = int(os.getenv("VIEW_PAGE_NODES", "500"))     # default nodes per page
+    VIEW_PAGE_EDGES: int = int(os.getenv("VIEW_PAGE_EDGES", "2000"))    # edges per page
+    VIEW_MAX_HOPS: int = int(os.getenv("VIEW_MAX_HOPS", "6"))
+    VIEW_MAX_NODES: int = int(os.getenv("VIEW_MAX_NODES", "20000"))     # a neighbourhood stops growing here
+    VIEW_FANOUT: int = int(os.getenv("VIEW_FANOUT", "500"))             # edges followed per node each way
+
+    # /events (SSE)
+    EVENT_QUEUE_SIZE: int = int(os.getenv("EVENT_QUEUE_SIZE", "256"))   # per client; overflow → resync
+    EVENT_BACKLOG: int = int(os.getenv("EVENT_BACKLOG", "1024"))        # events kept for Last-Event-ID resume
+    EVENT_MAX_DELTA: int = int(os.getenv("EVENT_MAX_DELTA", "5000"))    # bigger changes are sent as resync
+    EVENT_KEEPALIVE: float = float(os.getenv("EVENT_KEEPALIVE", "15"))  # s between comment pings
+
+    # NL→Cypher translation cache for /run
+    CYPHER_CACHE_SIZE: int = int(os.getenv("CYPHER_CACHE_SIZE", "1024"))       # entries, LRU
+    CYPHER_CACHE_TTL: float = float(os.getenv("CYPHER_CACHE_TTL", "86400"))    # s before a translation expires
+    CYPHER_CACHE_PATH: str = os.getenv("CYPHER_CACHE_PATH", "")                # JSON file; "" = memory only
+
+    # /run results of free-form Cypher reads
+    RUN_PAGE_ROWS: int = int(os.getenv("RUN_PAGE_ROWS", "500"))       # default rows per page
+    RUN_MAX_ROWS: int = int(os.getenv("RUN_MAX_ROWS", "50000"))       # per query, paged or streamed
+    RUN_FETCH_SIZE: int = int(os.getenv("RUN_FETCH_SIZE", "1000"))    # records pulled from Neo4j per round trip
+
+    # Cost guard for LLM-written Cypher (src/cypher_guard.py)
+    CYPHER_MAX_HOPS: int = int(os.getenv("CYPHER_MAX_HOPS", "10"))                  # bound for *, *1.. and longer
+    CYPHER_MAX_EST_ROWS: float = float(os.getenv("CYPHER_MAX_EST_ROWS", "1e6"))     # EXPLAIN estimate per operator
+    CYPHER_TIMEOUT: float = float(os.getenv("CYPHER_TIMEOUT", "30"))                # s per transaction
 
     # LLM
     LLM_PROVIDER: str    = os.getenv("LLM_PROVIDER", "openai")      # or "gemini"
     LLM_MODEL: str       = os.getenv("LLM_MODEL", "gpt-4o")
     LLM_API_KEY: str     = os.getenv("LLM_API_KEY", "")
+    LLM_MAX_INFLIGHT: int = int(os.getenv("LLM_MAX_INFLIGHT", "8"))            # concurrent NL→Cypher calls
+    LLM_QUEUE_TIMEOUT: float = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))     # s to wait for a free slot
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "60"))                 # s per LLM call
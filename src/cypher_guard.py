@@ -0,0 +1,224 @@
+# src/cypher_guard.py
+"""
+Cost guard for LLM-written Cypher, run before it reaches a shared Neo4j.
+
+`bound` rewrites the text.  Variable-length relationships get an upper
+bound of CYPHER_MAX_HOPS: `*` and `*1..` become `*1..N`, and a larger
+bound is lowered to N.  A fixed length above N is refused.  A read whose
+final RETURN has no LIMIT gets one, and a larger literal LIMIT is lowered;
+a UNION is limited as a whole through CALL { … }.
+The rewrite works on the text with quoted strings and names masked out.
+`check` then EXPLAINs the query (the planner runs, the query doesn't) and
+refuses plans with a cartesian product, or where any operator is
+estimated to produce more than CYPHER_MAX_EST_ROWS rows.  `query` wraps
+the text in a transaction timeout of CYPHER_TIMEOUT seconds, so whatever
+gets through still can't hold the database for long.
+
+`paged` rewrites a guarded read so the server cuts out one page of it:
+the final RETURN is ordered on every result column (after the query's
+own ORDER BY, if any), and its SKIP / LIMIT become `$_skip` / `$_limit`.
+"""
+
+import re
+
+from neo4j import Query
+
+from .config import Settings
+
+_cfg = Settings()
+
+# string literals and quoted names are copied through untouched
+_QUOTED = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`")
+# a relationship pattern:  -[r:TYPE*2..5 {p: 1}]-
+_REL = re.compile(r"(-\s*\[)([^\[\]]*)(\])")
+_HOPS = re.compile(r"\*(?:\s*(\d+))?(?:\s*(\.\.))?(?:\s*(\d+))?")
+_RETURN = re.compile(r"\bRETURN\b", re.IGNORECASE)
+_LIMIT = re.compile(r"\bLIMIT\s+(\$?\w+)", re.IGNORECASE)
+_UNION = re.compile(r"\bUNION\b", re.IGNORECASE)
+_SKIP = re.compile(r"\bSKIP\s+(\$?\w+)", re.IGNORECASE)
+_ORDER = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+_YIELD = re.compile(r"\bYIELD\b", re.IGNORECASE)
+_NAME = re.compile(r"[A-Za-z_]\w*")
+
+
+class QueryRejected(ValueError):
+    """A query the guard won't send to the database."""
+
+
+def _mask(cypher: str) -> tuple[str, list[str]]:
+    """The query with every quoted piece swapped for a numbered placeholder, and the pieces."""
+    quoted = []
+
+    def swap(m):
+        quoted.append(m.group())
+        return f"\0{len(quoted) - 1}\0"
+    return _QUOTED.sub(swap, cypher), quoted
+
+
+def _unmask(text: str, quoted: list[str]) -> str:
+    return re.sub(r"\0(\d+)\0", lambda m: quoted[int(m.group(1))], text)
+
+
+def _bound_hops(text: str, max_hops: int) -> str:
+    def hops(m):
+        lo, dots, hi = m.group(1), m.group(2), m.group(3)
+        if not dots and lo:                     # *3: exactly three hops
+            if int(lo) > max_hops:
+                raise QueryRejected(f"a {lo}-hop pattern is longer than the {max_hops}-hop limit")
+            return m.group()
+        lo = lo or "1"
+        hi = min(int(hi), max_hops) if hi else max_hops
+        if int(lo) > hi:
+            raise QueryRejected(f"a pattern of at least {lo} hops is longer than the {max_hops}-hop limit")
+        return f"*{lo}..{hi}"
+
+    return _REL.sub(lambda m: m.group(1) + _HOPS.sub(hops, m.group(2)) + m.group(3), text)
+
+
+def _depth(text: str, at: int) -> int:
+    """How many { … } blocks are open at `at` (masked text, so braces in strings don't count)."""
+    return text.count("{", 0, at) - text.count("}", 0, at)
+
+
+def _top_union(text: str) -> bool:
+    """Is the query a UNION, rather than holding one inside CALL { … }?"""
+    return any(not _depth(text, m.start()) for m in _UNION.finditer(text))
+
+
+def _split_top(text: str) -> list[str]:
+    """`text` cut at the commas outside any brackets."""
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch in "([{":
+            depth += 1
+        elif ch in ")]}":
+            depth -= 1
+        elif ch == "," and not depth:
+            parts.append(text[start:i])
+            start = i + 1
+    return parts + [text[start:]]
+
+
+def _return_names(text: str) -> list[str] | None:
+    """The column names of the final RETURN, or None if any column is unnamed (`n.name`, `*`)."""
+    at = list(_RETURN.finditer(text))[-1].end()
+    items = text[at:]
+    ends = [m.start() for r in (_ORDER, _SKIP, _LIMIT) for m in r.finditer(items)]
+    items = re.sub(r"^\s*DISTINCT\b", "", items[:min(ends, default=len(items))], flags=re.IGNORECASE)
+    names = []
+    for item in _split_top(items):
+        m = re.search(r"\bAS\s+(\w+|\0\d+\0)\s*$", item, re.IGNORECASE)
+        name = m.group(1) if m else item.strip()
+        if not (_NAME.fullmatch(name) or re.fullmatch(r"\0\d+\0", name)):
+            return None
+        names.append(name)
+    return names
+
+
+def _bound_rows(cypher: str, limit: int) -> str:
+    """Lower or add the LIMIT of the final RETURN; a UNION is limited through CALL { … }."""
+    returns = list(_RETURN.finditer(cypher))
+    if not returns:
+        return cypher
+    if _top_union(cypher):
+        names = _return_names(cypher)
+        if names is None:
+            raise QueryRejected("name every column of a UNION (RETURN … AS name) so its result can be limited")
+        body = cypher.rstrip().rstrip(";")
+        return f"CALL {{ {body} }} RETURN {', '.join(names)} LIMIT {limit}"
+    found = list(_LIMIT.finditer(cypher, returns[-1].end()))
+    if not found:
+        return cypher.rstrip().rstrip(";") + f" LIMIT {limit}"
+    m = found[-1]
+    if not m.group(1).isdigit() or int(m.group(1)) <= limit:
+        return cypher
+    return cypher[:m.start(1)] + str(limit) + cypher[m.end(1):]
+
+
+def bound(cypher: str, read: bool, max_hops: int | None = None, limit: int | None = None) -> str:
+    """The query with every traversal, and (for a read) its result, bounded."""
+    text, quoted = _mask(cypher)
+    text = _bound_hops(text, max_hops or _cfg.CYPHER_MAX_HOPS)
+    if read:
+        # one row past the /run cap, so a cut result still shows as truncated
+        text = _bound_rows(text, limit or _cfg.RUN_MAX_ROWS + 1)
+    return _unmask(text, quoted)
+
+
+def _walk(plan: dict):
+    yield plan
+    for child in plan.get("children", []):
+        yield from _walk(child)
+
+
+def check_plan(plan: dict | None, max_rows: float | None = None):
+    """Raise QueryRejected for a cartesian product or an operator estimated above `max_rows`."""
+    max_rows = max_rows or _cfg.CYPHER_MAX_EST_ROWS
+    for op in _walk(plan or {}):
+        kind = op.get("operatorType", "").split("@")[0]
+        if kind == "CartesianProduct":
+            raise QueryRejected("the plan joins unrelated patterns (cartesian product); "
+                                "connect them or match them separately")
+        rows = op.get("args", {}).get("EstimatedRows", 0)
+        if rows > max_rows:
+            raise QueryRejected(f"{kind} is estimated at {rows:,.0f} rows, "
+                                f"over the {max_rows:,.0f}-row limit")
+
+
+def _count(token: str, params: dict) -> int:
+    """A SKIP / LIMIT operand: an integer literal or an integer parameter."""
+    if token.isdigit():
+        return int(token)
+    value = params.get(token[1:]) if token.startswith("$") else None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise QueryRejected(f"can't page a query whose SKIP / LIMIT is {token}")
+
+
+def paged(cypher: str, columns: list[str], params: dict) -> tuple[str, int, int | None]:
+    """
+    (text, skip, limit): the read ordered on all of `columns` and ending in
+    `SKIP $_skip LIMIT $_limit`, plus the SKIP and LIMIT it had (0 and None
+    when absent), which the pages must stay inside.  A UNION is paged
+    through CALL { … }, which needs its columns named.
+    """
+    text, quoted = _mask(cypher)
+    text = text.rstrip().rstrip(";")
+    named = all(_NAME.fullmatch(c) for c in columns)
+    # a plain column is referred to by name, an unaliased one (`n.name`) by its expression
+    order = ", ".join(f"`{c}`" if _NAME.fullmatch(c) else c for c in columns)
+    if _top_union(text):
+        if not named:
+            raise QueryRejected("name every column of a UNION (RETURN … AS name) to page it")
+        text = f"CALL {{ {text} }} RETURN {order} ORDER BY {order}"
+        return _unmask(text + " SKIP $_skip LIMIT $_limit", quoted), 0, None
+    if not _RETURN.search(text):
+        # a bare procedure call: give it a RETURN to order
+        text += ("" if _YIELD.search(text) else f" YIELD {order}") + f" RETURN {order}"
+    at = list(_RETURN.finditer(text))[-1].end()
+    head, tail = text[:at], text[at:]
+    skips, limits = list(_SKIP.finditer(tail))[-1:], list(_LIMIT.finditer(tail))[-1:]
+    skip = _count(skips[0].group(1), params) if skips else 0
+    limit = _count(limits[0].group(1), params) if limits else None
+    tail = tail[:min((m.start() for m in skips + limits), default=len(tail))].rstrip()
+    tail += (", " if _ORDER.search(tail) else " ORDER BY ") + order
+    return _unmask(head + tail + " SKIP $_skip LIMIT $_limit", quoted), skip, limit
+
+
+def query(cypher: str) -> Query:
+    """The text as a Query that times out after CYPHER_TIMEOUT seconds."""
+    return Query(cypher, timeout=_cfg.CYPHER_TIMEOUT)
+
+
+def check(session, cypher: str, params: dict | None = None) -> list[str]:
+    """EXPLAIN on a sync session, then `check_plan`; returns the result's columns."""
+    result = session.run(query("EXPLAIN " + cypher), params or {})
+    check_plan(result.consume().plan)
+    return list(result.keys())
+
+
+async def acheck(session, cypher: str, params: dict | None = None) -> list[str]:
+    """EXPLAIN on an async session, then `check_plan`; returns the result's columns."""
+    result = await session.run(query("EXPLAIN " + cypher), params or {})
+    check_plan((await result.consume()).plan)
+    return list(result.keys())
@@ -0,0 +1,984 @@
+# src/evaluator.py
+"""
+Formula evaluation for the recalc engine (src/recalc.py).
+
+`compile_formula` turns formula text into a small tuple AST whose refs are
+in template form (relative parts kept as offsets, see parser.relative_refs),
+so every cell of a filled block shares one compiled tree.  `evaluate` runs
+a tree for one host cell; `evaluate_block` runs it for a whole run of rows
+in one column with NumPy, when the tree is arithmetic over single-cell refs
+(position-independent parts, e.g. `SUM($B$2:$B$99)`, are evaluated once and
+broadcast).
+
+Values are float, str, bool, None (empty cell) or XlError.  A formula
+using anything outside FUNCTIONS raises Unsupported at compile time; the
+engine then keeps Excel's cached value for it.
+
+The `book` argument is anything with the read methods RecalcEngine has:
+value, numbers, first_error, values, grid, column, extent.
+"""
+
+import math, re
+
+import numpy as np
+
+from .ingest import MAX_COL, MAX_ROW
+from .parser import place, relative_refs, tokenize, unwrap
+
+
+class XlError(str):
+    """An Excel error value such as #DIV/0!; propagates through arithmetic."""
+
+
+DIV0, VALUE, REF, NAME, NUM, NA = (XlError(e) for e in
+                                   ("#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A"))
+ERRORS = {e: XlError(e) for e in
+          ("#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A", "#SPILL!", "#CALC!")}
+
+
+class Unsupported(Exception):
+    """The formula uses syntax or a function the evaluator doesn't implement."""
+
+
+class NotVector(Exception):
+    """This block can't be evaluated as arrays; fall back to cell by cell."""
+
+
+# ──────────────────────────────────────────────────────────────
+# Compilation: recursive descent over parser.tokenize() tokens.
+# Nodes: ("lit", v) ("ref", sheet, a, b) ("neg", x) ("pct", x)
+#        ("bin", op, l, r) ("call", NAME, [args]) ("union", [items]) ("missing",)
+# ──────────────────────────────────────────────────────────────
+_LEVELS = [{"=", "<>", "<", ">", "<=", ">="}, {"&"}, {"+", "-"}, {"*", "/"}, {"^"}]
+
+
+class _Compiler:
+    def __init__(self, text, row, col):
+        self.refs = {tok.pos: ref for tok, ref in relative_refs(text, row, col)}
+        self.toks = tokenize(text)
+        self.i = 0
+
+    def peek(self, kind=None, text=None):
+        tok = self.toks[self.i] if self.i < len(self.toks) else None
+        if tok is None or (kind and tok.kind != kind) or (text and tok.text != text):
+            return None
+        return tok
+
+    def take(self, kind=None, text=None):
+        tok = self.peek(kind, text)
+        if tok is None:
+            raise Unsupported(f"expected {text or kind} at token {self.i}")
+        self.i += 1
+        return tok
+
+    def formula(self):
+        node = self.binary(0)
+        if self.i != len(self.toks):
+            raise Unsupported(f"unexpected {self.toks[self.i].text!r}")
+        return node
+
+    def binary(self, level):
+        if level == len(_LEVELS):
+            return self.unary()
+        node = self.binary(level + 1)
+        while (tok := self.peek("op")) and tok.text in _LEVELS[level]:
+            self.i += 1
+            node = ("bin", tok.text, node, self.binary(level + 1))
+        return node
+
+    def unary(self):
+        # prefix minus binds tighter than ^ in Excel: -2^2 = 4
+        if (tok := self.peek("op")) and tok.text in "+-":
+            self.i += 1
+            node = self.unary()
+            return ("neg", node) if tok.text == "-" else node
+        node = self.primary()
+        while self.peek("op", "%"):
+            self.i += 1
+            node = ("pct", node)
+        return node
+
+    def primary(self):
+        tok = self.take()
+        if tok.kind == "number":
+            return ("lit", float(tok.text.rstrip("%")) / (100 if tok.text.endswith("%") else 1))
+        if tok.kind == "string":
+            return ("lit", tok.text[1:-1].replace('""', '"'))
+        if tok.kind == "bool":
+            return ("lit", tok.text.upper() == "TRUE")
+        if tok.kind == "error":
+            return ("lit", ERRORS.get(tok.text.upper(), NAME))
+        if tok.kind == "ref":
+            return ("ref", *self.refs[tok.pos])
+        if tok.kind == "func":
+            return self.call(tok)
+        if tok.kind == "paren" and tok.text == "(":
+            items = [self.binary(0)]
+            while self.peek("sep"):
+                self.i += 1
+                items.append(self.binary(0))
+            self.take("paren", ")")
+            return items[0] if len(items) == 1 else ("union", items)
+        raise Unsupported(f"{tok.kind} {tok.text!r}")
+
+    def call(self, tok):
+        name = re.sub(r"^_xl(?:fn|ws)\.", "", tok.text, flags=re.IGNORECASE).upper()
+        if name not in FUNCTIONS:
+            raise Unsupported(f"function {name}")
+        self.take("paren", "(")
+        args = []
+        if not self.peek("paren", ")"):
+            while True:
+                if self.peek("sep") or self.peek("paren", ")"):
+                    args.append(("missing",))
+                else:
+                    args.append(self.binary(0))
+                if not self.peek("sep"):
+                    break
+                self.i += 1
+        self.take("paren", ")")
+        return ("call", name, args)
+
+
+def compile_formula(formula: str, row: int, col: int):
+    """AST of `formula` as written in (row, col); raises Unsupported."""
+    text = unwrap(formula)
+    text = text[1:] if text.startswith("=") else text
+    return _Compiler(text, row, col).formula()
+
+
+# ──────────────────────────────────────────────────────────────
+# Scalar evaluation
+# ──────────────────────────────────────────────────────────────
+class Range:
+    """A rectangle of a sheet, read lazily through the book."""
+
+    __slots__ = ("book", "sheet", "r0", "r1", "c0", "c1")
+
+    def __init__(self, book, sheet, r0, r1, c0, c1):
+        self.book, self.sheet, self.r0, self.r1, self.c0, self.c1 = book, sheet, r0, r1, c0, c1
+
+    @property
+    def shape(self):
+        return self.r1 - self.r0 + 1, self.c1 - self.c0 + 1
+
+    def numbers(self):
+        return self.book.numbers(self.sheet, self.r0, self.r1, self.c0, self.c1)
+
+    def error(self):
+        return self.book.first_error(self.sheet, self.r0, self.r1, self.c0, self.c1)
+
+    def rows(self):
+        return self.book.values(self.sheet, self.r0, self.r1, self.c0, self.c1)
+
+    def grid(self):
+        """Row-major (float array, NaN for non-numbers; {flat index: other value})."""
+        nums, others = self.book.grid(self.sheet, self.r0, self.r1, self.c0, self.c1)
+        cols = nums.shape[1]
+        return nums.ravel(), {i * cols + j: v for (i, j), v in others.items()}
+
+    def flat(self):
+        return [v for row in self.rows() for v in row]
+
+    def sub(self, r0, r1, c0, c1):
+        """Sub-rectangle by 1-based offsets inside this range."""
+        return Range(self.book, self.sheet, self.r0 + r0 - 1, self.r0 + r1 - 1,
+                     self.c0 + c0 - 1, self.c0 + c1 - 1)
+
+
+def _range(book, sheet, a, b, row, col):
+    (ra, ca), (rb, cb) = place(a, row, col), place(b, row, col)
+    max_row, max_col = book.extent(sheet)
+    # whole columns / rows only need to reach the sheet's used extent
+    r0, r1 = (1, max_row) if ra is None else sorted((ra, rb))
+    c0, c1 = (1, max_col) if ca is None else sorted((ca, cb))
+    if r0 < 1 or c0 < 1 or r1 > MAX_ROW or c1 > MAX_COL:
+        return REF
+    return Range(book, sheet, r0, r1, c0, c1)
+
+
+def evaluate(node, book, sheet: str, row: int, col: int):
+    """Value of `node` with (sheet, row, col) as the host cell."""
+    kind = node[0]
+    if kind == "lit":
+        return node[1]
+    if kind == "ref":
+        s = node[1] or sheet
+        if node[3] is None and None not in place(node[2], row, col):
+            r, c = place(node[2], row, col)
+            if r < 1 or not 1 <= c <= MAX_COL:
+                return REF
+            return book.value(s, r, c)
+        return _range(book, s, node[2], node[3] or node[2], row, col)
+    if kind == "bin":
+        return _binary(node[1], evaluate(node[2], book, sheet, row, col),
+                       evaluate(node[3], book, sheet, row, col))
+    if kind == "neg":
+        v = _num(evaluate(node[1], book, sheet, row, col))
+        return v if isinstance(v, XlError) else -v
+    if kind == "pct":
+        v = _num(evaluate(node[1], book, sheet, row, col))
+        return v if isinstance(v, XlError) else v / 100
+    if kind == "call":
+        return FUNCTIONS[node[1]]([evaluate(a, book, sheet, row, col) for a in node[2]])
+    if kind == "union":
+        return [evaluate(a, book, sheet, row, col) for a in node[1]]
+    return None     # missing argument
+
+
+def evaluate_cell(node, book, sheet: str, row: int, col: int):
+    """What a formula cell shows: a single value, with an empty result as 0."""
+    try:
+        v = _scalar(evaluate(node, book, sheet, row, col))
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return VALUE
+    return 0.0 if v is None else v
+
+
+def _scalar(v):
+    """Implicit intersection, simplified: a 1×1 range is its value."""
+    if isinstance(v, Range):
+        return v.rows()[0][0] if v.shape == (1, 1) else VALUE
+    if isinstance(v, list):
+        return VALUE
+    return v
+
+
+def _num(v):
+    v = _scalar(v)
+    if v is None:
+        return 0.0
+    if isinstance(v, (XlError, float)):
+        return v
+    if isinstance(v, (bool, int)):
+        return float(v)
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return VALUE
+
+
+def _text(v):
+    v = _scalar(v)
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, float):
+        return str(int(v)) if v.is_integer() else repr(v)
+    return str(v)
+
+
+def _truth(v):
+    v = _scalar(v)
+    if isinstance(v, XlError):
+        return v
+    if isinstance(v, str):
+        return {"TRUE": True, "FALSE": False}.get(v.upper(), VALUE)
+    return bool(v)
+
+
+def _rank(v):
+    # Excel orders numbers < text < logicals
+    return 2 if isinstance(v, bool) else 1 if isinstance(v, str) else 0
+
+
+def _compare(op, a, b):
+    if a is None:
+        a = "" if isinstance(b, str) else False if isinstance(b, bool) else 0.0
+    if b is None:
+        b = "" if isinstance(a, str) else False if isinstance(a, bool) else 0.0
+    ra, rb = _rank(a), _rank(b)
+    if ra != rb:
+        a, b = ra, rb
+    elif ra == 1:
+        a, b = a.lower(), b.lower()
+    return {"=": a == b, "<>": a != b, "<": a < b, ">": a > b, "<=": a <= b, ">=": a >= b}[op]
+
+
+def _binary(op, a, b):
+    if op == "&":
+        a, b = _scalar(a), _scalar(b)
+        for v in (a, b):
+            if isinstance(v, XlError):
+                return v
+        return _text(a) + _text(b)
+    if op in ("=", "<>", "<", ">", "<=", ">="):
+        a, b = _scalar(a), _scalar(b)
+        for v in (a, b):
+            if isinstance(v, XlError):
+                return v
+        return _compare(op, a, b)
+    a, b = _num(a), _num(b)
+    for v in (a, b):
+        if isinstance(v, XlError):
+            return v
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if op == "/":
+        return DIV0 if b == 0 else a / b
+    try:
+        r = math.pow(a, b)
+    except (ValueError, OverflowError, ZeroDivisionError):
+        return NUM
+    return r
+
+
+# ──────────────────────────────────────────────────────────────
+# Functions.  Each takes the list of evaluated arguments (values, Range,
+# lists for unions, None for a missing argument).
+# ──────────────────────────────────────────────────────────────
+def _numbers(args):
+    """Numbers an aggregate sees: ranges skip text/logicals/empties, direct args are coerced."""
+    out = []
+    for a in args:
+        if isinstance(a, Range):
+            err = a.error()
+            if err:
+                return err
+            out.append(a.numbers())
+        elif isinstance(a, list):
+            inner = _numbers(a)
+            if isinstance(inner, XlError):
+                return inner
+            out.append(inner)
+        elif a is not None:
+            v = _num(a)
+            if isinstance(v, XlError):
+                return v
+            out.append(np.array([v]))
+    return np.concatenate(out) if out else np.empty(0)
+
+
+def _aggregate(fn, empty=0.0):
+    def agg(args):
+        nums = _numbers(args)
+        if isinstance(nums, XlError):
+            return nums
+        return float(fn(nums)) if len(nums) else empty
+    return agg
+
+
+def _average(args):
+    nums = _numbers(args)
+    if isinstance(nums, XlError):
+        return nums
+    return float(nums.mean()) if len(nums) else DIV0
+
+
+def _count(args):
+    n = 0
+    for a in args:
+        if isinstance(a, Range):
+            n += len(a.numbers())
+        elif isinstance(a, list):
+            n += _count(a)
+        elif not isinstance(_num(a), XlError) and a is not None:
+            n += 1
+    return float(n)
+
+
+def _counta(args):
+    n = 0
+    for a in args:
+        if isinstance(a, Range):
+            nums, others = a.grid()
+            n += int((~np.isnan(nums)).sum()) + len(others)
+        elif isinstance(a, list):
+            n += _counta(a)
+        elif a is not None:
+            n += 1
+    return float(n)
+
+
+def _if(args):
+    cond = _truth(args[0])
+    if isinstance(cond, XlError):
+        return cond
+    if cond:
+        v = args[1] if len(args) > 1 else True
+    else:
+        v = args[2] if len(args) > 2 else False
+    return 0.0 if v is None else _scalar(v)
+
+
+def _iferror(args):
+    v = _scalar(args[0])
+    return (0.0 if args[1] is None else _scalar(args[1])) if isinstance(v, XlError) else v
+
+
+def _ifna(args):
+    v = _scalar(args[0])
+    return (0.0 if args[1] is None else _scalar(args[1])) if v == NA else v
+
+
+def _logical(fn):
+    def logic(args):
+        vals = []
+        for a in args:
+            items = a.flat() if isinstance(a, Range) else (a if isinstance(a, list) else [a])
+            for v in items:
+                if isinstance(v, XlError):
+                    return v
+                if isinstance(v, (bool, float, int)):
+                    vals.append(bool(v))
+                elif not isinstance(a, Range) and v is not None:
+                    t = _truth(v)
+                    if isinstance(t, XlError):
+                        return t
+                    vals.append(t)
+        return fn(vals) if vals else VALUE
+    return logic
+
+
+def _not(args):
+    t = _truth(args[0])
+    return t if isinstance(t, XlError) else not t
+
+
+def _numeric(fn, arity=1):
+    """Wrap a float function; errors in any argument propagate, math errors are #NUM!."""
+    def wrapped(args):
+        vals = [_num(a) for a in args[:arity]]
+        for v in vals:
+            if isinstance(v, XlError):
+                return v
+        try:
+            return float(fn(*vals))
+        except ZeroDivisionError:
+            return DIV0
+        except (ValueError, OverflowError):
+            return NUM
+    return wrapped
+
+
+def _excel_round(x, n, how=None):
+    # half away from zero (Python's round() is half-to-even); the inner
+    # round() absorbs binary noise such as 2.675 * 100 = 267.49999…
+    m = 10.0 ** int(n)
+    scaled = round(abs(x) * m, 9)
+    if how == "up":
+        r = math.ceil(scaled)
+    elif how == "down":
+        r = math.floor(scaled)
+    else:
+        r = math.floor(scaled + 0.5)
+    return math.copysign(r / m, x)
+
+
+def _mod(x, y):
+    if y == 0:
+        raise ZeroDivisionError
+    return x - y * math.floor(x / y)
+
+
+def _log(args):
+    return _numeric(lambda x, b=10.0: math.log(x, b), 2)(args + [10.0] if len(args) == 1 else args)
+
+
+_CRITERION_RE = re.compile(r"^(<=|>=|<>|<|>|=)?(.*)$", re.DOTALL)
+
+
+_NP_COMPARE = {"=": np.equal, "<>": np.not_equal, "<": np.less, ">": np.greater,
+               "<=": np.less_equal, ">=": np.greater_equal}
+
+
+def _criterion(c):
+    """
+    A SUMIF/COUNTIF criterion such as 5, ">=10", "<>x", "A*" as (predicate
+    on one value, predicate over a float array of the numeric cells).
+    """
+    c = _scalar(c)
+    none = lambda nums: np.zeros(len(nums), dtype=bool)
+    every = lambda nums: np.ones(len(nums), dtype=bool)
+    if not isinstance(c, str):
+        t = _num(c)
+        return (lambda v: isinstance(v, float) and v == t), (lambda nums: nums == t)
+    op, rest = _CRITERION_RE.match(c).groups()
+    op = op or "="
+    try:
+        target = float(rest)
+    except ValueError:
+        target = None
+    if target is not None:
+        def numeric(v):
+            if not isinstance(v, float):
+                return op == "<>"
+            return _compare(op, v, target)
+        return numeric, lambda nums: _NP_COMPARE[op](nums, target)
+    if rest == "":
+        if op == "=":
+            return (lambda v: v is None or v == ""), none
+        return (lambda v: v is not None and v != ""), every
+    if op in ("=", "<>") and any(ch in rest for ch in "*?"):
+        pattern = re.compile("".join(".*" if ch == "*" else "." if ch == "?" else re.escape(ch)
+                                     for ch in rest), re.IGNORECASE | re.DOTALL)
+        hit = lambda v: isinstance(v, str) and pattern.fullmatch(v) is not None
+        return (hit, none) if op == "=" else ((lambda v: not hit(v)), every)
+    def text(v):
+        if not isinstance(v, str):
+            return op == "<>"
+        return _compare(op, v, rest)
+    return text, every if op == "<>" else none
+
+
+def _grid(a):
+    """(numbers as a flat float array, NaN elsewhere; {flat index: non-numeric value})."""
+    if isinstance(a, Range):
+        return a.grid()
+    v = _scalar(a)
+    if isinstance(v, float) and not isinstance(v, XlError):
+        return np.array([v]), {}
+    return np.array([np.nan]), ({} if v is None else {0: v})
+
+
+def _resized(rng, like):
+    """Excel sizes a SUMIF sum_range to the criteria range's shape."""
+    if not isinstance(rng, Range):
+        return rng
+    rows, cols = like.shape if isinstance(like, Range) else (1, 1)
+    return rng.sub(1, rows, 1, cols)
+
+
+def _ifs(pairs):
+    """Boolean mask over the cells of the criteria ranges where every pair matches."""
+    mask = None
+    for rng, crit in pairs:
+        pred, vec = _criterion(crit)
+        nums, others = _grid(rng)
+        with np.errstate(invalid="ignore"):
+            hits = np.where(np.isnan(nums), pred(None), vec(nums))
+        for i, v in others.items():
+            hits[i] = pred(v)
+        if mask is None:
+            mask = hits
+        elif len(hits) != len(mask):
+            return VALUE
+        else:
+            mask &= hits
+    return mask
+
+
+def _sum_matching(target, mask):
+    """(sum, count) of the numbers in `target` where `mask` holds."""
+    if isinstance(mask, XlError):
+        return mask, 0
+    nums, others = _grid(target)
+    if len(nums) != len(mask):
+        return VALUE, 0
+    for i, v in others.items():
+        if mask[i] and isinstance(v, XlError):
+            return v, 0
+    hit = mask & ~np.isnan(nums)
+    return float(nums[hit].sum()), int(hit.sum())
+
+
+def _sumif(args):
+    rng, crit = args[0], args[1]
+    target = _resized(args[2], rng) if len(args) > 2 and args[2] is not None else rng
+    total, _ = _sum_matching(target, _ifs([(rng, crit)]))
+    return total
+
+
+def _averageif(args):
+    rng, crit = args[0], args[1]
+    target = _resized(args[2], rng) if len(args) > 2 and args[2] is not None else rng
+    total, n = _sum_matching(target, _ifs([(rng, crit)]))
+    return total if isinstance(total, XlError) else (total / n if n else DIV0)
+
+
+def _countif(args):
+    mask = _ifs([(args[0], args[1])])
+    return mask if isinstance(mask, XlError) else float(mask.sum())
+
+
+def _sumifs(args):
+    total, _ = _sum_matching(args[0], _ifs(zip(args[1::2], args[2::2])))
+    return total
+
+
+def _averageifs(args):
+    total, n = _sum_matching(args[0], _ifs(zip(args[1::2], args[2::2])))
+    return total if isinstance(total, XlError) else (total / n if n else DIV0)
+
+
+def _countifs(args):
+    mask = _ifs(zip(args[0::2], args[1::2]))
+    return mask if isinstance(mask, XlError) else float(mask.sum())
+
+
+def _sumproduct(args):
+    arrays = []
+    for a in args:
+        if isinstance(a, Range) and a.error():
+            return a.error()
+        nums, _ = _grid(a)
+        arrays.append(np.nan_to_num(nums, nan=0.0))     # text and logicals count as 0
+    if len({len(x) for x in arrays}) > 1:
+        return VALUE
+    return float(np.prod(arrays, axis=0).sum()) if arrays else VALUE
+
+
+def _same(a, b):
+    if isinstance(a, str) and isinstance(b, str):
+        return a.lower() == b.lower()
+    return _rank(a) == _rank(b) and a == b
+
+
+def _lookup_pos(x, rng, mode):
+    """0-based position of x in `rng`: exact (0), largest <= x (1), smallest >= x (-1)."""
+    x = _scalar(x)
+    if isinstance(x, XlError):
+        return x
+    nums, others = _grid(rng)
+    if x is None or (isinstance(x, float) and not isinstance(x, XlError)):
+        x = 0.0 if x is None else x
+        with np.errstate(invalid="ignore"):
+            if mode == 0:
+                ok = np.flatnonzero(nums == x)
+                return int(ok[0]) if len(ok) else NA
+            if mode > 0:
+                # ascending search: the first number above x ends it
+                above = np.flatnonzero(nums > x)
+                ok = np.flatnonzero(nums[:above[0] if len(above) else len(nums)] <= x)
+            else:
+                ok = np.flatnonzero(nums >= x)
+        return int(ok[-1]) if len(ok) else NA
+    # text and logicals only ever match the non-numeric cells
+    if mode == 0:
+        for i, v in sorted(others.items()):
+            if _same(v, x):
+                return i
+        return NA
+    best = None
+    for i, v in sorted(others.items()):
+        if _rank(v) != _rank(x):
+            continue
+        if (mode > 0 and _compare("<=", v, x)) or (mode < 0 and _compare(">=", v, x)):
+            best = i
+        elif mode > 0:
+            break
+    return NA if best is None else best
+
+
+def _vlookup(args):
+    x, table, idx = args[0], args[1], _num(args[2])
+    approx = _truth(args[3]) if len(args) > 3 and args[3] is not None else True
+    if not isinstance(table, Range) or isinstance(idx, XlError):
+        return VALUE if not isinstance(idx, XlError) else idx
+    if not 1 <= idx <= table.shape[1]:
+        return REF
+    pos = _lookup_pos(x, table.sub(1, table.shape[0], 1, 1), 1 if approx else 0)
+    if isinstance(pos, XlError):
+        return pos
+    return table.sub(pos + 1, pos + 1, int(idx), int(idx)).rows()[0][0]
+
+
+def _match(args):
+    rng = args[1]
+    mode = int(_num(args[2])) if len(args) > 2 and args[2] is not None else 1
+    if not isinstance(rng, Range):
+        return NA
+    pos = _lookup_pos(args[0], rng, mode)
+    return pos if isinstance(pos, XlError) else float(pos + 1)
+
+
+def _index(args):
+    rng = args[0]
+    if not isinstance(rng, Range):
+        return _scalar(rng) if all(_num(a) in (0.0, 1.0) for a in args[1:]) else REF
+    rows, cols = rng.shape
+    r = int(_num(args[1])) if len(args) > 1 and args[1] is not None else 0
+    c = int(_num(args[2])) if len(args) > 2 and args[2] is not None else 0
+    if rows == 1 and len(args) == 2:
+        r, c = 1, r         # INDEX(row_vector, n)
+    if r > rows or c > cols or r < 0 or c < 0:
+        return REF
+    if r == 0 or c == 0:
+        return rng.sub(r or 1, r or rows, c or 1, c or cols)
+    return rng.sub(r, r, c, c).rows()[0][0]
+
+
+def _xlookup(args):
+    found, ret = args[1], args[2]
+    if not isinstance(found, Range) or not isinstance(ret, Range):
+        return VALUE
+    pos = _lookup_pos(args[0], found, 0)
+    if isinstance(pos, XlError):
+        return _scalar(args[3]) if len(args) > 3 and args[3] is not None else pos
+    vals = ret.flat()
+    return vals[pos] if pos < len(vals) else REF
+
+
+def _concat(args):
+    out = []
+    for a in args:
+        for v in (a.flat() if isinstance(a, Range) else [a]):
+            v = _scalar(v)
+            if isinstance(v, XlError):
+                return v
+            out.append(_text(v))
+    return "".join(out)
+
+
+def _textfn(fn, *defaults):
+    def wrapped(args):
+        args = args + list(defaults[len(args) - 1:])
+        s = _scalar(args[0])
+        if isinstance(s, XlError):
+            return s
+        rest = [_num(a) for a in args[1:]]
+        for v in rest:
+            if isinstance(v, XlError):
+                return v
+        return fn(_text(s), *(int(v) for v in rest))
+    return wrapped
+
+
+def _subtotal(args):
+    fn = int(_num(args[0])) % 100
+    impl = {1: _average, 2: _count, 3: _counta, 4: FUNCTIONS["MAX"], 5: FUNCTIONS["MIN"],
+            6: FUNCTIONS["PRODUCT"], 9: FUNCTIONS["SUM"]}.get(fn)
+    return impl(args[1:]) if impl else VALUE
+
+
+def _is(pred):
+    return lambda args: pred(_scalar(args[0]))
+
+
+def _value(args):
+    v = _num(args[0])
+    return v
+
+
+FUNCTIONS = {
+    "SUM": _aggregate(np.sum), "PRODUCT": _aggregate(np.prod),
+    "MIN": _aggregate(np.min), "MAX": _aggregate(np.max),
+    "AVERAGE": _average, "COUNT": _count, "COUNTA": _counta,
+    "IF": _if, "IFERROR": _iferror, "IFNA": _ifna,
+    "AND": _logical(all), "OR": _logical(any), "NOT": _not,
+    "ABS": _numeric(abs), "INT": _numeric(math.floor), "SQRT": _numeric(math.sqrt),
+    "EXP": _numeric(math.exp), "LN": _numeric(math.log), "LOG10": _numeric(math.log10), "LOG": _log,
+    "MOD": _numeric(_mod, 2), "POWER": _numeric(math.pow, 2),
+    "ROUND": _numeric(_excel_round, 2),
+    "ROUNDUP": _numeric(lambda x, n: _excel_round(x, n, "up"), 2),
+    "ROUNDDOWN": _numeric(lambda x, n: _excel_round(x, n, "down"), 2),
+    "PI": lambda args: math.pi, "NA": lambda args: NA,
+    "SUMIF": _sumif, "COUNTIF": _countif, "AVERAGEIF": _averageif,
+    "SUMIFS": _sumifs, "COUNTIFS": _countifs, "AVERAGEIFS": _averageifs,
+    "SUMPRODUCT": _sumproduct,
+    "VLOOKUP": _vlookup, "MATCH": _match, "INDEX": _index, "XLOOKUP": _xlookup,
+    "CONCAT": _concat, "CONCATENATE": _concat,
+    "LEN": _textfn(lambda s: float(len(s))),
+    "LEFT": _textfn(lambda s, n: s[:n], 1), "RIGHT": _textfn(lambda s, n: s[-n:] if n else "", 1),
+    "MID": _textfn(lambda s, start, n: s[start - 1:start - 1 + n]),
+    "UPPER": _textfn(str.upper), "LOWER": _textfn(str.lower),
+    "TRIM": _textfn(lambda s: " ".join(s.split())),
+    "VALUE": _value, "N": lambda args: _num(args[0]) if not isinstance(_scalar(args[0]), str) else 0.0,
+    "ISBLANK": _is(lambda v: v is None), "ISNUMBER": _is(lambda v: isinstance(v, float)),
+    "ISTEXT": _is(lambda v: isinstance(v, str) and not isinstance(v, XlError)),
+    "ISERROR": _is(lambda v: isinstance(v, XlError)), "ISNA": _is(lambda v: v == NA),
+    "SUBTOTAL": _subtotal,
+}
+
+
+# ──────────────────────────────────────────────────────────────
+# Vectorised evaluation of a filled run: rows r0..r1 of one column.
+# ──────────────────────────────────────────────────────────────
+_VEC_OPS = {
+    "+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide, "^": np.power,
+    "=": np.equal, "<>": np.not_equal, "<": np.less, ">": np.greater,
+    "<=": np.less_equal, ">=": np.greater_equal,
+}
+
+
+def relative(node) -> bool:
+    """Does the value of `node` depend on which cell hosts it?"""
+    kind = node[0]
+    if kind == "ref":
+        return any(k is not None and not (k[1] and k[3]) for k in node[2:])
+    if kind in ("neg", "pct"):
+        return relative(node[1])
+    if kind == "bin":
+        return relative(node[2]) or relative(node[3])
+    if kind in ("call", "union"):
+        return any(relative(a) for a in node[-1])
+    return False
+
+
+def vectorizable(node) -> bool:
+    """Static check: can `evaluate_block` handle this tree (barring the data)?"""
+    if not relative(node):
+        return True
+    kind = node[0]
+    if kind == "ref":
+        return node[3] is None and None not in node[2][::2]
+    if kind in ("neg", "pct"):
+        return vectorizable(node[1])
+    if kind == "bin":
+        return node[1] in _VEC_OPS and vectorizable(node[2]) and vectorizable(node[3])
+    if kind == "call":
+        return node[1] in _VEC_FUNCS and all(vectorizable(a) for a in node[2])
+    return False
+
+
+def _vec_round(x, n, how=None):
+    m = 10.0 ** n
+    scaled = np.round(np.abs(x) * m, 9)
+    r = np.ceil(scaled) if how == "up" else np.floor(scaled) if how == "down" else np.floor(scaled + 0.5)
+    return np.copysign(r / m, x)
+
+
+def _vec_if(args):
+    if len(args) < 3:
+        raise NotVector
+    return np.where(np.asarray(args[0]) != 0, args[1], args[2])
+
+
+_VEC_FUNCS = {
+    "IF": _vec_if,
+    "IFERROR": lambda a: np.where(np.isfinite(a[0]), a[0], a[1]),
+    "ABS": lambda a: np.abs(a[0]), "INT": lambda a: np.floor(a[0]),
+    "SQRT": lambda a: np.sqrt(a[0]), "EXP": lambda a: np.exp(a[0]), "LN": lambda a: np.log(a[0]),
+    "MOD": lambda a: np.mod(a[0], a[1]) if np.all(np.asarray(a[1]) != 0) else np.nan,
+    "POWER": lambda a: np.power(a[0], a[1]),
+    "ROUND": lambda a: _vec_round(a[0], int(a[1])),
+    "ROUNDUP": lambda a: _vec_round(a[0], int(a[1]), "up"),
+    "ROUNDDOWN": lambda a: _vec_round(a[0], int(a[1]), "down"),
+    "SUM": lambda a: sum(a), "PRODUCT": lambda a: np.prod(np.broadcast_arrays(*a), axis=0),
+    "MIN": lambda a: np.minimum.reduce(np.broadcast_arrays(*a)),
+    "MAX": lambda a: np.maximum.reduce(np.broadcast_arrays(*a)),
+    "AVERAGE": lambda a: sum(a) / len(a),
+    "AND": lambda a: np.logical_and.reduce(np.broadcast_arrays(*[np.asarray(x) != 0 for x in a])),
+    "OR": lambda a: np.logical_or.reduce(np.broadcast_arrays(*[np.asarray(x) != 0 for x in a])),
+    "NOT": lambda a: np.asarray(a[0]) == 0,
+}
+
+
+def _vec(node, book, sheet, r0, n, col):
+    if not relative(node):
+        v = _scalar(evaluate(node, book, sheet, r0, col))
+        if v is None:
+            return 0.0
+        if isinstance(v, (bool, float, int)):
+            return v
+        raise NotVector
+    kind = node[0]
+    if kind == "ref":
+        r, c = place(node[2], r0, col)
+        s = node[1] or sheet
+        if node[2][1]:      # absolute row, relative column: same cell for the whole run
+            return _vec(("lit", _scalar(book.value(s, r, c))), book, sheet, r0, n, col)
+        if r < 1 or not 1 <= c <= MAX_COL:
+            raise NotVector
+        arr = book.column(s, c, r, n)
+        if arr is None:     # text, logicals or errors in the span
+            raise NotVector
+        return arr
+    if kind == "neg":
+        return -np.asarray(_vec(node[1], book, sheet, r0, n, col), dtype=float)
+    if kind == "pct":
+        return np.asarray(_vec(node[1], book, sheet, r0, n, col), dtype=float) / 100
+    if kind == "bin":
+        a = _vec(node[2], book, sheet, r0, n, col)
+        b = _vec(node[3], book, sheet, r0, n, col)
+        if node[1] not in ("=", "<>"):
+            a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+        return _VEC_OPS[node[1]](a, b)
+    if kind == "call":
+        args = []
+        for a in node[2]:
+            if a[0] == "missing":
+                raise NotVector
+            args.append(_vec(a, book, sheet, r0, n, col))
+        return _VEC_FUNCS[node[1]](args)
+    raise NotVector
+
+
+def evaluate_block(node, book, sheet: str, r0: int, r1: int, col: int) -> np.ndarray:
+    """
+    Values of `node` hosted at rows r0..r1 of `col`, as one float array.
+    Raises NotVector when the run needs cell-by-cell evaluation: non-numeric
+    inputs, a logical result, or an error (division by zero, #NUM!) anywhere.
+    """
+    n = r1 - r0 + 1
+    with np.errstate(all="ignore"):
+        out = _vec(node, book, sheet, r0, n, col)
+    out = np.asarray(out)
+    if out.dtype == bool:
+        raise NotVector
+    out = np.broadcast_to(out.astype(float), (n,))
+    if not np.isfinite(out).all():
+        raise NotVector
+    return out
+
+
+# ──────────────────────────────────────────────────────────────
+# Running totals: `=D1+C2` filled down reads the row above in its own
+# column.  Rewritten as previous + increment, the run is one cumsum.
+# ──────────────────────────────────────────────────────────────
+_ABOVE = (-1, False, 0, False)
+
+
+def _is_above(node, sheet):
+    return node[0] == "ref" and node[3] is None and node[2] == _ABOVE and node[1] in (None, sheet)
+
+
+def _touches_column(node, sheet, col):
+    """Does any ref in `node` (same sheet) reach column `col`?"""
+    kind = node[0]
+    if kind == "ref":
+        if node[1] not in (None, sheet):
+            return False
+        corners = [k for k in node[2:] if k is not None]
+        if any(c is None for _, _, c, _ in corners):
+            return True         # whole row
+        cols = [c if c_abs else col + c for _, _, c, c_abs in corners]
+        return min(cols) <= col <= max(cols)
+    if kind in ("neg", "pct"):
+        return _touches_column(node[1], sheet, col)
+    if kind == "bin":
+        return _touches_column(node[2], sheet, col) or _touches_column(node[3], sheet, col)
+    if kind in ("call", "union"):
+        return any(_touches_column(a, sheet, col) for a in node[-1])
+    return False
+
+
+def running_increment(node, sheet: str, col: int):
+    """
+    For `above + x` / `above + x - y` / `x + above` shapes, the tree of the
+    per-row increment (x, x - y, …), else None.  The increment must not read
+    the run's own column.
+    """
+    def strip(n):
+        if _is_above(n, sheet):
+            return ("lit", 0.0)
+        if n[0] != "bin" or n[1] not in "+-":
+            return None
+        left = strip(n[2])
+        if left is not None and not _touches_column(n[3], sheet, col):
+            return ("bin", n[1], left, n[3])
+        if n[1] == "+" and not _touches_column(n[2], sheet, col):
+            right = strip(n[3])
+            if right is not None:
+                return ("bin", "+", n[2], right)
+        return None
+
+    inc = strip(node)
+    if inc is None or _touches_column(inc, sheet, col) or not vectorizable(inc):
+        return None
+    return inc
+
+
+def evaluate_running(inc, book, sheet: str, r0: int, r1: int, col: int) -> np.ndarray:
+    """Rows r0..r1 of a running total with increment tree `inc`; raises NotVector like evaluate_block."""
+    prev = _num(book.value(sheet, r0 - 1, col)) if r0 > 1 else REF
+    if not isinstance(prev, float):
+        raise NotVector
+    steps = evaluate_block(inc, book, sheet, r0, r1, col)
+    # cumsum adds left to right, the same order as the cell-by-cell chain
+    return np.cumsum(np.concatenate(([prev], steps)))[1:]
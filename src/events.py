@@ -0,0 +1,93 @@
+# src/events.py
+"""
+Versioned graph-change events for the SSE stream.
+
+Every change is published once as a numbered event and fanned out to the
+connected viewers:
+
+* `delta` — {"version", "added_nodes": [node…], "removed_nodes": [id…],
+  "added_edges": [[a, b]…], "removed_edges": [[a, b]…],
+  "recolored": [{"id", "color"}…]}, applied by the client in place;
+* `resync` — something changed that a delta can't describe (a free-form
+  Cypher write, a diff too big to ship), or this client missed events:
+  re-fetch the current view.
+
+Each SSE frame is formatted once and shared by every client.  Client
+queues are bounded: one that falls behind is emptied and handed a single
+`resync` rather than let it buffer without limit.  The last `backlog`
+events are kept so a reconnecting EventSource (which sends
+`Last-Event-ID`) gets exactly what it missed; an id from before the
+backlog, or from an earlier server process, gets a `resync`.
+
+Publish and subscribe from the event loop thread only.
+"""
+
+import asyncio, json, os
+from collections import deque
+
+_DELTA_KEYS = ("added_nodes", "removed_nodes", "added_edges", "removed_edges", "recolored")
+
+
+def delta_size(delta: dict) -> int:
+    return sum(len(delta.get(k, ())) for k in _DELTA_KEYS)
+
+
+class EventHub:
+    def __init__(self, queue_size: int, backlog: int):
+        self.queue_size = queue_size
+        self.epoch = os.urandom(4).hex()     # ids from another process never resume here
+        self.seq = 0
+        self.dropped = 0                      # clients sent to resync for falling behind
+        self._backlog = deque(maxlen=backlog)  # (seq, frame)
+        self._clients: set[asyncio.Queue] = set()
+
+    def _id(self, seq: int) -> str:
+        return f"{self.epoch}:{seq}"
+
+    def _frame(self, kind: str, data: dict, seq: int) -> str:
+        return f"id: {self._id(seq)}\nevent: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    def _resync_frame(self) -> str:
+        # carries the newest id so the client's next reconnect resumes from here
+        return self._frame("resync", {"seq": self.seq}, self.seq)
+
+    def publish(self, kind: str, data: dict):
+        """Number, remember and fan out one event."""
+        self.seq += 1
+        frame = self._frame(kind, {**data, "seq": self.seq}, self.seq)
+        self._backlog.append((self.seq, frame))
+        for q in self._clients:
+            self._offer(q, frame)
+
+    def _offer(self, q: asyncio.Queue, frame: str):
+        try:
+            q.put_nowait(frame)
+        except asyncio.QueueFull:
+            # behind by a whole queue: what it has is stale anyway
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(self._resync_frame())
+            self.dropped += 1
+
+    def subscribe(self, last_event_id: str | None = None) -> asyncio.Queue:
+        """A new client queue, preloaded with whatever `last_event_id` missed."""
+        q = asyncio.Queue(self.queue_size)
+        if last_event_id:
+            epoch, _, seq = last_event_id.partition(":")
+            oldest = self._backlog[0][0] if self._backlog else self.seq + 1
+            if epoch != self.epoch or not seq.isdigit() or int(seq) + 1 < oldest:
+                q.put_nowait(self._resync_frame())
+            else:
+                for n, frame in self._backlog:
+                    if n > int(seq):
+                        self._offer(q, frame)
+        self._clients.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self._clients.discard(q)
+
+    def stats(self) -> dict:
+        depths = [q.qsize() for q in self._clients]
+        return {"clients": len(self._clients), "seq": self.seq, "dropped": self.dropped,
+                "queued": sum(depths), "max_queue": max(depths, default=0)}
@@ -1,42 +1,719 @@
-from neo4j import GraphDatabase
+import atexit, heapq, logging, threading, time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, NamedTuple
+from neo4j import GraphDatabase, AsyncGraphDatabase
 from .config import Settings
 from llama_index.graph_stores.neo4j import Neo4jPropertyGraphStore
-from llama_index.core.graph_stores.types import EntityNode, Relation
+from llama_index.graph_stores.neo4j.neo4j_property_graph import (
+    BASE_ENTITY_LABEL, BASE_NODE_LABEL,
+)
+from .ingest import MAX_COL, MAX_ROW, cell_coords, range_bounds
+from .range_index import (
+    RangeIndex, CellIndex, BlockIndex, walk_dependents, walk_path, walk_precedents,
+)
+from .impact_cache import ImpactCache
+from .metrics import NEO4J_ROWS, stage
 
 _cfg = Settings()  # singleton
+log = logging.getLogger(__name__)
 
 
-# --------------------------------------------------------------------------- #
-graph_store = Neo4jPropertyGraphStore(
-    url=_cfg.NEO4J_URI,
-    username=_cfg.NEO4J_USER,
-    password=_cfg.NEO4J_PASSWORD,
-    database=_cfg.NEO4J_DATABASE,
-)
+def _pool_kwargs():
+    return dict(
+        max_connection_pool_size=_cfg.NEO4J_POOL_SIZE,
+        connection_acquisition_timeout=_cfg.NEO4J_ACQUIRE_TIMEOUT,
+        liveness_check_timeout=_cfg.NEO4J_LIVENESS_CHECK,
+        max_connection_lifetime=_cfg.NEO4J_MAX_CONN_LIFETIME,
+    )
+
+
+
+# One pooled driver per process (sync) plus one for asyncio code paths.  Both
+# are created on first use and closed at shutdown; sessions borrow from the
+# pool instead of opening a fresh Bolt connection per request.
+_driver = None
+_async_driver = None
+_driver_lock = threading.Lock()
+
 
 def driver():
-    return GraphDatabase.driver(
-        _cfg.NEO4J_URI,
-        auth=(_cfg.NEO4J_USER, _cfg.NEO4J_PASSWORD)
-    )
+    """The process-wide pooled `neo4j.Driver`."""
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = GraphDatabase.driver(
+                    _cfg.NEO4J_URI,
+                    auth=(_cfg.NEO4J_USER, _cfg.NEO4J_PASSWORD),
+                    **_pool_kwargs(),
+                )
+    return _driver
+
+
+def async_driver():
+    """
+    The process-wide pooled `neo4j.AsyncDriver`.  It belongs to the event
+    loop it is first used on (the API server's), so only call it from there.
+    """
+    global _async_driver
+    if _async_driver is None:
+        _async_driver = AsyncGraphDatabase.driver(
+            _cfg.NEO4J_URI,
+            auth=(_cfg.NEO4J_USER, _cfg.NEO4J_PASSWORD),
+            **_pool_kwargs(),
+        )
+    return _async_driver
+
+
+def close_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+async def close_async_driver():
+    global _async_driver
+    if _async_driver is not None:
+        await _async_driver.close()
+        _async_driver = None
+
+
+atexit.register(close_driver)
 
 
 def clear_db():
+    # batched so wiping a big graph doesn't build one giant transaction
     with driver().session(database=_cfg.NEO4J_DATABASE) as sess:
-        sess.run("MATCH (n) DETACH DELETE n")
+        sess.run(f"""
+            MATCH (n) CALL {{ WITH n DETACH DELETE n }}
+            IN TRANSACTIONS OF {_cfg.NEO4J_BATCH_SIZE} ROWS
+        """)
 
 
+@lru_cache(maxsize=1)
 def store_for_llama():
-    return graph_store 
-
-
-def upsert_graph(nx_graph):
-    gs = store_for_llama()
-    nodes = [EntityNode(id=n, name=n, label="entity") for n in nx_graph.nodes()]
-    rels  = [
-        Relation(source_id=s, target_id=t, label="DEPENDS_ON")
-        for s, t in nx_graph.edges()
-    ]
-    gs.upsert_nodes(nodes)
-    gs.upsert_relations(rels)
-    return gs
+    # built on first use: it connects (and reads the schema) on construction,
+    # which the in-memory backend never needs
+    return Neo4jPropertyGraphStore(
+        url=_cfg.NEO4J_URI,
+        username=_cfg.NEO4J_USER,
+        password=_cfg.NEO4J_PASSWORD,
+        database=_cfg.NEO4J_DATABASE,
+        **_pool_kwargs(),
+    )
+
+
+# --------------------------------------------------------------------------- #
+# Native bulk loader.  Writes the same shape llama-index does
+# (:__Node__ {id} + :__Entity__ + :entity|:range|:block, `name`, DEPENDS_ON) so
+# Neo4jPropertyGraphStore / TextToCypherRetriever keep working on top of it.
+_SCHEMA = [
+    f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:{BASE_NODE_LABEL}) REQUIRE n.id IS UNIQUE",
+    "CREATE CONSTRAINT entity_name IF NOT EXISTS FOR (n:entity) REQUIRE n.name IS UNIQUE",
+    "CREATE CONSTRAINT range_name IF NOT EXISTS FOR (n:range) REQUIRE n.name IS UNIQUE",
+    "CREATE CONSTRAINT block_name IF NOT EXISTS FOR (n:block) REQUIRE n.name IS UNIQUE",
+    f"CREATE INDEX entity_base_name IF NOT EXISTS FOR (n:{BASE_ENTITY_LABEL}) ON (n.name)",
+    "CREATE INDEX range_sheet IF NOT EXISTS FOR (n:range) ON (n.sheet)",
+]
+
+# {op} is MERGE for upserts, CREATE for a load into a freshly cleared DB
+_LOAD_CELLS = f"""
+    UNWIND $rows AS id
+    {{op}} (n:{BASE_NODE_LABEL} {{{{id: id}}}})
+    SET n.name = id, n:{BASE_ENTITY_LABEL}:entity
+"""
+_LOAD_RANGES = f"""
+    UNWIND $rows AS row
+    {{op}} (n:{BASE_NODE_LABEL} {{{{id: row.id}}}})
+    SET n += row.props, n.name = row.id, n:{BASE_ENTITY_LABEL}:range
+"""
+_LOAD_BLOCKS = f"""
+    UNWIND $rows AS row
+    {{op}} (n:{BASE_NODE_LABEL} {{{{id: row.id}}}})
+    SET n += row.props, n.name = row.id, n:{BASE_ENTITY_LABEL}:block
+"""
+_LOAD_EDGES = f"""
+    UNWIND $rows AS row
+    MATCH (a:{BASE_NODE_LABEL} {{{{id: row[0]}}}})
+    MATCH (b:{BASE_NODE_LABEL} {{{{id: row[1]}}}})
+    {{op}} (a)-[:DEPENDS_ON]->(b)
+"""
+
+
+def ensure_schema():
+    """Uniqueness constraints + indexes on `name`/`id`; cheap when present."""
+    with driver().session(database=_cfg.NEO4J_DATABASE) as ses:
+        for stmt in _SCHEMA:
+            ses.run(stmt).consume()
+
+
+def _node_rows(G, nodes):
+    """Split node ids into cell ids and {id, props} range and block rows."""
+    cells, ranges, blocks = [], [], []
+    for n in nodes:
+        data = G.nodes[n]
+        kind = data.get("kind")
+        if kind is None:
+            cells.append(n)
+            continue
+        # symbolic range / block: keep bounds (and a block's anchor formula)
+        # so membership is a comparison and the template can be rebuilt
+        props = {k: v for k, v in data.items() if k != "kind"}
+        (ranges if kind == "range" else blocks).append({"id": n, "props": props})
+    return cells, ranges, blocks
+
+
+def _batches(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _write_batched(ses, cypher, rows, size, label):
+    t0 = time.perf_counter()
+    for batch in _batches(rows, size):
+        with stage(f"upsert_{label}"):
+            ses.execute_write(lambda tx, b=batch: tx.run(cypher, rows=b).consume())
+        NEO4J_ROWS.inc(len(batch), kind=label)
+    if rows:
+        log.debug("Upserted %d %s", len(rows), label)     # per-batch timings: upsert_* stages
+    return time.perf_counter() - t0
+
+
+def upsert_graph(nx_graph, fresh: bool = False, batch_size: int | None = None) -> dict:
+    """
+    Stream the graph into Neo4j as batched `UNWIND $rows …` transactions of
+    `batch_size` rows (default NEO4J_BATCH_SIZE).  With `fresh=True` the
+    caller has just run `clear_db()` and nodes/edges are CREATEd instead of
+    MERGEd.  Returns counts and per-phase timings.
+    """
+    size = batch_size or _cfg.NEO4J_BATCH_SIZE
+    op = "CREATE" if fresh else "MERGE"
+    ensure_schema()
+    cells, ranges, blocks = _node_rows(nx_graph, nx_graph.nodes)
+    edges = list(nx_graph.edges)
+    with driver().session(database=_cfg.NEO4J_DATABASE) as ses:
+        t_cells = _write_batched(ses, _LOAD_CELLS.format(op=op), cells, size, "cells")
+        t_ranges = _write_batched(ses, _LOAD_RANGES.format(op=op), ranges, size, "ranges")
+        t_blocks = _write_batched(ses, _LOAD_BLOCKS.format(op=op), blocks, size, "blocks")
+        t_edges = _write_batched(ses, _LOAD_EDGES.format(op=op), edges, size, "edges")
+    return {
+        "cells": len(cells), "ranges": len(ranges), "blocks": len(blocks), "edges": len(edges),
+        "seconds": {"cells": t_cells, "ranges": t_ranges, "blocks": t_blocks, "edges": t_edges},
+    }
+
+
+# --------------------------------------------------------------------------- #
+# Incremental sync: apply only what changed between two ingests, with the same
+# labels/properties llama-index writes (__Node__ {id}, __Entity__, name).
+def diff_graphs(old, new, keep: Callable[[str], bool] | None = None) -> dict:
+    """
+    Nodes/edges added and removed going from graph `old` to graph `new`.
+    Nodes for which `keep` is true are never removed (another workbook's
+    graph in the same store still holds them).
+    """
+    return {
+        "added_nodes":   [n for n in new.nodes if n not in old],
+        "removed_nodes": [n for n in old.nodes if n not in new and not (keep and keep(n))],
+        "added_edges":   [e for e in new.edges if not old.has_edge(*e)],
+        "removed_edges": [e for e in old.edges if not new.has_edge(*e)],
+    }
+
+
+def _apply_diff(tx, diff, new):
+    tx.run(f"""
+        UNWIND $rows AS row
+        MATCH (:{BASE_NODE_LABEL} {{id: row[0]}})-[r:DEPENDS_ON]->(:{BASE_NODE_LABEL} {{id: row[1]}})
+        DELETE r
+    """, rows=diff["removed_edges"])
+    tx.run(f"""
+        UNWIND $ids AS id
+        MATCH (n:{BASE_NODE_LABEL} {{id: id}})
+        DETACH DELETE n
+    """, ids=diff["removed_nodes"])
+    cells, ranges, blocks = _node_rows(new, diff["added_nodes"])
+    tx.run(_LOAD_CELLS.format(op="MERGE"), rows=cells)
+    tx.run(_LOAD_RANGES.format(op="MERGE"), rows=ranges)
+    tx.run(_LOAD_BLOCKS.format(op="MERGE"), rows=blocks)
+    tx.run(_LOAD_EDGES.format(op="MERGE"), rows=diff["added_edges"])
+
+
+def sync_graph(old, new, keep: Callable[[str], bool] | None = None) -> dict:
+    """
+    Bring Neo4j from `old` (what was last loaded) to `new` in one write
+    transaction.  Untouched nodes keep their properties (e.g. colours set via
+    /run), and readers never see an empty graph.  Returns the diff applied.
+    """
+    diff = diff_graphs(old, new, keep)
+    if any(diff.values()):
+        with stage("neo4j_sync"), driver().session(database=_cfg.NEO4J_DATABASE) as ses:
+            ses.execute_write(_apply_diff, diff, new)
+    return diff
+
+
+# --------------------------------------------------------------------------- #
+# Pluggable backends.  Everything that reads or replaces the dependency graph
+# (CLI, watcher, API, query engine) goes through `backend()`; GRAPH_BACKEND
+# picks Neo4j or the embedded in-memory store (src/memory_store.py).
+class Walk(NamedTuple):
+    """What the shared walks need from a backend: its indexes and one-hop steps."""
+    index: RangeIndex
+    formulas: CellIndex
+    blocks: BlockIndex
+    dependents_step: Callable   # (cells, ranges) -> direct dependents
+    precedents_step: Callable   # (names) -> direct precedents
+
+
+class GraphBackend(ABC):
+    """
+    The graph operations the rest of the app relies on.  Backends implement
+    the abstract methods (a missing one fails at construction); the walks,
+    impact cache and viewer helpers on top are shared.
+    """
+
+    name = "?"
+
+    def __init__(self):
+        self.impact = ImpactCache(_cfg.IMPACT_CACHE_MB << 20)
+
+    @abstractmethod
+    def load(self, G, fresh: bool = False) -> dict:
+        """Replace (fresh) or upsert the whole graph `G`."""
+
+    @abstractmethod
+    def sync(self, old, new, keep: Callable[[str], bool] | None = None) -> dict:
+        """
+        Apply the diff between two ingests; returns it.  With `keep`, `new`
+        is one workbook among several in the store (see `diff_graphs`).
+        """
+
+    @abstractmethod
+    def clear(self):
+        """Remove every node and edge."""
+
+    def refresh(self):
+        """Another process changed the graph: drop anything cached."""
+
+    def dependents(self, cell: str) -> list[str]:
+        """Transitive dependents, memoised per graph version.  AddressError for a non-cell."""
+        cell_coords(cell)
+        return self.impact.get(cell, self._dependents)
+
+    @abstractmethod
+    def _walk(self):
+        """Context manager yielding a `Walk` over the current graph."""
+
+    def _dependents(self, cell: str) -> list[str]:
+        with stage("dependents"), self._walk() as w:
+            return walk_dependents(cell, w.index, w.dependents_step, w.blocks)
+
+    @abstractmethod
+    def _reader_counts(self) -> tuple[dict, dict]:
+        """
+        ({input cell: formula cells reading it by an edge of its own},
+        {range: formula cells reading it}); edges into blocks are left out,
+        since `BlockIndex.reader_count` counts their member cells.
+        """
+
+    def hot_inputs(self, n: int) -> list[str]:
+        """
+        The `n` input (non-formula) cells read by the most formula cells,
+        directly or through the ranges and blocks covering them.
+        """
+        direct, via_range = self._reader_counts()
+        with self._walk() as w:
+            def score(c):
+                coords = cell_coords(c)
+                return (direct[c] + w.blocks.reader_count(*coords)
+                        + sum(via_range.get(r, 0) for r in w.index.containing(*coords)))
+
+            # block members have no incoming edges yet are formulas
+            scored = ((score(c), c) for c in direct if not w.blocks.covers(*cell_coords(c)))
+            return [c for refs, c in heapq.nlargest(n, scored) if refs]
+
+    def warm(self, n: int | None = None):
+        """Precompute impacts for the hottest inputs so dashboards hit the cache."""
+        for cell in self.hot_inputs(n or _cfg.IMPACT_WARM_TOP):
+            self.dependents(cell)
+
+    def precedents(self, cell: str) -> list[str]:
+        cell_coords(cell)
+        with self._walk() as w:
+            return walk_precedents(cell, w.formulas, w.precedents_step, w.blocks)
+
+    def dependency_path(self, src: str, dst: str) -> list[str]:
+        """Shortest chain of direct reads from `src` to `dst`; [] if `dst` doesn't depend on it."""
+        cell_coords(src), cell_coords(dst)
+        with self._walk() as w:
+            return walk_path(src, dst, w.index, w.dependents_step, w.precedents_step, w.blocks)
+
+    @abstractmethod
+    def sheet_cells(self, sheet: str) -> list[str]:
+        """Cell nodes on `sheet` (block members only if something refers to them)."""
+
+    def cells(self, sheet: str, formulas_only: bool = False) -> list[str]:
+        """Cells on `sheet` in row-major order, block members included."""
+        with self._walk() as w:
+            bounds = (sheet, 1, MAX_ROW, 1, MAX_COL)
+            out = set(w.formulas.within(*bounds) + w.blocks.within(*bounds))
+        if not formulas_only:
+            out.update(self.sheet_cells(sheet))
+        return sorted(out, key=lambda c: cell_coords(c)[1:])
+
+    def references(self, ref: str) -> list[str]:
+        """Formula cells that read any cell of `ref` (a cell or range address) directly."""
+        sheet, r0, r1, c0, c1 = range_bounds(ref)
+        inside = [c for c in self.sheet_cells(sheet)
+                  if r0 <= cell_coords(c)[1] <= r1 and c0 <= cell_coords(c)[2] <= c1]
+        with self._walk() as w:
+            out = set(w.dependents_step(inside, w.index.overlapping(sheet, r0, r1, c0, c1)))
+            for c in inside:
+                out.update(w.blocks.readers(*cell_coords(c)))
+            out = {c for c in out if c not in w.blocks}
+        return sorted(out)
+
+    def counts(self, sheet: str | None = None) -> dict:
+        """{"cells", "formulas", "ranges", "blocks", "edges"} for the workbook or one sheet."""
+        with self._walk() as w:
+            formulas = w.formulas.count(sheet) + w.blocks.count(sheet)
+        return {**self._counts(sheet), "formulas": formulas}
+
+    @abstractmethod
+    def _counts(self, sheet: str | None) -> dict:
+        """Node counts by kind, and edges into nodes, on `sheet` (or everywhere)."""
+
+    def highlight(self, cells, color: str | None) -> list[str]:
+        """
+        Set (None: clear) the viewer colour of `cells`; members of a block
+        that nothing refers to colour their block node instead.  Returns
+        the nodes changed.
+        """
+        names = set(cells)
+        with self._walk() as w:
+            for c in cells:
+                names.update(w.blocks.containing(*cell_coords(c)))
+        return self.set_color(sorted(names), color)
+
+    @abstractmethod
+    def set_color(self, names: list[str], color: str | None) -> list[str]:
+        """Set the `color` property of existing nodes; returns those that matched."""
+
+    @abstractmethod
+    def clear_colors(self, sheet: str | None = None) -> list[str]:
+        """Unset the `color` of every coloured node (on `sheet` only, if given); returns those cleared."""
+
+    @abstractmethod
+    def subgraph(self):
+        """
+        ([{"id", "color", "is_range", "is_block"}, …], [(source, target), …]) for the
+        viewer.
+        """
+
+    @abstractmethod
+    def labels(self) -> dict:
+        """{"nodeLabels": […], "relTypes": […]} for the viewer legend."""
+
+    # paged viewer reads (src/viewport.py); nodes are `subgraph`-shaped dicts
+    @abstractmethod
+    def nodes(self, names: list[str]) -> list[dict]:
+        """The nodes among `names` that exist."""
+
+    @abstractmethod
+    def node_page(self, sheet: str | None, after: str, limit: int) -> list[dict]:
+        """Up to `limit` nodes (on `sheet`) named after `after`, in name order."""
+
+    @abstractmethod
+    def edges_of(self, names: list[str], fanout: int) -> list[tuple[str, str]]:
+        """Stored edges into and out of `names`, at most `fanout` each way per node."""
+
+    def containers(self, cells: list[str]) -> list[tuple[str, str]]:
+        """(cell, range or block) for every range / block node each of `cells` lies inside."""
+        out = []
+        with self._walk() as w:
+            for c in cells:
+                if ":" in c:
+                    continue
+                coords = cell_coords(c)
+                out.extend((c, r) for r in w.index.containing(*coords) + w.blocks.containing(*coords))
+        return out
+
+    # async handlers await these; stores without native async just answer inline
+    async def asubgraph(self):
+        return self.subgraph()
+
+    async def alabels(self) -> dict:
+        return self.labels()
+
+
+# Range containment is answered in-process by a RangeIndex.  Whoever loads the
+# graph builds it from the parsed dependencies; any other process (API, CLI
+# `impact`) pulls the range bounds from Neo4j once.
+_RANGES_CYPHER = """
+MATCH (r:range)
+RETURN r.name AS name, r.sheet AS sheet, r.min_row AS min_row,
+       r.max_row AS max_row, r.min_col AS min_col, r.max_col AS max_col
+"""
+_FORMULAS_CYPHER = "MATCH ()-[:DEPENDS_ON]->(c:entity) RETURN DISTINCT c.name AS name"
+_BLOCKS_CYPHER = """
+MATCH (b:block)
+RETURN b.name AS name, b.sheet AS sheet, b.min_row AS min_row, b.max_row AS max_row,
+       b.min_col AS min_col, b.max_col AS max_col, b.formula AS formula
+"""
+
+# One BFS level: direct edges out of the frontier cells and out of every range
+# the index says contains one of them.  Neo4j only does name lookups.
+_DEPENDENTS_STEP = """
+UNWIND $cells AS n
+MATCH (:entity {name: n})-[:DEPENDS_ON]->(d:entity)
+RETURN DISTINCT d.name AS name
+UNION
+UNWIND $ranges AS n
+MATCH (:range {name: n})-[:DEPENDS_ON]->(d:entity)
+RETURN DISTINCT d.name AS name
+"""
+_INPUT_READERS_CYPHER = """
+MATCH (c:entity) WHERE NOT ()-[:DEPENDS_ON]->(c)
+OPTIONAL MATCH (c)-[:DEPENDS_ON]->(d:entity)
+RETURN c.name AS name, count(d) AS refs
+"""
+_RANGE_READERS_CYPHER = """
+MATCH (r:range)-[:DEPENDS_ON]->(d:entity)
+RETURN r.name AS name, count(d) AS refs
+"""
+_PRECEDENTS_STEP = """
+UNWIND $names AS n
+MATCH (p)-[:DEPENDS_ON]->(:entity {name: n})
+RETURN DISTINCT p.name AS name
+"""
+
+# Cell names start with their sheet, so these stay on the name indexes.
+_SHEET_CELLS_CYPHER = """
+MATCH (c:entity) WHERE c.name STARTS WITH $prefix
+RETURN c.name AS name
+"""
+_COUNTS_CYPHER = """
+MATCH (n) WHERE (n:entity OR n:range OR n:block)
+  AND ($prefix IS NULL OR n.name STARTS WITH $prefix)
+RETURN count(CASE WHEN n:entity THEN 1 END) AS cells,
+       count(CASE WHEN n:range THEN 1 END) AS ranges,
+       count(CASE WHEN n:block THEN 1 END) AS blocks,
+       sum(size([(n)<-[:DEPENDS_ON]-() | 1])) AS edges
+"""
+_SET_COLOR_CYPHER = f"""
+UNWIND $names AS n
+MATCH (c:{BASE_ENTITY_LABEL} {{name: n}})
+SET c.color = $color
+RETURN collect(c.name) AS names
+"""
+
+# $prefix is 'Sheet!' or null; the rest of the name must hold no further '!'
+# so sheet 'A' doesn't take in a sheet called 'A!B'
+_CLEAR_COLORS_CYPHER = f"""
+MATCH (c:{BASE_ENTITY_LABEL})
+WHERE c.color IS NOT NULL
+  AND ($prefix IS NULL OR (c.name STARTS WITH $prefix
+                           AND NOT substring(c.name, size($prefix)) CONTAINS '!'))
+SET c.color = null
+RETURN collect(c.name) AS names
+"""
+
+# Paged viewer reads: every node carries __Entity__, whose name index serves
+# both the keyset page (name > $after, in name order) and the lookups.
+_NODE_FIELDS = "n.name AS id, n.color AS color, n:range AS is_range, n:block AS is_block"
+_NODES_BY_NAME_CYPHER = f"""
+UNWIND $names AS name
+MATCH (n:{BASE_ENTITY_LABEL} {{name: name}})
+RETURN {_NODE_FIELDS}
+"""
+_NODE_PAGE_CYPHER = f"""
+MATCH (n:{BASE_ENTITY_LABEL})
+WHERE n.name > $after AND ($prefix IS NULL OR n.name STARTS WITH $prefix)
+RETURN {_NODE_FIELDS}
+ORDER BY n.name LIMIT $limit
+"""
+_EDGES_OF_CYPHER = f"""
+UNWIND $names AS name
+MATCH (n:{BASE_ENTITY_LABEL} {{name: name}})
+CALL {{
+    WITH n MATCH (n)-[:DEPENDS_ON]->(m) RETURN n.name AS source, m.name AS target LIMIT $fanout
+    UNION
+    WITH n MATCH (m)-[:DEPENDS_ON]->(n) RETURN m.name AS source, n.name AS target LIMIT $fanout
+}}
+RETURN source, target
+"""
+
+_NODES_CYPHER = """
+MATCH (n) WHERE n:entity OR n:range OR n:block
+RETURN n.name AS id, n.color AS color, n:range AS is_range, n:block AS is_block
+"""
+_EDGES_CYPHER = """
+MATCH (a)-[:DEPENDS_ON]->(b) WHERE b:entity OR b:block
+RETURN a.name AS source, b.name AS target
+"""
+_LABELS_CYPHER = """
+MATCH (n) RETURN DISTINCT labels(n) AS labs
+UNION
+MATCH ()-[r]->() RETURN DISTINCT type(r) AS labs
+"""
+
+
+def _labels_from(values) -> dict:
+    nodes, rels = set(), set()
+    for v in values:
+        if isinstance(v, list):
+            nodes.update(v)
+        else:
+            rels.add(v)
+    return {"nodeLabels": sorted(nodes), "relTypes": sorted(rels)}
+
+
+class Neo4jBackend(GraphBackend):
+    name = "neo4j"
+
+    def __init__(self):
+        super().__init__()
+        self._index = None      # RangeIndex
+        self._formulas = None   # CellIndex
+        self._blocks = None     # BlockIndex
+
+    def _session(self):
+        return driver().session(database=_cfg.NEO4J_DATABASE)
+
+    def load(self, G, fresh=False):
+        if fresh:
+            clear_db()
+        stats = upsert_graph(G, fresh=fresh)
+        # we just parsed every range, so index them now instead of re-reading Neo4j
+        self._index = RangeIndex.from_graph(G)
+        self._formulas = CellIndex.from_graph(G)
+        self._blocks = BlockIndex.from_graph(G)
+        self.impact.invalidate()
+        return stats
+
+    def sync(self, old, new, keep=None):
+        diff = sync_graph(old, new, keep)
+        if not any(diff.values()):
+            return diff
+        if keep is None:
+            self._index = RangeIndex.from_graph(new)
+            self._formulas = CellIndex.from_graph(new)
+            self._blocks = BlockIndex.from_graph(new)
+            self.impact.invalidate()
+        else:
+            self.refresh()      # `new` is only part of the store: re-read on demand
+        return diff
+
+    def clear(self):
+        clear_db()
+        self.refresh()
+
+    def refresh(self):
+        self._index = self._formulas = self._blocks = None
+        self.impact.invalidate()
+
+    def range_index(self) -> RangeIndex:
+        if self._index is None:
+            with self._session() as ses:
+                self._index = RangeIndex(tuple(rec.values()) for rec in ses.run(_RANGES_CYPHER))
+        return self._index
+
+    def formula_index(self) -> CellIndex:
+        if self._formulas is None:
+            with self._session() as ses:
+                self._formulas = CellIndex(rec["name"] for rec in ses.run(_FORMULAS_CYPHER))
+        return self._formulas
+
+    def block_index(self) -> BlockIndex:
+        if self._blocks is None:
+            with self._session() as ses:
+                self._blocks = BlockIndex(tuple(rec.values()) for rec in ses.run(_BLOCKS_CYPHER))
+        return self._blocks
+
+    @contextmanager
+    def _walk(self):
+        """
+        Walks take one round-trip per BFS level on a single session; the
+        in-process indexes decide which ranges and blocks are involved.
+        """
+        w = (self.range_index(), self.formula_index(), self.block_index())
+        with self._session() as ses:
+            def dependents_step(cells, ranges):
+                return [r["name"] for r in ses.run(_DEPENDENTS_STEP, cells=cells, ranges=ranges)]
+
+            def precedents_step(names):
+                return [r["name"] for r in ses.run(_PRECEDENTS_STEP, names=names)]
+
+            yield Walk(*w, dependents_step, precedents_step)
+
+    def _reader_counts(self):
+        with self._session() as ses:
+            direct = {rec["name"]: rec["refs"] for rec in ses.run(_INPUT_READERS_CYPHER)}
+            via_range = {rec["name"]: rec["refs"] for rec in ses.run(_RANGE_READERS_CYPHER)}
+        return direct, via_range
+
+    def sheet_cells(self, sheet):
+        with self._session() as ses:
+            names = [r["name"] for r in ses.run(_SHEET_CELLS_CYPHER, prefix=f"{sheet}!")]
+        return [c for c in names if c.rsplit("!", 1)[0] == sheet]
+
+    def _counts(self, sheet):
+        prefix = None if sheet is None else f"{sheet}!"
+        with self._session() as ses:
+            return ses.run(_COUNTS_CYPHER, prefix=prefix).single().data()
+
+    def set_color(self, names, color):
+        with self._session() as ses:
+            return ses.execute_write(
+                lambda tx: tx.run(_SET_COLOR_CYPHER, names=names, color=color).single()["names"])
+
+    def clear_colors(self, sheet=None):
+        prefix = None if sheet is None else f"{sheet}!"
+        with self._session() as ses:
+            return ses.execute_write(
+                lambda tx: tx.run(_CLEAR_COLORS_CYPHER, prefix=prefix).single()["names"])
+
+    def nodes(self, names):
+        with self._session() as ses:
+            return [rec.data() for rec in ses.run(_NODES_BY_NAME_CYPHER, names=names)]
+
+    def node_page(self, sheet, after, limit):
+        prefix = None if sheet is None else f"{sheet}!"
+        with self._session() as ses:
+            rows = [rec.data() for rec in ses.run(_NODE_PAGE_CYPHER, after=after, prefix=prefix, limit=limit)]
+        return [r for r in rows if sheet is None or r["id"].rsplit("!", 1)[0] == sheet]
+
+    def edges_of(self, names, fanout):
+        with self._session() as ses:
+            return [tuple(rec.values()) for rec in ses.run(_EDGES_OF_CYPHER, names=names, fanout=fanout)]
+
+    def subgraph(self):
+        with self._session() as ses:
+            nodes = [rec.data() for rec in ses.run(_NODES_CYPHER)]
+            edges = [tuple(rec.values()) for rec in ses.run(_EDGES_CYPHER)]
+        return nodes, edges
+
+    def labels(self):
+        with self._session() as ses:
+            return _labels_from(rec["labs"] for rec in ses.run(_LABELS_CYPHER))
+
+    async def asubgraph(self):
+        async with async_driver().session(database=_cfg.NEO4J_DATABASE) as ses:
+            nodes = [rec.data() async for rec in await ses.run(_NODES_CYPHER)]
+            edges = [tuple(rec.values()) async for rec in await ses.run(_EDGES_CYPHER)]
+        return nodes, edges
+
+    async def alabels(self):
+        async with async_driver().session(database=_cfg.NEO4J_DATABASE) as ses:
+            return _labels_from([rec["labs"] async for rec in await ses.run(_LABELS_CYPHER)])
+
+
+@lru_cache(maxsize=1)
+def backend() -> GraphBackend:
+    """The process-wide backend selected by GRAPH_BACKEND."""
+    if _cfg.GRAPH_BACKEND == "memory":
+        from .memory_store import MemoryBackend
+        return MemoryBackend(_cfg.GRAPH_SNAPSHOT)
+    return Neo4jBackend()
@@ -0,0 +1,69 @@
+# src/impact_cache.py
+"""
+Memoised “what breaks if I change X?” answers.
+
+Entries are keyed by (graph version, cell).  The owning backend bumps the
+version whenever the graph changes (load, non-empty sync, /run write,
+/notify_update), which drops every entry at once, so a cached answer is
+never served for a graph it wasn't computed on.  Within a version entries
+are evicted least-recently-used once their estimated size passes the cap.
+"""
+
+import sys, threading
+from collections import OrderedDict
+
+
+def _sizeof(cells: list[str]) -> int:
+    return sys.getsizeof(cells) + sum(sys.getsizeof(c) for c in cells)
+
+
+class ImpactCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.version = 0
+        self.bytes = 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()   # (version, cell) -> (result, size)
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """The graph changed: start a new version and drop everything."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self.bytes = 0
+
+    def get(self, cell: str, compute):
+        """Cached `compute(cell)` for the current graph version."""
+        with self._lock:
+            version = self.version
+            hit = self._entries.get((version, cell))
+            if hit is not None:
+                self._entries.move_to_end((version, cell))
+                self.hits += 1
+                return hit[0]
+            self.misses += 1
+        # compute outside the lock: walks can take a while
+        result = compute(cell)
+        self._put(version, cell, result)
+        return result
+
+    def _put(self, version, cell, result):
+        size = _sizeof(result)
+        with self._lock:
+            # computed against a graph that has since changed, or too big to keep
+            if version != self.version or size > self.max_bytes:
+                return
+            key = (version, cell)
+            if key in self._entries:
+                return
+            self._entries[key] = (result, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, old) = self._entries.popitem(last=False)
+                self.bytes -= old
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"version": self.version, "entries": len(self._entries),
+                    "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
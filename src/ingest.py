@@ -1,9 +1,18 @@
 # ingest.py
 
+import hashlib
 from openpyxl import load_workbook
 from openpyxl.utils import range_boundaries, get_column_letter
+from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+from openpyxl.utils.exceptions import CellCoordinatesException
 import networkx as nx
-from .parser import extract_dependencies
+from .parser import MAX_COL, MAX_ROW, extract_dependencies, dependency_template, place, place_template, to_r1c1
+from .refs import RefResolver
+from .parse_cache import SheetCache, sheet_key
+from .metrics import CELLS, SHEETS, stage
+
+# runs of a filled formula shorter than this stay plain per-cell edges
+BLOCK_MIN_CELLS = 3
 
 def expand_range(start: str, end: str):
     """Given "A1","B3" returns all cells in that rectangle."""
@@ -15,41 +24,367 @@ def expand_range(start: str, end: str):
             cells.append(f"{letter}{row}")
     return cells
 
-def build_nx_graph(path: str) -> nx.DiGraph:
+def book_of(sheet: str) -> str:
+    """'[Budget.xlsx]Sheet1' -> '[Budget.xlsx]'; '' for a sheet with no workbook prefix."""
+    return sheet[:sheet.index("]") + 1] if sheet.startswith("[") else ""
+
+def qualify(ref_sheet: str | None, sheet: str) -> str:
+    """
+    Graph sheet meant by a ref's sheet part when written on `sheet`: the
+    host itself when unqualified, another sheet of the host's workbook
+    unless the ref names a workbook of its own ('[Budget.xlsx]Sheet1').
+    """
+    if ref_sheet is None:
+        return sheet
+    return ref_sheet if ref_sheet.startswith("[") else book_of(sheet) + ref_sheet
+
+class AddressError(ValueError):
+    """An address the graph can't name: no sheet, or not a cell / range on one."""
+
+def _split(name: str):
+    sheet, bang, coord = name.rpartition("!")
+    if not sheet:
+        raise AddressError(f"{name!r} names no sheet; write it as Sheet!{coord or 'A1'}")
+    return sheet, coord
+
+def cell_coords(name: str):
+    """'Sheet!B3' -> ('Sheet', 3, 2)  (sheet, row, col); AddressError for anything else."""
+    sheet, coord = _split(name)
+    try:
+        letters, row = coordinate_from_string(coord)
+        col = column_index_from_string(letters)
+    except (ValueError, CellCoordinatesException):
+        raise AddressError(f"{name!r} is not a cell address")
+    if row > MAX_ROW or col > MAX_COL:
+        raise AddressError(f"{name!r} is off the sheet")
+    return sheet, row, col
+
+def _ordered_bounds(coord: str):
+    """'B3:A1' / 'C:A' / '5:3' -> (min_row, max_row, min_col, max_col), whole axes filled in."""
+    try:
+        min_col, min_row, max_col, max_row = range_boundaries(coord)
+    except (ValueError, TypeError):
+        raise AddressError(f"{coord!r} is not a cell or range address")
+    min_row, max_row = (1, MAX_ROW) if min_row is None else sorted((min_row, max_row))
+    min_col, max_col = (1, MAX_COL) if min_col is None else sorted((min_col, max_col))
+    return min_row, max_row, min_col, max_col
+
+def range_name(sheet: str, min_row: int, max_row: int, min_col: int, max_col: int) -> str:
+    """
+    Canonical id of a rectangle: 'Sheet!A1:B3', or 'Sheet!A:B' / 'Sheet!3:5'
+    when it spans every row / every column.
+    """
+    if (min_row, max_row) == (1, MAX_ROW):
+        return f"{sheet}!{get_column_letter(min_col)}:{get_column_letter(max_col)}"
+    if (min_col, max_col) == (1, MAX_COL):
+        return f"{sheet}!{min_row}:{max_row}"
+    return (f"{sheet}!{get_column_letter(min_col)}{min_row}"
+            f":{get_column_letter(max_col)}{max_row}")
+
+def range_node(sheet: str, start: str, end: str):
+    """
+    Canonical node for the rectangle start:end on `sheet`.
+    Returns (node_id, attrs); the id is 'Sheet!A1:B3' with corners ordered.
+    Whole columns (A:C) and rows (3:5) stay one symbolic node whose bounds
+    run to the sheet edge — nothing is expanded per cell; `build_nx_graph`
+    clips them to the used rectangle once every sheet is read.
+    """
+    min_row, max_row, min_col, max_col = _ordered_bounds(f"{start}:{end}")
+    return range_name(sheet, min_row, max_row, min_col, max_col), dict(
+        kind="range", sheet=sheet,
+        min_row=min_row, max_row=max_row,
+        min_col=min_col, max_col=max_col)
+
+def range_bounds(name: str):
+    """'Sheet!A1:B3' -> ('Sheet', min_row, max_row, min_col, max_col)."""
+    sheet, coord = _split(name)
+    return (sheet, *_ordered_bounds(coord))
+
+def _carve(bounds, row: int, col: int):
+    """
+    The rectangle `bounds` (min_row, max_row, min_col, max_col) less the
+    cell (row, col): itself when the cell is outside, else up to four
+    pieces — the rows above and below, and the cells left and right of it.
+    """
+    r0, r1, c0, c1 = bounds
+    if not (r0 <= row <= r1 and c0 <= col <= c1):
+        return [bounds]
+    pieces = [(r0, row - 1, c0, c1), (row + 1, r1, c0, c1), (row, row, c0, col - 1), (row, row, col + 1, c1)]
+    return [(a, b, c, d) for a, b, c, d in pieces if a <= b and c <= d]
+
+def _add_dep_edges(G: nx.DiGraph, sheet: str, dst: str, deps):
+    """
+    Add PRECEDENT → `dst` edges for `extract_dependencies`-style `deps`.
+    Ranges are kept symbolic: one `range` node per distinct rectangle and a
+    single RANGE → `dst` edge, so edge count tracks formulas, not area.
+
+    A range holding `dst` itself (A5 = SUM(A1:A10), a circular reference
+    in Excel) is carved around it, so `dst` never feeds itself and walks
+    stay acyclic: A1:A4 → A5 and A6:A10 → A5.
+    """
+    host = None
+    for sheet_ref, coord in deps:
+        ref_sheet = qualify(sheet_ref, sheet)
+        if ":" in coord:
+            start, end = coord.split(":")
+            rid, attrs = range_node(ref_sheet, start, end)
+            if ref_sheet == sheet:
+                host = host or cell_coords(dst)[1:]
+                bounds = (attrs["min_row"], attrs["max_row"], attrs["min_col"], attrs["max_col"])
+                pieces = _carve(bounds, *host)
+                if pieces != [bounds]:
+                    for r0, r1, c0, c1 in pieces:
+                        G.add_edge(_add_range(G, sheet, r0, r1, c0, c1), dst)
+                    continue
+            if rid not in G:
+                G.add_node(rid, **attrs)
+            G.add_edge(rid, dst)
+        else:
+            src = f"{ref_sheet}!{coord}"
+            if src != dst:
+                G.add_edge(src, dst)
+
+# ──────────────────────────────────────────────────────────────
+# Shared-formula blocks.  A rectangle of cells holding one formula filled
+# down/right (same R1C1 form) becomes a single `block` node instead of
+# per-cell edges.  The block keeps its anchor (top-left) formula, from which
+# the template — and so each member cell's exact refs — is recovered; every
+# template ref contributes one edge from the region it sweeps over the
+# block (a cell for absolute refs, a `range` node otherwise).
+# ──────────────────────────────────────────────────────────────
+def block_node(sheet: str, min_row: int, max_row: int, min_col: int, max_col: int, formula: str):
+    """
+    Canonical node for a filled block.  Returns (node_id, attrs); the id is
+    'Sheet!D2:D900#<hash>' — bounds plus a digest of the R1C1 form, so a
+    block whose formula changes gets a new node rather than stale edges.
+    """
+    key = to_r1c1(formula, min_row, min_col)
+    digest = hashlib.blake2b(key.encode(), digest_size=4).hexdigest()
+    name = (f"{sheet}!{get_column_letter(min_col)}{min_row}"
+            f":{get_column_letter(max_col)}{max_row}#{digest}")
+    return name, dict(kind="block", sheet=sheet, formula=formula,
+                      min_row=min_row, max_row=max_row,
+                      min_col=min_col, max_col=max_col)
+
+def swept_bounds(corners, min_row, max_row, min_col, max_col):
+    """
+    (min_row, max_row, min_col, max_col) a template ref with these corners
+    covers across a block — corners move monotonically with the host cell,
+    so placing them at the two extreme cells is enough.
+    """
+    pts = [place(k, r, c) for k in corners for r, c in ((min_row, min_col), (max_row, max_col))]
+    # a None axis is a whole column / row ref: it spans the sheet
+    rows = [v for r, _ in pts for v in ((1, MAX_ROW) if r is None else (min(max(r, 1), MAX_ROW),))]
+    cols = [v for _, c in pts for v in ((1, MAX_COL) if c is None else (min(max(c, 1), MAX_COL),))]
+    return min(rows), max(rows), min(cols), max(cols)
+
+def _add_range(G: nx.DiGraph, sheet: str, r0: int, r1: int, c0: int, c1: int) -> str:
+    """Node of a swept / carved rectangle, created if new; a plain cell when it is one."""
+    if (r0, c0) == (r1, c1):
+        return f"{sheet}!{get_column_letter(c0)}{r0}"
+    rid = range_name(sheet, r0, r1, c0, c1)
+    if rid not in G:
+        G.add_node(rid, kind="range", sheet=sheet, min_row=r0, max_row=r1, min_col=c0, max_col=c1)
+    return rid
+
+def _add_block(G: nx.DiGraph, sheet: str, min_row, max_row, min_col, max_col, formula):
+    bid, attrs = block_node(sheet, min_row, max_row, min_col, max_col, formula)
+    G.add_node(bid, **attrs)
+    for ref_sheet, a, b in dependency_template(formula, min_row, min_col):
+        ref_sheet = qualify(ref_sheet, sheet)
+        r0, r1, c0, c1 = swept_bounds([k for k in (a, b) if k], min_row, max_row, min_col, max_col)
+        G.add_edge(_add_range(G, ref_sheet, r0, r1, c0, c1), bid)
+
+def _emit_runs(G: nx.DiGraph, sheet: str, runs, min_cells: int):
+    """
+    `runs`: (key, formula, col, first_row, last_row) vertical runs of one
+    R1C1 form.  Side-by-side runs with equal rows and key merge into one
+    rectangle; big enough rectangles become blocks, the rest plain edges.
+    """
+    runs.sort(key=lambda x: (x[0], x[3], x[4], x[2]))
+    i = 0
+    while i < len(runs):
+        key, formula, c0, r0, r1 = runs[i]
+        j = i + 1
+        while j < len(runs) and runs[j][0] == key and runs[j][3:] == (r0, r1) and runs[j][2] == c0 + (j - i):
+            j += 1
+        c1 = c0 + (j - i) - 1
+        if (r1 - r0 + 1) * (c1 - c0 + 1) >= min_cells:
+            _add_block(G, sheet, r0, r1, c0, c1, formula)
+        else:
+            tpl = dependency_template(formula, r0, c0)
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    dst = f"{sheet}!{get_column_letter(c)}{r}"
+                    _add_dep_edges(G, sheet, dst, place_template(tpl, r, c))
+        i = j
+
+def expand_blocks(G: nx.DiGraph) -> nx.DiGraph:
+    """Copy of `G` with every block replaced by its per-cell edges."""
+    H = G.copy()
+    for bid, d in G.nodes(data=True):
+        if d.get("kind") != "block":
+            continue
+        H.remove_node(bid)
+        tpl = dependency_template(d["formula"], d["min_row"], d["min_col"])
+        for r in range(d["min_row"], d["max_row"] + 1):
+            for c in range(d["min_col"], d["max_col"] + 1):
+                dst = f"{d['sheet']}!{get_column_letter(c)}{r}"
+                _add_dep_edges(H, d["sheet"], dst, place_template(tpl, r, c))
+    # swept regions only blocks pointed at are no longer referenced
+    H.remove_nodes_from([n for n, d in H.nodes(data=True)
+                         if d.get("kind") == "range" and not H.out_degree(n)])
+    return H
+
+def formula_runs(ws, refs: RefResolver, cell=None) -> tuple[list, list]:
+    """
+    One pass over worksheet `ws`: its vertical runs of one R1C1 form, as
+    [key, formula, col, first_row, last_row] with names, table refs and 3D
+    refs already rewritten to plain A1, and the width of every row.
+    `cell(r, c, val)` is called for each cell on the way.  Ingest and the
+    recalc engine both cut formulas into units here.
+    """
+    # col -> [key, formula, col, first_row, last_row] of the open run
+    open_runs, runs = {}, []
+    # values_only rows start at A1 and are padded to the sheet width,
+    # exactly like the cells full-mode iter_rows() hands out.
+    widths = []
+    for r, values in enumerate(ws.iter_rows(values_only=True), start=1):
+        widths.append(len(values))
+        for c, val in enumerate(values, start=1):
+            if cell:
+                cell(r, c, val)
+            run = open_runs.get(c)
+            if not (isinstance(val, str) and val.startswith("=")):
+                if run:
+                    runs.append(open_runs.pop(c))
+                continue
+            val = refs.rewrite(val, ws.title, r, c)
+            key = to_r1c1(val, r, c)
+            if run and run[0] == key and run[4] == r - 1:
+                run[4] = r
+            else:
+                if run:
+                    runs.append(run)
+                open_runs[c] = [key, val, c, r, r]
+    runs.extend(open_runs.values())
+    return runs, widths
+
+def _parse_sheet(G: nx.DiGraph, ws, sheet: str, refs: RefResolver, min_cells) -> tuple[int, int]:
+    """
+    Add worksheet `ws`'s cells, blocks and edges to `G` under the name
+    `sheet`.  Returns (rows, width) of its cell grid.
+    """
+    runs, widths = formula_runs(ws, refs, lambda r, c, _: G.add_node(f"{sheet}!{get_column_letter(c)}{r}"))
+    _emit_runs(G, sheet, [tuple(x) for x in runs], min_cells)
+    # sheets written without a <dimension> tag come back ragged in
+    # read-only mode; pad them out to the used rectangle afterwards
+    width = max(widths, default=0)
+    for r, w in enumerate(widths, start=1):
+        for c in range(w + 1, width + 1):
+            G.add_node(f"{sheet}!{get_column_letter(c)}{r}")
+    return len(widths), width
+
+def clip_whole(G: nx.DiGraph, dims: dict):
+    """
+    Cut whole-column / whole-row ranges ('S!A:A', 'S!3:3', and ranges a
+    block sweeps to the sheet edge) down to their sheet's used rectangle,
+    `dims[sheet] = (rows, width)`, renaming them to match ('S!A1:A50').
+    Ranges left with no cells are dropped; sheets not in `dims` (another
+    workbook's) keep their edges.
+    """
+    renames, empty = {}, []
+    for n, d in G.nodes(data=True):
+        if d.get("kind") != "range" or d["sheet"] not in dims:
+            continue
+        if d["max_row"] != MAX_ROW and d["max_col"] != MAX_COL:
+            continue
+        rows, width = dims[d["sheet"]]
+        r1, c1 = min(d["max_row"], rows), min(d["max_col"], width)
+        if d["min_row"] > r1 or d["min_col"] > c1:
+            empty.append(n)
+            continue
+        d["max_row"], d["max_col"] = r1, c1
+        renames[n] = range_name(d["sheet"], d["min_row"], r1, d["min_col"], c1)
+    G.remove_nodes_from(empty)
+    # a clipped range may land on one the workbook names outright; they merge
+    nx.relabel_nodes(G, renames, copy=False)
+
+def _timed_sheet(G, ws, sheet, refs, min_cells):
+    with stage("parse_sheet"):
+        rows, width = _parse_sheet(G, ws, sheet, refs, min_cells)
+    SHEETS.inc(source="parsed")
+    CELLS.inc(rows * width)
+    return rows, width
+
+def build_nx_graph(path: str, streaming: bool = True, blocks: bool = True,
+                   book: str | None = None, cache: SheetCache | None = None) -> nx.DiGraph:
     """
     Reads every sheet in the .xlsx, parses formulas (including ranges),
     and returns a directed graph G where edges are PRECEDENT → DEPENDENT.
-    Node IDs are 'SheetName!A1'.
+    Node IDs are 'SheetName!A1'; referenced ranges are single nodes
+    'SheetName!A1:B9' with kind="range" and their row/col bounds (see
+    `range_node`).  Membership of a cell in a range is resolved at query
+    time, never materialised as edges.
+
+    Defined names, structured (table) refs and 3D refs are resolved
+    against the workbook first (see `refs.RefResolver`); whole-column and
+    whole-row refs such as `A:A` are one range node each, clipped to the
+    sheet's used rectangle (see `clip_whole`).
+
+    With `blocks` (the default) contiguous cells sharing one relative
+    formula become a single kind="block" node (see `block_node`); member
+    cells keep their nodes but their edges live on the block.
+
+    With `streaming` (the default) the workbook is opened read-only and
+    each row is pulled from the sheet XML on demand, so peak memory is one
+    row batch plus the graph itself.  Every cell is visited exactly once:
+    its node is created and its formula folded into the open run of its
+    column; a sheet's edges are emitted once its runs are closed.
+    `streaming=False` loads the full workbook model instead; both modes
+    produce the same graph.
+
+    Refs into other workbooks ('[Budget.xlsx]Sheet1'!A1, stored as
+    [1]Sheet1!A1) keep their workbook in the sheet part.  With `book`, this
+    workbook's sheets get the same prefix ('[Book.xlsx]Sheet1!A1'), so the
+    graphs of linked workbooks loaded side by side meet in shared nodes.
+
+    With a `cache` (see `parse_cache`), a streamed sheet whose XML part and
+    workbook context are unchanged since it was last parsed is read back
+    from disk instead; only edited sheets are parsed.
     """
-    wb = load_workbook(path, data_only=False)
-    G = nx.DiGraph()
+    with stage("build_graph"):
+        return _build(path, streaming, blocks, book, cache)
 
-    # 1) Create a node for every cell in every sheet
-    for ws in wb.worksheets:
-        sheet = ws.title
-        for row in ws.iter_rows():
-            for cell in row:
-                addr = f"{sheet}!{cell.coordinate}"
-                G.add_node(addr)
-
-    # 2) Walk again to extract formula deps
-    for ws in wb.worksheets:
-        sheet = ws.title
-        for row in ws.iter_rows():
-            for cell in row:
-                val = cell.value
-                if isinstance(val, str) and val.startswith("="):
-                    dst = f"{sheet}!{cell.coordinate}"
-                    for sheet_ref, coord in extract_dependencies(val):
-                        ref_sheet = sheet_ref or sheet
-                        if ":" in coord:
-                            start, end = coord.split(":")
-                            for c in expand_range(start, end):
-                                src = f"{ref_sheet}!{c}"
-                                if src != dst:
-                                    G.add_edge(src, dst)
-                        else:
-                            src = f"{ref_sheet}!{coord}"
-                            if src != dst:
-                                G.add_edge(src, dst)
+def _build(path, streaming, blocks, book, cache) -> nx.DiGraph:
+    wb = load_workbook(path, read_only=streaming, data_only=False)
+    G = nx.DiGraph()
+    min_cells = BLOCK_MIN_CELLS if blocks else float("inf")
+    dims = {}       # sheet -> (rows, width) of its cell grid
+    try:
+        refs = RefResolver(wb)
+        # only read-only sheets know their XML part, so only streaming is cached
+        context = f"{refs.digest()}\0{book}\0{min_cells}" if cache and streaming else None
+        for ws in wb.worksheets:
+            sheet = f"[{book}]{ws.title}" if book else ws.title
+            if context is None:
+                dims[sheet] = _timed_sheet(G, ws, sheet, refs, min_cells)
+                continue
+            with wb._archive.open(ws._worksheet_path) as part:
+                k = sheet_key(context, sheet, part)
+            hit = cache.get(k, sheet)
+            if hit is None:
+                S = nx.DiGraph()
+                dims[sheet] = _timed_sheet(S, ws, sheet, refs, min_cells)
+                cache.put(k, S, *dims[sheet])
+            else:
+                S, rows, width = hit
+                dims[sheet] = (rows, width)
+                SHEETS.inc(source="cache")
+            G.update(S)
+    finally:
+        # read-only workbooks keep the zip archive open until closed
+        wb.close()
+    # after every sheet, since a sheet's whole-column refs may point at later ones
+    clip_whole(G, dims)
     return G
@@ -0,0 +1,222 @@
+# src/intents.py
+"""
+Deterministic intent router for the questions people ask most.
+
+Each intent is a handful of regexes over the normalised question (spaces
+collapsed, trailing punctuation dropped, case ignored) plus a handler that
+answers from the graph backend — the same indexed walks and parameterised
+Cypher the impact API uses — so these never reach the LLM.  `route` runs
+before NL→Cypher in both `query_engine.ask_question` and `/run`; anything
+that doesn't match falls through to the LLM unchanged.
+
+Add an intent with the `intent` decorator; named groups become handler
+keyword arguments, and `cell` / `src` / `dst` / `ref` groups arrive as
+canonical graph names ('My Sheet!B7').  Cell addresses must name their
+sheet, since the graph doesn't know which one a bare `B7` means.
+"""
+
+import re
+from typing import Callable, NamedTuple
+
+from .graph_store import GraphBackend, backend
+from .parser import COORD_REF, canonical_address
+
+_SPACE_RE = re.compile(r"\s+")
+
+# sheet-qualified cell / range addresses; `{cell}` etc. in a pattern expand to
+# these.  The whole question is matched, so unquoted sheet names may hold spaces.
+_QUALIFIED = rf"(?:'(?:[^']|'')+'|[^!'\s][^!']*?)!{COORD_REF}"
+# colours the viewer takes by name; anything else ("as done", "in banana")
+# isn't a highlight request and goes to the LLM
+_COLOR_NAMES = ("red", "orange", "yellow", "gold", "green", "lime", "teal", "cyan", "blue", "navy",
+               "purple", "violet", "magenta", "pink", "brown", "black", "white", "gray", "grey")
+_SLOTS = {
+    "cell": rf"(?P<cell>{_QUALIFIED})",
+    "src": rf"(?P<src>{_QUALIFIED})",
+    "dst": rf"(?P<dst>{_QUALIFIED})",
+    "ref": rf"(?P<ref>{_QUALIFIED})",
+    "sheet": r"(?:sheet |worksheet )?(?P<sheet>'(?:[^']|'')+'|.+?)",
+    "color": rf"(?P<color>#(?:[0-9a-f]{{3,4}}|[0-9a-f]{{6}}|[0-9a-f]{{8}})|{'|'.join(_COLOR_NAMES)})",
+}
+_ADDRESS_ARGS = ("cell", "src", "dst", "ref")
+
+
+class Intent(NamedTuple):
+    name: str
+    pattern: re.Pattern
+    handler: Callable
+    write: bool
+
+
+_INTENTS: list[Intent] = []
+
+
+def intent(name: str, *patterns: str, write: bool = False):
+    """
+    Register `handler(store, **groups) -> dict` for questions matching any
+    of `patterns` in full.  `write=True` marks intents that change the graph.
+    """
+    def register(handler):
+        for p in patterns:
+            _INTENTS.append(Intent(name, re.compile(p.format(**_SLOTS), re.IGNORECASE), handler, write))
+        return handler
+    return register
+
+
+def _normalise(question: str) -> str:
+    return _SPACE_RE.sub(" ", question).strip().rstrip("?.! ")
+
+
+def route(question: str):
+    """(Intent, kwargs) for the first intent matching `question`, or None."""
+    text = _normalise(question)
+    for it in _INTENTS:
+        m = it.pattern.fullmatch(text)
+        if m is None:
+            continue
+        args = {k: v for k, v in m.groupdict().items() if v is not None}
+        for k in _ADDRESS_ARGS:
+            if k in args:
+                args[k] = canonical_address(args[k])
+        if "sheet" in args:
+            args["sheet"] = canonical_address(args["sheet"] + "!A1").rsplit("!", 1)[0]
+        if "color" in args:
+            args["color"] = args["color"].lower()
+        return it, args
+    return None
+
+
+def answer(question: str, store: GraphBackend | None = None) -> dict | None:
+    """
+    Answer `question` deterministically: {"intent", "write", "answer",
+    …} plus "rows" shaped like Cypher result rows for reads, or the
+    "cells" touched for writes; None when no intent matches and the
+    caller should ask the LLM.
+    """
+    hit = route(question)
+    if hit is None:
+        return None
+    it, args = hit
+    return {"intent": it.name, "write": it.write, **it.handler(store or backend(), **args)}
+
+
+_SHOWN = 25   # cells spelled out in an answer sentence; rows always hold them all
+
+
+def _listing(cells: list[str], none: str, some: str) -> dict:
+    shown = ", ".join(cells[:_SHOWN])
+    if len(cells) > _SHOWN:
+        shown += f" … ({len(cells):,} in all)"
+    return {"answer": some.format(shown) if cells else none, "rows": [[c] for c in cells]}
+
+
+# ── reads ─────────────────────────────────────────────────────────────────────
+@intent("dependents",
+        r"which cells (?:would )?break if i change {cell}",
+        r"(?:what|which cells) (?:depends|depend) on {cell}",
+        r"what (?:is|are|gets|would be) (?:affected|impacted) (?:by|if i change) (?:changing )?{cell}",
+        r"(?:show |list |find |get )?(?:all )?(?:the )?dependents of {cell}")
+def _dependents(store, cell):
+    deps = store.dependents(cell)
+    return {**_listing(deps, f"Nothing depends on {cell}.",
+                       f"Cells {{}} would break if you change {cell}."), "cell": cell}
+
+
+@intent("precedents",
+        r"(?:show |list |find |get )?(?:all )?(?:the )?precedents of {cell}",
+        r"what does {cell} depend on",
+        r"what (?:feeds|feeds into|flows into) {cell}",
+        r"(?:what are )?(?:the )?inputs (?:of|to|for) {cell}")
+def _precedents(store, cell):
+    precs = store.precedents(cell)
+    return {**_listing(precs, f"{cell} depends on nothing.",
+                       f"{cell} depends on {{}}."), "cell": cell}
+
+
+@intent("path",
+        r"(?:show |find |get )?(?:the )?(?:dependency )?path (?:from )?{src} (?:to|->) {dst}",
+        r"how does {src} (?:affect|feed|feed into|flow into|reach) {dst}",
+        r"does {dst} depend on {src}")
+def _path(store, src, dst):
+    chain = store.dependency_path(src, dst)
+    text = " → ".join(chain) if chain else f"{dst} doesn't depend on {src}."
+    return {"answer": text, "rows": [chain] if chain else [], "connected": bool(chain)}
+
+
+@intent("cells",
+        r"(?:list |show |get )?(?:all )?(?:the )?(?P<what>cells|formulas|formula cells) (?:on|in) {sheet}",
+        r"(?:which|what) (?P<what>cells|formulas|formula cells) are (?:on|in) {sheet}")
+def _cells(store, what, sheet):
+    cells = store.cells(sheet, formulas_only=what.lower() != "cells")
+    return {**_listing(cells, f"No {what.lower()} on {sheet}.",
+                       f"{what.capitalize()} on {sheet}: {{}}."), "sheet": sheet}
+
+
+@intent("references",
+        r"(?:which|what) (?:cells|formulas) (?:reference|refer to|read|use|point at) {ref}",
+        r"(?:who|what) (?:references|reads|uses) {ref}",
+        r"(?:show |list |find )?(?:all )?(?:the )?(?:formulas|cells) (?:referencing|reading|using) {ref}")
+def _references(store, ref):
+    readers = store.references(ref)
+    return {**_listing(readers, f"No formula refers to {ref} directly.",
+                       f"{ref} is read directly by {{}}."), "ref": ref}
+
+
+@intent("count",
+        r"how many (?P<what>cells|formulas|formula cells|ranges|blocks|edges|dependencies)"
+        r"(?: are there)?(?: (?:on|in) {sheet})?(?: are there)?",
+        r"(?:count|number of) (?:the )?(?P<what>cells|formulas|formula cells|ranges|blocks|edges|dependencies)"
+        r"(?: (?:on|in) {sheet})?")
+def _count(store, what, sheet=None):
+    key = {"formula cells": "formulas", "dependencies": "edges"}.get(what.lower(), what.lower())
+    n = store.counts(sheet)[key]
+    where = f" on {sheet}" if sheet else ""
+    return {"answer": f"{n:,} {what.lower()}{where}.", "rows": [[n]]}
+
+
+@intent("count_dependents",
+        r"how many (?:cells )?(?:depend on|would break if i change) {cell}",
+        r"how many dependents does {cell} have")
+def _count_dependents(store, cell):
+    n = len(store.dependents(cell))
+    return {"answer": f"{n:,} cells depend on {cell}.", "rows": [[n]], "cell": cell}
+
+
+@intent("count_precedents",
+        r"how many (?:cells |precedents |inputs )?does {cell} depend on",
+        r"how many (?:precedents|inputs) does {cell} have")
+def _count_precedents(store, cell):
+    n = len(store.precedents(cell))
+    return {"answer": f"{cell} depends on {n:,} cells or ranges.", "rows": [[n]], "cell": cell}
+
+
+# ── writes ────────────────────────────────────────────────────────────────────
+_PAINT = r"(?:colou?r|highlight|paint|mark)"
+
+
+@intent("highlight",
+        _PAINT + r" (?:all )?(?:the )?(?P<scope>dependents|precedents|inputs) (?:of )?{cell} (?:in |as |with )?{color}",
+        _PAINT + r" (?:all )?(?:the )?cells (?:that )?(?P<scope>depend)(?:ing)? on {cell} (?:in |as |with )?{color}",
+        _PAINT + r" {cell}(?P<also> and its (?P<scope>dependents|precedents|inputs))? (?:in |as |with )?{color}",
+        write=True)
+def _highlight(store, cell, color, scope=None, also=None):
+    scope = (scope or "").lower()
+    if scope.startswith("depend"):
+        cells = store.dependents(cell)
+    elif scope:
+        cells = [p for p in store.precedents(cell) if ":" not in p]
+    else:
+        cells = []
+    if also or not scope:
+        cells = [cell, *cells]
+    changed = store.highlight(cells, color)
+    return {"answer": f"Coloured {len(changed):,} nodes {color}.", "cells": changed, "color": color}
+
+
+@intent("clear_highlight",
+        r"(?:clear|reset|remove) (?:all )?(?:the )?(?:colou?rs|highlights?|highlighting)(?: (?:on|in|from) {sheet})?",
+        write=True)
+def _clear_highlight(store, sheet=None):
+    changed = store.clear_colors(sheet)
+    where = f" on {sheet}" if sheet else ""
+    return {"answer": f"Cleared colours{where} ({len(changed):,} nodes).", "cells": changed, "color": None}
@@ -0,0 +1,183 @@
+# src/memory_store.py
+"""
+Embedded graph backend: keeps the `build_nx_graph` graph in process and
+answers impact / viewer queries straight from it — no Neo4j round trip.
+Walks hop over a CompactGraph (integer ids, CSR adjacency) built alongside
+it; node attributes and the viewer reads stay on the NetworkX graph.
+The graph is snapshotted to disk (gzip pickle) on every change, so an API
+restart, or another process such as the watcher, picks it up without
+re-parsing the workbook.
+"""
+
+import gzip, os, pathlib, pickle, time
+from bisect import bisect_right
+from contextlib import contextmanager
+from itertools import islice
+
+import networkx as nx
+
+from .compact import CompactGraph
+from .graph_store import GraphBackend, Walk, diff_graphs
+from .range_index import RangeIndex, CellIndex, BlockIndex
+
+
+class MemoryBackend(GraphBackend):
+    name = "memory"
+
+    def __init__(self, snapshot_path: str):
+        super().__init__()
+        self.path = pathlib.Path(snapshot_path)
+        self._mtime = None
+        self._sorted = None     # (graph, its node names sorted) for node_page
+        self._set(nx.DiGraph())
+        self.refresh()
+
+    # (graph, range index, formula index, block index, CSR adjacency) swapped as
+    # one tuple so concurrent readers never see a graph paired with another
+    # graph's indexes
+    def _set(self, G):
+        self._state = (G, RangeIndex.from_graph(G), CellIndex.from_graph(G), BlockIndex.from_graph(G),
+                       CompactGraph.from_nx(G))
+        self.impact.invalidate()
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        return self._state[0]
+
+    def _save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with gzip.open(tmp, "wb", compresslevel=3) as fh:
+            pickle.dump(self.graph, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self._mtime = self.path.stat().st_mtime_ns
+
+    def refresh(self):
+        """(Re)load the snapshot if it changed on disk since we last saw it."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            with gzip.open(self.path, "rb") as fh:
+                self._set(pickle.load(fh))
+            self._mtime = mtime
+
+    # ── writes ────────────────────────────────────────────────────────────────
+    def load(self, G, fresh=False):
+        t0 = time.perf_counter()
+        self._set(G.copy() if fresh else nx.compose(self.graph, G))
+        self._save()
+        kinds = [d.get("kind") for _, d in G.nodes(data=True)]
+        ranges, blocks = kinds.count("range"), kinds.count("block")
+        return {
+            "cells": len(kinds) - ranges - blocks, "ranges": ranges, "blocks": blocks,
+            "edges": G.number_of_edges(),
+            "seconds": {"snapshot": time.perf_counter() - t0},
+        }
+
+    def sync(self, old, new, keep=None):
+        diff = diff_graphs(old, new, keep)
+        if any(diff.values()):
+            G = self.graph.copy()
+            G.remove_edges_from(diff["removed_edges"])
+            G.remove_nodes_from(diff["removed_nodes"])
+            G.add_nodes_from((n, new.nodes[n]) for n in diff["added_nodes"])
+            G.add_edges_from(diff["added_edges"])
+            self._set(G)
+            self._save()
+        return diff
+
+    def clear(self):
+        self._set(nx.DiGraph())
+        self._save()
+
+    def set_color(self, names, color):
+        # a colour isn't a dependency, so the indexes and impacts stay valid
+        G = self.graph
+        hit = [n for n in names if n in G]
+        for n in hit:
+            G.nodes[n]["color"] = color
+        if hit:
+            self._save()
+        return hit
+
+    def clear_colors(self, sheet=None):
+        hit = [n for n, d in self.graph.nodes(data=True)
+               if d.get("color") and (sheet is None or n.rsplit("!", 1)[0] == sheet)]
+        return self.set_color(hit, None)
+
+    # ── reads ─────────────────────────────────────────────────────────────────
+    @contextmanager
+    def _walk(self):
+        _, idx, formulas, blocks, csr = self._state
+
+        def dependents_step(cells, ranges):
+            return csr.successors(cells + ranges)
+
+        yield Walk(idx, formulas, blocks, dependents_step, csr.predecessors)
+
+    def _reader_counts(self):
+        G, _, _, blocks, _ = self._state
+
+        def refs(n):
+            return sum(1 for d in G.successors(n) if d not in blocks)
+        direct = {c: refs(c) for c, d in G.nodes(data=True) if d.get("kind") is None and not G.in_degree(c)}
+        via_range = {r: refs(r) for r, d in G.nodes(data=True) if d.get("kind") == "range"}
+        return direct, via_range
+
+    def sheet_cells(self, sheet):
+        return [n for n, d in self.graph.nodes(data=True)
+                if d.get("kind") is None and n.rsplit("!", 1)[0] == sheet]
+
+    def _counts(self, sheet):
+        G = self.graph
+        out = {"cells": 0, "ranges": 0, "blocks": 0, "edges": 0}
+        for n, d in G.nodes(data=True):
+            if sheet is None or (d.get("sheet") or n.rsplit("!", 1)[0]) == sheet:
+                out[{"range": "ranges", "block": "blocks"}.get(d.get("kind"), "cells")] += 1
+                out["edges"] += G.in_degree(n)
+        return out
+
+    @staticmethod
+    def _node(n, d) -> dict:
+        return {"id": n, "color": d.get("color"), "is_range": d.get("kind") == "range",
+                "is_block": d.get("kind") == "block"}
+
+    def subgraph(self):
+        G = self.graph
+        return [self._node(n, d) for n, d in G.nodes(data=True)], list(G.edges)
+
+    def nodes(self, names):
+        G = self.graph
+        return [self._node(n, G.nodes[n]) for n in names if n in G]
+
+    def node_page(self, sheet, after, limit):
+        # sorted names are built once per graph and shared by every page
+        G = self.graph
+        if self._sorted is None or self._sorted[0] is not G:
+            self._sorted = (G, sorted(G))
+        names = self._sorted[1]
+        prefix = "" if sheet is None else f"{sheet}!"
+        out = []
+        for n in islice(names, bisect_right(names, max(after, prefix)), None):
+            if not n.startswith(prefix):
+                break       # a sheet's names sort together
+            if sheet is None or n.rsplit("!", 1)[0] == sheet:
+                out.append(self._node(n, G.nodes[n]))
+                if len(out) == limit:
+                    break
+        return out
+
+    def edges_of(self, names, fanout):
+        G = self.graph
+        out = []
+        for n in names:
+            if n in G:
+                out.extend((n, m) for m in islice(G.successors(n), fanout))
+                out.extend((m, n) for m in islice(G.predecessors(n), fanout))
+        return out
+
+    def labels(self):
+        G = self.graph
+        nodes = {d.get("kind") or "entity" for _, d in G.nodes(data=True)}
+        return {"nodeLabels": sorted(nodes), "relTypes": ["DEPENDS_ON"] if G.number_of_edges() else []}
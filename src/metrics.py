@@ -0,0 +1,191 @@
+# src/metrics.py
+"""
+Process-wide metrics and optional tracing.
+
+Counters, gauges and histograms live in one registry and are rendered in
+the Prometheus text format by `render` — served at the API's /metrics,
+and by the watcher on METRICS_PORT — with no client library needed.
+Gauges can be read from a callback at scrape time, so queue depths and
+cache sizes are never stale.
+
+`stage(name)` times a block into `sbrain_stage_seconds{stage=name}`.
+With OTEL_TRACING=1 and the opentelemetry API installed it also opens a
+span of that name; exporters are set up the usual OTEL_* way by whoever
+runs the process.
+"""
+
+import logging, math, threading, time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .config import Settings
+
+try:
+    from opentelemetry import trace as _otel
+except ImportError:
+    _otel = None
+
+_cfg = Settings()
+log = logging.getLogger(__name__)
+_PREFIX = "sbrain_"
+_BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+_REGISTRY = []
+_tracer = _otel.get_tracer("spreadsheet-brain") if _otel and _cfg.OTEL_TRACING else None
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(v) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = _PREFIX + name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[n] for n in self.labels)
+
+    def _samples(self):
+        """(suffix, label values, extra label, value) rows."""
+        with self._lock:
+            return [("", k, "", v) for k, v in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labels, key, extra)} {_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0) + amount
+
+
+class Gauge(_Metric):
+    """Set directly, or read from `fn() -> {label values: value}` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self.fn is None:
+            return super()._samples()
+        try:
+            values = self.fn()
+        except Exception:
+            return []       # a broken callback must not break the scrape
+        return [("", k, "", v) for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        k = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(k) or ([0] * len(self.buckets), 0.0)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    counts[i] += 1
+            self._values[k] = (counts, total + value)
+
+    def _samples(self):
+        rows = []
+        with self._lock:
+            for k, (counts, total) in self._values.items():
+                rows += [("_bucket", k, f'le="{_number(b)}"', n) for b, n in zip(self.buckets, counts)]
+                rows += [("_sum", k, "", total), ("_count", k, "", counts[-1])]
+        return rows
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    return "\n".join(m.render() for m in _REGISTRY) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ── the metrics themselves ────────────────────────────────────────────────────
+STAGE_SECONDS = Histogram("stage_seconds", "Wall time of a pipeline stage.", ("stage",))
+SHEETS = Counter("sheets_total", "Worksheets ingested, parsed or read from the sheet cache.", ("source",))
+CELLS = Counter("cells_parsed_total", "Cells visited while parsing worksheets.")
+NEO4J_ROWS = Counter("neo4j_rows_written_total", "Rows sent to Neo4j in bulk-load batches.", ("kind",))
+SYNC_CHANGES = Counter("sync_changes_total", "Nodes / edges added or removed by incremental syncs.", ("change",))
+LLM_REQUESTS = Counter("llm_requests_total", "NL→Cypher calls to the LLM.", ("outcome",))
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the LLM.", ("kind",))
+CYPHER_ROWS = Counter("cypher_rows_total", "Rows returned by free-form Cypher reads.")
+CYPHER_REJECTED = Counter("cypher_rejected_total", "LLM-written queries refused by the cost guard.")
+RUNS = Counter("run_requests_total", "/run requests by how they were answered.", ("route",))
+EVENTS = Counter("events_published_total", "SSE events published.", ("kind",))
+
+
+@contextmanager
+def stage(name: str, **attrs):
+    """Time the block as stage `name` (and trace it as a span when tracing is on)."""
+    span = _tracer.start_as_current_span(name, attributes=attrs) if _tracer else nullcontext()
+    t0 = time.perf_counter()
+    with span:
+        try:
+            yield
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - t0, stage=name)
+
+
+# ── a /metrics endpoint for processes without the API ─────────────────────────
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int) -> ThreadingHTTPServer:
+    """Serve /metrics on `port` from a daemon thread."""
+    server = ThreadingHTTPServer(("", port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("Metrics on http://localhost:%d/metrics", port)
+    return server
@@ -0,0 +1,122 @@
+# src/parse_cache.py
+"""
+Content-addressed on-disk cache of per-sheet parse results.
+
+One sheet's slice of the graph — its cell grid, the range and block nodes
+its formulas create, and their edges — depends only on the sheet's XML
+part and on a little workbook-level context (sheet order, defined names,
+tables, external links, the namespace and block settings).  `sheet_key`
+digests both, so an entry never goes stale: an edited sheet simply
+misses, and every untouched sheet of a 40-sheet workbook is read back
+instead of re-parsed.
+
+Entries are zlib-compressed marshal of plain tuples: the grid as (rows,
+width), nodes with attributes, and edges as index pairs into one table
+of names.  Files are written atomically, so the watcher's parse
+processes can share a directory; the least recently used are pruned
+once it outgrows PARSE_CACHE_MB.
+"""
+
+import hashlib, marshal, os, pathlib, zlib
+from array import array
+from functools import lru_cache
+
+import networkx as nx
+from openpyxl.utils import get_column_letter
+
+from .config import Settings
+
+_cfg = Settings()
+FORMAT = 2      # bump when ingest would build a sheet differently
+
+
+def sheet_key(context: str, sheet: str, part) -> str:
+    """Cache key of `sheet`, whose XML is the open zip member `part`, under workbook `context`."""
+    h = hashlib.blake2b(f"{FORMAT}\0{context}\0{sheet}\0".encode(), digest_size=20)
+    for chunk in iter(lambda: part.read(1 << 20), b""):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def _encode(S: nx.DiGraph, rows: int, width: int) -> bytes:
+    names, edges = {}, array("I")
+    for a, b in S.edges:
+        edges.append(names.setdefault(a, len(names)))
+        edges.append(names.setdefault(b, len(names)))
+    attrs = [(n, d) for n, d in S.nodes(data=True) if d]
+    return zlib.compress(marshal.dumps((rows, width, attrs, list(names), edges.tobytes())), 3)
+
+
+def _decode(blob: bytes, sheet: str) -> tuple[nx.DiGraph, int, int]:
+    rows, width, attrs, names, raw = marshal.loads(zlib.decompress(blob))
+    edges = array("I")
+    edges.frombytes(raw)
+    S = nx.DiGraph()
+    letters = [get_column_letter(c) for c in range(1, width + 1)]
+    S.add_nodes_from(f"{sheet}!{col}{r}" for r in range(1, rows + 1) for col in letters)
+    S.add_nodes_from(attrs)
+    S.add_edges_from((names[edges[i]], names[edges[i + 1]]) for i in range(0, len(edges), 2))
+    return S, rows, width
+
+
+class SheetCache:
+    """Per-sheet graphs on disk under `root`, named by `sheet_key`."""
+
+    def __init__(self, root: str, max_mb: int):
+        self.root = pathlib.Path(root).absolute()     # shared process-wide: immune to a chdir
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_mb << 20
+        self.stats = {"hits": 0, "misses": 0}
+        self._size = sum(p.stat().st_size for p in self.root.glob("*.sheet"))
+
+    def _path(self, k: str) -> pathlib.Path:
+        return self.root / f"{k}.sheet"
+
+    def get(self, k: str, sheet: str) -> tuple[nx.DiGraph, int, int] | None:
+        """(sheet graph, rows, width) as `put` stored them, or None."""
+        p = self._path(k)
+        try:
+            hit = _decode(p.read_bytes(), sheet)
+        except FileNotFoundError:
+            hit = None
+        except (OSError, ValueError, EOFError, TypeError, zlib.error):
+            hit = None                  # torn or foreign entry: parse again and overwrite it
+        else:
+            try:
+                os.utime(p)             # recently used
+            except OSError:
+                pass
+        self.stats["hits" if hit is not None else "misses"] += 1
+        return hit
+
+    def put(self, k: str, S: nx.DiGraph, rows: int, width: int):
+        blob = _encode(S, rows, width)
+        p = self._path(k)
+        tmp = p.with_name(f"{p.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(blob)
+        os.replace(tmp, p)
+        self._size += len(blob)
+        if self._size > self.max_bytes:
+            self.prune()
+
+    def prune(self):
+        """Drop least recently used entries until the cache is back under 3/4 of its cap."""
+        entries = []
+        for p in self.root.glob("*.sheet"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if self._size <= self.max_bytes * 3 // 4:
+                break
+            p.unlink(missing_ok=True)
+            self._size -= size
+
+
+@lru_cache
+def sheet_cache() -> SheetCache | None:
+    """The process-wide cache, or None when PARSE_CACHE_DIR is empty."""
+    return SheetCache(_cfg.PARSE_CACHE_DIR, _cfg.PARSE_CACHE_MB) if _cfg.PARSE_CACHE_DIR else None
@@ -1,28 +1,278 @@
 # parser.py
 
 import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import NamedTuple
 
-# Matches:
-#   'My Sheet'!A1, MySheet!A1, A1, $B$2, A1:B2, 'Other Sheet'!A3:C5
-CELL_REF_RE = re.compile(
-    r"(?:'(?P<sheet_quoted>[^']+)'|(?P<sheet_unquoted>[A-Za-z0-9_ ]+))?!?"
-    r"(?P<start>\$?[A-Za-z]+\$?\d+)"
-    r"(?:\s*:\s*(?P<end>\$?[A-Za-z]+\$?\d+))?"
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import column_index_from_string
+
+MAX_ROW, MAX_COL = 1_048_576, 16_384   # Excel sheet limits
+
+
+class Token(NamedTuple):
+    kind: str                # ref table func string number bool error name op paren sep ws unknown
+    text: str
+    pos: int
+    sheet: str | None = None  # ref only: sheet name (unquoted), "First:Last" for 3D refs, or None
+    start: str | None = None  # ref only: first corner as written: "$A$1", "A" (column) or "3" (row)
+    end: str | None = None    # ref only: second corner of a range
+    start_pos: int = -1
+    end_pos: int = -1
+
+
+# One master pattern, tried in order at each position.  Strings come first so
+# nothing inside "..." is ever read as a ref; a name directly followed by "("
+# is a function (LOG10, ATAN2), never a cell.  Refs cover cells, rectangles,
+# whole columns (A:C) and rows (3:5), optionally behind a sheet or a 3D
+# sheet span (Jan:Mar!B2).  Structured refs (Sales[Amount], [@Qty]) are
+# one `table` token, resolved against the workbook by src/refs.py.
+_NAME = r"[A-Za-z_][\w.]*"
+_SHEET = rf"(?:'(?P<qsheet>(?:[^']|'')+)'|(?P<sheet>{_NAME})(?::(?P<sheet2>{_NAME}))?)!"
+_CELL = r"\$?[A-Za-z]{1,3}\$?\d+"
+_COL = r"\$?[A-Za-z]{1,3}"
+_ROW = r"\$?\d+"
+_BRACKET = r"\[(?:'.|[^\[\]'])*\]"
+_TOKEN_RE = re.compile(
+    r"(?P<ws>\s+)"
+    r'|(?P<string>"(?:[^"]|"")*")'
+    r"|(?P<error>#(?:NULL!|DIV/0!|VALUE!|REF!|NAME\?|NUM!|N/A|SPILL!|CALC!|GETTING_DATA))"
+    rf"|(?P<ref>(?<![\w.$])(?:{_SHEET})?"
+    rf"(?:(?P<a>{_CELL})(?::(?P<b>{_CELL}))?|(?P<ca>{_COL}):(?P<cb>{_COL})|(?P<ra>{_ROW}):(?P<rb>{_ROW}))"
+    r"(?![\w(!.]))"
+    rf"|(?P<table>(?:[A-Za-z_\\][\w.]*)?\[(?:'.|[^\[\]']|{_BRACKET})*\])"
+    rf"|(?P<func>{_NAME}(?=\())"
+    r"|(?P<bool>(?:TRUE|FALSE)(?![\w(]))"
+    r"|(?P<name>[A-Za-z_\\][\w.]*)"
+    r"|(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?%?)"
+    r"|(?P<op><=|>=|<>|[-+*/^&=<>:%])"
+    r"|(?P<paren>[(){}])"
+    r"|(?P<sep>[,;])"
+    r"|(?P<unknown>.)",
+    re.DOTALL,
+)
+
+# Ref-shaped spans that can shift when a formula is filled down/right.  Quoted
+# text ("…", '…' sheet names, […] workbook/table parts) is matched first and
+# left alone, so the R1C1 key below is a faithful rewrite of the formula.
+_SHIFTABLE_RE = re.compile(
+    r"""(?P<q>"(?:[^"]|"")*"|'(?:[^']|'')*'|\[[^\]]*\])"""
+    rf"|(?<![\w.$])(?P<cell>{_CELL})(?![\w(!.])"
+    rf"|(?<![\w.$])(?P<c1>{_COL}):(?P<c2>{_COL})(?![\w(!.])"
+    rf"|(?<![\w.$])(?P<r1>{_ROW}):(?P<r2>{_ROW})(?![\w(!.])"
 )
+_CORNER_RE = re.compile(r"(\$?)([A-Za-z]{0,3})(\$?)(\d*)")
+_CORNER_GROUPS = ("cell", "c1", "c2", "r1", "r2")
+
+# Google Sheets exports functions Excel lacks as __xludf.DUMMYFUNCTION("<formula>");
+# the string *is* the formula, so it is unwrapped before lexing.
+_DUMMY_RE = re.compile(r'__xludf\.DUMMYFUNCTION\("((?:[^"]|"")*)"\)', re.IGNORECASE)
 
-def extract_dependencies(formula: str):
+
+def unwrap(formula: str) -> str:
+    if "DUMMYFUNCTION" not in formula.upper():
+        return formula
+    return _DUMMY_RE.sub(lambda m: "(" + m.group(1).replace('""', '"') + ")", formula)
+
+
+# A cell or range address as people type it in a question: 'My Sheet'!$B$7,
+# Sheet1!A1:C3 or a bare B7.
+COORD_REF = r"\$?[A-Za-z]{1,3}\$?\d+(?::\$?[A-Za-z]{1,3}\$?\d+)?"
+ADDRESS = rf"(?:(?:'(?:[^']|'')+'|[A-Za-z_][\w.]*)!)?{COORD_REF}"
+
+
+def canonical_address(text: str) -> str:
+    """How the graph names an address: unquoted sheet, no `$`, upper-case coordinate."""
+    sheet, _, coord = text.rpartition("!")
+    coord = coord.replace("$", "").upper()
+    if sheet.startswith("'") and sheet.endswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+    return f"{sheet}!{coord}" if sheet else coord
+
+
+def tokenize(formula: str) -> list[Token]:
+    """Lex a formula (with or without the leading "=") into tokens, whitespace dropped."""
+    out = []
+    for m in _TOKEN_RE.finditer(formula):
+        kind = m.lastgroup
+        if kind == "ws":
+            continue
+        if kind == "ref":
+            sheet = m.group("qsheet")
+            if sheet:
+                sheet = sheet.replace("''", "'")
+            elif m.group("sheet2"):
+                sheet = f"{m.group('sheet')}:{m.group('sheet2')}"
+            else:
+                sheet = m.group("sheet")
+            a, b = next((g, h) for g, h in (("a", "b"), ("ca", "cb"), ("ra", "rb")) if m.group(g))
+            out.append(Token("ref", m.group(), m.start(), sheet,
+                             m.group(a), m.group(b), m.start(a), m.start(b)))
+        else:
+            out.append(Token(kind, m.group(), m.start()))
+    return out
+
+
+def _corner(text: str):
     """
-    Extract all sheet-qualified and unqualified cell refs and ranges.
-    Returns a list of (sheet_name_or_None, coord_or_range) tuples.
+    '$B7' -> (row, row_abs, col, col_abs).  A whole-column corner ('B') has
+    row None, a whole-row corner ('7') col None; the missing axis counts as
+    absolute, since it never shifts.
+    """
+    if text.startswith("$") and text[1:].isdigit():
+        return int(text[1:]), True, None, True
+    col_abs, letters, row_abs, row = _CORNER_RE.fullmatch(text).groups()
+    if not letters:
+        return int(row), bool(row_abs), None, True
+    col = column_index_from_string(letters.upper())
+    if not row:
+        return None, True, col, bool(col_abs)
+    return int(row), bool(row_abs), col, bool(col_abs)
+
+
+# ──────────────────────────────────────────────────────────────
+# R1C1 normalisation.  A filled-down column of `=A2*B2`, `=A3*B3`, … all
+# rewrite to the same `=RC[-2]*RC[-1]`, so it is lexed once and every other
+# cell only re-offsets the cached template.
+# ──────────────────────────────────────────────────────────────
+def _r1c1_part(n, absolute, host, axis):
+    if absolute:
+        return f"{axis}{n}"
+    return f"{axis}[{n - host}]" if n != host else axis
+
+
+def _r1c1_corner(text, row, col):
+    r, r_abs, c, c_abs = _corner(text)
+    return ((_r1c1_part(r, r_abs, row, "R") if r is not None else "")
+            + (_r1c1_part(c, c_abs, col, "C") if c is not None else ""))
+
+
+def _r1c1(m, row, col):
+    if m.group("q") is not None:
+        return m.group("q")
+    if m.group("cell"):
+        return _r1c1_corner(m.group("cell"), row, col)
+    g1, g2 = ("c1", "c2") if m.group("c1") else ("r1", "r2")
+    return f"{_r1c1_corner(m.group(g1), row, col)}:{_r1c1_corner(m.group(g2), row, col)}"
+
+
+def to_r1c1(formula: str, row: int, col: int) -> str:
+    """Rewrite every shiftable A1 ref relative to the host cell (row, col)."""
+    formula = unwrap(formula)
+    return _SHIFTABLE_RE.sub(lambda m: _r1c1(m, row, col), formula)
+
+
+def relative_refs(formula: str, row: int, col: int):
     """
+    (token, (sheet, corner, corner_or_None)) for every ref token of
+    `formula` as written in cell (row, col), corners in template form:
+    (row, row_abs, col, col_abs) with relative parts as deltas.
+    """
+    shiftable = {m.start(g) for m in _SHIFTABLE_RE.finditer(formula)
+                 for g in _CORNER_GROUPS if m.group(g)}
+    out = []
+    for tok in tokenize(formula):
+        if tok.kind != "ref":
+            continue
+        corners = []
+        for text, pos in ((tok.start, tok.start_pos), (tok.end, tok.end_pos)):
+            if text is None:
+                corners.append(None)
+                continue
+            r, r_abs, c, c_abs = _corner(text)
+            # anything the key didn't rewrite is identical in every formula
+            # sharing the key, so it has to stay absolute
+            if pos not in shiftable:
+                r_abs = c_abs = True
+            corners.append((r if r_abs or r is None else r - row, r_abs,
+                            c if c_abs or c is None else c - col, c_abs))
+        out.append((tok, (tok.sheet, corners[0], corners[1])))
+    return out
+
+
+def _template(formula: str, row: int, col: int):
+    """
+    Dependencies of `formula` at (row, col) as offsets: a tuple of
+    (sheet, corner, corner_or_None) where corner = (row, row_abs, col, col_abs)
+    and relative parts are stored as deltas from the host cell.
+    """
+    return tuple(ref for _, ref in relative_refs(formula, row, col))
+
+
+_TEMPLATES = OrderedDict()   # R1C1 key -> template, LRU
+_TEMPLATE_CACHE_SIZE = 65536
+
+
+def dependency_template(formula: str, row: int, col: int):
+    """
+    The memoised template of `formula` as written in cell (row, col): a tuple
+    of (sheet_or_None, corner, corner_or_None) with corner =
+    (row, row_abs, col, col_abs), relative parts stored as deltas.  Every
+    cell of a filled block maps to the same template object.
+    """
+    formula = unwrap(formula)
+    key = to_r1c1(formula, row, col)
+    tpl = _TEMPLATES.get(key)
+    if tpl is None:
+        tpl = _TEMPLATES[key] = _template(formula, row, col)
+        if len(_TEMPLATES) > _TEMPLATE_CACHE_SIZE:
+            _TEMPLATES.popitem(last=False)
+    else:
+        _TEMPLATES.move_to_end(key)
+    return tpl
+
+
+def place(corner, row: int, col: int):
+    """(row, col) a template corner points at from host cell (row, col); None = whole axis."""
+    r, r_abs, c, c_abs = corner
+    return (r if r_abs else row + r), (c if c_abs else col + c)
+
+
+def _a1(corner, row, col):
+    r, c = place(corner, row, col)
+    if (r is not None and not 1 <= r <= MAX_ROW) or (c is not None and not 1 <= c <= MAX_COL):
+        return None     # shifted off the sheet: Excel shows #REF!
+    return (get_column_letter(c) if c is not None else "") + (str(r) if r is not None else "")
+
+
+def place_template(tpl, row: int, col: int):
+    """A template's dependencies as seen from cell (row, col), in `extract_dependencies` form."""
     deps = []
-    for m in CELL_REF_RE.finditer(formula):
-        sheet = (m.group('sheet_quoted') or m.group('sheet_unquoted') or "").strip() or None
-        start = m.group('start').replace('$','')
-        end = m.group('end')
-        if end:
-            end = end.replace('$','')
-            deps.append((sheet, f"{start}:{end}"))
-        else:
+    for sheet, a, b in tpl:
+        start = _a1(a, row, col)
+        if start is None:
+            continue
+        if b is None:
             deps.append((sheet, start))
+            continue
+        end = _a1(b, row, col)
+        if end is not None:
+            deps.append((sheet, f"{start}:{end}"))
+    return deps
+
+
+@lru_cache(maxsize=65536)
+def _plain_dependencies(formula: str):
+    deps = []
+    for tok in tokenize(formula):
+        if tok.kind == "ref":
+            start = tok.start.replace("$", "").upper()
+            if tok.end:
+                deps.append((tok.sheet, f"{start}:{tok.end.replace('$', '').upper()}"))
+            else:
+                deps.append((tok.sheet, start))
     return deps
+
+
+def extract_dependencies(formula: str, row: int | None = None, col: int | None = None):
+    """
+    Extract all sheet-qualified and unqualified cell refs and ranges.
+    Returns a list of (sheet_name_or_None, coord_or_range) tuples.
+
+    Pass the host cell's `row`/`col` to go through the R1C1 template cache
+    (the fast path for filled-down / filled-right blocks).
+    """
+    if row is None or col is None:
+        return list(_plain_dependencies(unwrap(formula)))
+    return place_template(dependency_template(formula, row, col), row, col)
@@ -1,50 +1,48 @@
 # src/query_engine.py
 
 from functools import lru_cache
-import re
 
 from llama_index.core import PropertyGraphIndex
 from llama_index.core.indices.property_graph import TextToCypherRetriever
 
-from .graph_store import graph_store
+from .cypher_guard import QueryRejected, bound, check, query
+from .graph_store import store_for_llama, backend
+from .ingest import AddressError
+from .intents import answer as answer_intent
 from .llm import llm
 from .patches import clean_cypher
 
-# Pre‐compile our “break impact” pattern:
-_BREAK_RE = re.compile(r"which cells break if i change\s+([\w!]+)\?", re.IGNORECASE)
-
 @lru_cache(maxsize=1)
 def _index() -> PropertyGraphIndex:
-    return PropertyGraphIndex.from_existing(property_graph_store=graph_store)
+    return PropertyGraphIndex.from_existing(property_graph_store=store_for_llama())
 
 @lru_cache(maxsize=1)
 def _make_retriever():
+    store = store_for_llama()
     return TextToCypherRetriever(
-        graph_store,
+        store,
         llm=llm,
-        text_to_cypher_template=graph_store.text_to_cypher_template,
+        text_to_cypher_template=store.text_to_cypher_template,
         response_template="{query}"
     )
 
 def ask_question(question: str) -> dict:
     """
-    Try matching our “Which cells break if I change X?” pattern first,
-    and run a pure‐Cypher lookup.  Otherwise, fall back to LLM→Cypher.
+    Try the deterministic intents first (dependents, precedents, paths,
+    sheet listings, references, counts, highlights — see src/intents.py),
+    answered from the graph without the LLM.  Otherwise, fall back to
+    LLM→Cypher.
     """
-    m = _BREAK_RE.match(question.strip())
-    if m:
-        cell = m.group(1)
-        # run direct Cypher for dependents:
-        from .graph_store import driver, Settings as _S
-        cy = """
-        MATCH (s:entity {name:$cell})
-        MATCH (s)-[:DEPENDS_ON*1..]->(d:entity)
-        RETURN DISTINCT d.name AS dep
-        """
-        with driver().session(database=_S().NEO4J_DATABASE) as ses:
-            deps = [r["dep"] for r in ses.run(cy, cell=cell)]
-        ans = f"Cells {', '.join(deps) or '—none—'} would break if you change {cell}."
-        return {"question": question, "answer": ans}
+    try:
+        routed = answer_intent(question)
+    except AddressError as e:
+        return {"question": question, "answer": str(e)}
+    if routed is not None:
+        return {"question": question, **routed}
+
+    if backend().name != "neo4j":
+        return {"question": question,
+                "answer": "Free-form questions need the Neo4j backend (GRAPH_BACKEND=neo4j)."}
 
     # otherwise, let Llama‐Index generate a Cypher query,
     # clean off any ``` fences, and execute it for us too:
@@ -56,11 +54,16 @@ def ask_question(question: str) -> dict:
         raw = retriever.to_cypher({"query_str": question})
     cypher = clean_cypher(str(raw))
 
-    # if it's a read‐only Cypher, run it:
+    # if it's a read‐only Cypher, bound it, check its plan and run it:
     if cypher.upper().startswith("MATCH"):
         from .graph_store import driver, Settings as _S
         with driver().session(database=_S().NEO4J_DATABASE) as ses:
-            result = ses.run(cypher)
+            try:
+                cypher = bound(cypher, read=True)
+                check(ses, cypher)
+            except QueryRejected as e:
+                return {"question": question, "answer": {"cypher": cypher, "rejected": str(e)}}
+            result = ses.run(query(cypher))
             rows = [record.values() for record in result]
         ans = {"cypher": cypher, "rows": rows}
         return {"question": question, "answer": ans}
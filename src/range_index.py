@@ -0,0 +1,376 @@
+# src/range_index.py
+"""
+In-process spatial index answering “which range nodes contain this cell?”,
+plus the dependents/precedents walks every graph backend shares.
+
+Each sheet gets a static centred interval tree over one axis (rows or
+columns, whichever stabs fewer ranges on that sheet); the other axis is a
+plain bounds check on the handful of candidates.  A lookup is
+O(log n + k) instead of a scan over every range.
+
+Shared-formula blocks get a BlockIndex: which blocks read a cell (stabbing
+the regions their refs sweep) and which member cells exactly, solved from
+the block's template rather than from per-cell edges.
+"""
+
+from bisect import bisect_left, bisect_right
+from statistics import median
+
+from openpyxl.utils import get_column_letter
+
+from .ingest import MAX_COL, MAX_ROW, cell_coords, qualify, range_bounds, range_node, swept_bounds
+from .parser import dependency_template, place_template
+
+
+class _IntervalTree:
+    """Static centred interval tree over closed [lo, hi] intervals."""
+
+    __slots__ = ("center", "by_lo", "by_hi", "left", "right")
+
+    def __init__(self, items):
+        # items: list of (lo, hi, payload)
+        self.center = median([lo for lo, _, _ in items] + [hi for _, hi, _ in items])
+        here, left, right = [], [], []
+        for it in items:
+            if it[1] < self.center:
+                left.append(it)
+            elif it[0] > self.center:
+                right.append(it)
+            else:
+                here.append(it)
+        self.by_lo = sorted(here, key=lambda it: it[0])
+        self.by_hi = sorted(here, key=lambda it: it[1], reverse=True)
+        self.left = _IntervalTree(left) if left else None
+        self.right = _IntervalTree(right) if right else None
+
+    def stab(self, p):
+        """Yield the payload of every interval containing p."""
+        node = self
+        while node is not None:
+            if p < node.center:
+                for lo, _, payload in node.by_lo:
+                    if lo > p:
+                        break
+                    yield payload
+                node = node.left
+            elif p > node.center:
+                for _, hi, payload in node.by_hi:
+                    if hi < p:
+                        break
+                    yield payload
+                node = node.right
+            else:
+                for _, _, payload in node.by_lo:
+                    yield payload
+                return
+
+
+class RangeIndex:
+    """Per-sheet interval trees over the bounds of `range` nodes."""
+
+    def __init__(self, ranges=()):
+        """`ranges`: iterable of (name, sheet, min_row, max_row, min_col, max_col)."""
+        by_sheet = {}
+        for rng in ranges:
+            by_sheet.setdefault(rng[1], []).append(rng)
+        self._by_sheet = by_sheet
+        self._trees = {}
+        for sheet, rngs in by_sheet.items():
+            # index the axis a random cell stabs least often
+            row_hits = sum(r[3] - r[2] + 1 for r in rngs) / (max(r[3] for r in rngs) or 1)
+            col_hits = sum(r[5] - r[4] + 1 for r in rngs) / (max(r[5] for r in rngs) or 1)
+            if row_hits <= col_hits:
+                tree = _IntervalTree([(r[2], r[3], (r[4], r[5], r[0])) for r in rngs])
+                self._trees[sheet] = (True, tree)
+            else:
+                tree = _IntervalTree([(r[4], r[5], (r[2], r[3], r[0])) for r in rngs])
+                self._trees[sheet] = (False, tree)
+        self.size = sum(len(v) for v in by_sheet.values())
+
+    @classmethod
+    def from_graph(cls, G):
+        """Build from the range nodes of a `build_nx_graph` graph."""
+        return cls(
+            (n, d["sheet"], d["min_row"], d["max_row"], d["min_col"], d["max_col"])
+            for n, d in G.nodes(data=True) if d.get("kind") == "range"
+        )
+
+    def containing(self, sheet: str, row: int, col: int) -> list[str]:
+        """Names of every range on `sheet` that covers (row, col)."""
+        entry = self._trees.get(sheet)
+        if entry is None:
+            return []
+        by_rows, tree = entry
+        p, q = (row, col) if by_rows else (col, row)
+        return [name for lo, hi, name in tree.stab(p) if lo <= q <= hi]
+
+    def overlapping(self, sheet, min_row, max_row, min_col, max_col) -> list[str]:
+        """Names of every range on `sheet` sharing at least one cell with the rectangle."""
+        return [r[0] for r in self._by_sheet.get(sheet, ())
+                if r[2] <= max_row and min_row <= r[3] and r[4] <= max_col and min_col <= r[5]]
+
+
+class CellIndex:
+    """Per-sheet sorted (row, col) of formula cells, for “which formulas sit inside this range”."""
+
+    def __init__(self, names=()):
+        self._cells = {}
+        for name in names:
+            sheet, row, col = cell_coords(name)
+            self._cells.setdefault(sheet, []).append((row, col))
+        for cells in self._cells.values():
+            cells.sort()
+
+    @classmethod
+    def from_graph(cls, G):
+        """Formula cells are the cell nodes with at least one precedent."""
+        return cls(n for n, d in G.nodes(data=True)
+                   if d.get("kind") is None and G.in_degree(n))
+
+    def count(self, sheet: str | None = None) -> int:
+        if sheet is None:
+            return sum(map(len, self._cells.values()))
+        return len(self._cells.get(sheet, ()))
+
+    def within(self, sheet, min_row, max_row, min_col, max_col) -> list[str]:
+        cells = self._cells.get(sheet, [])
+        lo = bisect_left(cells, (min_row, min_col))
+        hi = bisect_right(cells, (max_row, max_col))
+        return [f"{sheet}!{get_column_letter(c)}{r}"
+                for r, c in cells[lo:hi] if min_col <= c <= max_col]
+
+
+def _axis(x, lo, hi, a, a_abs, b, b_abs):
+    """
+    Host positions p in [lo, hi] whose ref span [a(p), b(p)] (either order)
+    covers x, where a corner is `a` if absolute else p + a.  Each bound is
+    constant or slope one in p, so the answer is at most two intervals.
+    """
+    out = []
+    for (u, u_abs), (v, v_abs) in (((a, a_abs), (b, b_abs)), ((b, b_abs), (a, a_abs))):
+        p0, p1 = lo, hi
+        if u_abs:                       # u <= x
+            if u > x:
+                continue
+        else:
+            p1 = min(p1, x - u)
+        if v_abs:                       # v >= x
+            if v < x:
+                continue
+        else:
+            p0 = max(p0, x - v)
+        if p0 <= p1:
+            out.append((p0, p1))
+    return out
+
+
+def _ends(a, a_abs, b, b_abs, limit):
+    """One axis of a ref; a whole column/row (None) runs from 1 to `limit`."""
+    if a is None:
+        return 1, True, limit, True
+    return a, a_abs, b, b_abs
+
+
+class BlockIndex:
+    """Shared-formula `block` nodes: their members, templates and swept regions."""
+
+    def __init__(self, blocks=()):
+        """`blocks`: iterable of (name, sheet, min_row, max_row, min_col, max_col, formula)."""
+        self._blocks = {}
+        swept = []
+        for name, sheet, r0, r1, c0, c1, formula in blocks:
+            tpl = dependency_template(formula, r0, c0)
+            self._blocks[name] = (sheet, r0, r1, c0, c1, tpl)
+            for ref_sheet, a, b in tpl:
+                corners = [k for k in (a, b) if k]
+                swept.append((name, qualify(ref_sheet, sheet), *swept_bounds(corners, r0, r1, c0, c1)))
+        self._readers = RangeIndex(swept)           # region a block reads -> block
+        self._members = RangeIndex(                 # block's own rectangle -> block
+            (name, b[0], b[1], b[2], b[3], b[4]) for name, b in self._blocks.items())
+        self.size = len(self._blocks)
+
+    @classmethod
+    def from_graph(cls, G):
+        return cls(
+            (n, d["sheet"], d["min_row"], d["max_row"], d["min_col"], d["max_col"], d["formula"])
+            for n, d in G.nodes(data=True) if d.get("kind") == "block"
+        )
+
+    def __contains__(self, name):
+        return name in self._blocks
+
+    def covers(self, sheet: str, row: int, col: int) -> bool:
+        """Is (sheet, row, col) a member of some block?"""
+        return bool(self._members.containing(sheet, row, col))
+
+    def containing(self, sheet: str, row: int, col: int) -> list[str]:
+        """Names of the blocks (sheet, row, col) is a member of."""
+        return self._members.containing(sheet, row, col)
+
+    def count(self, sheet: str | None = None) -> int:
+        """Member cells of every block (on `sheet`)."""
+        return sum((r1 - r0 + 1) * (c1 - c0 + 1) for bsheet, r0, r1, c0, c1, _ in self._blocks.values()
+                   if sheet is None or bsheet == sheet)
+
+    def _reading(self, sheet: str, row: int, col: int):
+        """(block sheet, [(row lo, row hi, col lo, col hi), …]) of the members reading (sheet, row, col), per block."""
+        for name in set(self._readers.containing(sheet, row, col)):
+            bsheet, r0, r1, c0, c1, tpl = self._blocks[name]
+            rects = []
+            for ref_sheet, a, b in tpl:
+                if qualify(ref_sheet, bsheet) != sheet:
+                    continue
+                b = b or a
+                for p0, p1 in _axis(row, r0, r1, *_ends(a[0], a[1], b[0], b[1], MAX_ROW)):
+                    for q0, q1 in _axis(col, c0, c1, *_ends(a[2], a[3], b[2], b[3], MAX_COL)):
+                        rects.append((p0, p1, q0, q1))
+            yield bsheet, rects
+
+    def readers(self, sheet: str, row: int, col: int) -> list[str]:
+        """Member cells of any block whose formula refers to (sheet, row, col)."""
+        out = set()
+        for bsheet, rects in self._reading(sheet, row, col):
+            for p0, p1, q0, q1 in rects:
+                out.update(f"{bsheet}!{get_column_letter(c)}{r}"
+                           for r in range(p0, p1 + 1) for c in range(q0, q1 + 1))
+        return sorted(out)
+
+    def reader_count(self, sheet: str, row: int, col: int) -> int:
+        """`len(readers(…))` without naming them: one rectangle per block is just its area."""
+        n = 0
+        for _, rects in self._reading(sheet, row, col):
+            if len(rects) == 1:
+                p0, p1, q0, q1 = rects[0]
+                n += (p1 - p0 + 1) * (q1 - q0 + 1)
+            elif rects:
+                n += len({(r, c) for p0, p1, q0, q1 in rects
+                          for r in range(p0, p1 + 1) for c in range(q0, q1 + 1)})
+        return n
+
+    def precedents(self, sheet: str, row: int, col: int) -> list[str]:
+        """Direct precedents (cells and range names) of a block member; [] for other cells."""
+        out = []
+        for name in self._members.containing(sheet, row, col):
+            bsheet, *_, tpl = self._blocks[name]
+            for ref_sheet, coord in place_template(tpl, row, col):
+                ref_sheet = qualify(ref_sheet, bsheet)
+                if ":" in coord:
+                    out.append(range_node(ref_sheet, *coord.split(":"))[0])
+                else:
+                    out.append(f"{ref_sheet}!{coord}")
+        return out
+
+    def within(self, sheet, min_row, max_row, min_col, max_col) -> list[str]:
+        """Block member cells inside a rectangle."""
+        out = []
+        for bsheet, r0, r1, c0, c1, _ in self._blocks.values():
+            if bsheet != sheet:
+                continue
+            rows = range(max(r0, min_row), min(r1, max_row) + 1)
+            cols = range(max(c0, min_col), min(c1, max_col) + 1)
+            out.extend(f"{sheet}!{get_column_letter(c)}{r}" for r in rows for c in cols)
+        return out
+
+
+# --------------------------------------------------------------------------- #
+# Walks.  `step` does one hop against whatever store holds the edges, so the
+# Neo4j and in-memory backends answer impact questions identically.
+_NO_BLOCKS = BlockIndex()
+
+
+def _dependents_level(frontier, index, step, blocks, seen, seen_ranges) -> list[str]:
+    """Unseen direct dependents of a frontier of cells (marked seen)."""
+    ranges, readers = set(), []
+    for name in frontier:
+        coords = cell_coords(name)
+        ranges.update(index.containing(*coords))
+        readers.extend(blocks.readers(*coords))
+    ranges -= seen_ranges
+    seen_ranges |= ranges
+    nxt = []
+    for d in list(step(frontier, list(ranges))) + readers:
+        if d not in seen and d not in blocks:
+            seen.add(d)
+            nxt.append(d)
+    return nxt
+
+
+def walk_dependents(cell: str, index: RangeIndex, step, blocks: BlockIndex = _NO_BLOCKS) -> list[str]:
+    """
+    Every cell that transitively depends on `cell`.  `step(cells, ranges)`
+    returns the direct dependents of a frontier of cells and of the ranges
+    the index says contain them; members of shared-formula blocks come
+    from `blocks`, cell by cell, and block nodes themselves are skipped.
+    """
+    seen, seen_ranges, frontier = {cell}, set(), [cell]
+    while frontier:
+        frontier = _dependents_level(frontier, index, step, blocks, seen, seen_ranges)
+    seen.discard(cell)
+    return sorted(seen)
+
+
+def walk_path(src: str, dst: str, index: RangeIndex, step, back, blocks: BlockIndex = _NO_BLOCKS) -> list[str]:
+    """
+    A shortest chain of cells [src, …, dst], each read directly by the
+    next, or [] if `dst` doesn't depend on `src`.  The dependents walk
+    runs level by level until it reaches `dst`; the chain is then traced
+    back with `back(names)` (direct precedents, as for `walk_precedents`),
+    picking at each hop a cell from the level before.
+    """
+    seen, seen_ranges, levels = {src}, set(), [[src]]
+    while levels[-1] and dst not in seen:
+        levels.append(_dependents_level(levels[-1], index, step, blocks, seen, seen_ranges))
+    if dst not in seen:
+        return []
+    chain = [dst]
+    for level in reversed(levels[:-1]):
+        if len(level) == 1:
+            chain.append(level[0])
+            continue
+        here = chain[-1]
+        direct = list(back([here])) + blocks.precedents(*cell_coords(here))
+        for p in direct:
+            if ":" not in p:
+                if p in level:
+                    break
+                continue
+            sheet, r0, r1, c0, c1 = range_bounds(p)
+            inside = [c for c in level if c.startswith(sheet + "!")
+                      and r0 <= cell_coords(c)[1] <= r1 and c0 <= cell_coords(c)[2] <= c1]
+            if inside:
+                p = inside[0]
+                break
+        else:
+            return []       # the graph changed under the walk
+        chain.append(p)
+    return chain[::-1]
+
+
+def walk_precedents(cell: str, formulas: CellIndex, step, blocks: BlockIndex = _NO_BLOCKS) -> list[str]:
+    """
+    Every cell or range `cell` transitively depends on.  `step(names)`
+    returns direct precedents; a range is reported by name and the walk
+    continues into the formula cells inside it (constants end the chain).
+    Block members get their precedents from the block's template.
+    """
+    seen, frontier = {cell}, [cell]
+    while frontier:
+        nxt = []
+        direct = list(step(frontier))
+        for name in frontier:
+            direct.extend(blocks.precedents(*cell_coords(name)))
+        for p in direct:
+            if p in seen:
+                continue
+            seen.add(p)
+            if ":" in p:
+                bounds = range_bounds(p)
+                for c in formulas.within(*bounds) + blocks.within(*bounds):
+                    if c not in seen:
+                        seen.add(c)
+                        nxt.append(c)
+            else:
+                nxt.append(p)
+        frontier = nxt
+    seen.discard(cell)
+    return sorted(seen)
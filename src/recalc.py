@@ -0,0 +1,558 @@
+# src/recalc.py
+"""
+Incremental recalculation over the dependency structure.
+
+Formulas are grouped into units — vertical runs of one R1C1 form, the same
+runs ingest turns into blocks — and each unit reads the regions its
+template refs sweep.  Units are linked unit → unit wherever a region
+overlaps another unit, and put in topological order once.  An edit then
+marks only the units downstream of the changed cells dirty and re-runs
+them in order; a dirty run is evaluated as one NumPy expression when its
+formula allows (see evaluator.evaluate_block), cell by cell otherwise.
+
+    eng = RecalcEngine.from_workbook("model.xlsx")
+    eng.what_if({"Inputs!B2": 10}, ["Summary!F9"])
+
+Runs that read themselves (running totals) and unit-level cycles are split
+into single cells; true circular references and formulas the evaluator
+doesn't implement keep Excel's cached value and are listed in `stale`.
+"""
+
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from heapq import heappop, heappush
+from datetime import date, datetime, time as dtime, timedelta
+
+import numpy as np
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import to_excel
+
+from .evaluator import (ERRORS, REF, NotVector, Unsupported, XlError, compile_formula,
+                        evaluate_block, evaluate_cell, evaluate_running, running_increment,
+                        vectorizable)
+from .ingest import cell_coords, formula_runs, swept_bounds
+from .parser import dependency_template
+from .range_index import RangeIndex
+from .refs import RefResolver
+
+
+def _cell_value(v):
+    """openpyxl value -> evaluator value (numbers as float, dates as serials)."""
+    if v is None or isinstance(v, (bool, float, XlError)):
+        return v
+    if isinstance(v, int):
+        return float(v)
+    if isinstance(v, (datetime, date, dtime, timedelta)):
+        return float(to_excel(v))
+    if isinstance(v, str):
+        return ERRORS.get(v, v)
+    return str(v)
+
+
+class _Sheet:
+    """
+    Column store for one sheet: a float64 array per column (NaN = empty or
+    not a number) plus the few non-numeric values (text, logicals, errors)
+    kept aside with their rows sorted, so numeric spans are plain slices.
+    """
+
+    def __init__(self):
+        self.nums = {}          # col -> float64 array indexed by row
+        self.other = {}         # col -> {row: value}
+        self.other_rows = {}    # col -> sorted rows of `other`
+        self.max_row = self.max_col = 0
+
+    def _array(self, col, upto):
+        arr = self.nums.get(col)
+        if arr is None or len(arr) <= upto:
+            grown = np.full(max(upto + 1, 2 * (len(arr) if arr is not None else 0), 64), np.nan)
+            if arr is not None:
+                grown[:len(arr)] = arr
+            arr = self.nums[col] = grown
+        return arr
+
+    def get(self, row, col):
+        other = self.other.get(col)
+        if other and row in other:
+            return other[row]
+        arr = self.nums.get(col)
+        if arr is None or row >= len(arr) or np.isnan(arr[row]):
+            return None
+        return float(arr[row])
+
+    def _drop_other(self, col, r0, r1):
+        rows = self.other_rows.get(col)
+        if not rows:
+            return
+        lo, hi = bisect_left(rows, r0), bisect_right(rows, r1)
+        for r in rows[lo:hi]:
+            del self.other[col][r]
+        del rows[lo:hi]
+
+    def set(self, row, col, value):
+        self.max_row, self.max_col = max(self.max_row, row), max(self.max_col, col)
+        self._drop_other(col, row, row)
+        number = isinstance(value, float) and not isinstance(value, XlError)
+        self._array(col, row)[row] = value if number else np.nan
+        if value is not None and not number:
+            self.other.setdefault(col, {})[row] = value
+            insort(self.other_rows.setdefault(col, []), row)
+
+    def set_column(self, col, r0, values):
+        r1 = r0 + len(values) - 1
+        self.max_row, self.max_col = max(self.max_row, r1), max(self.max_col, col)
+        self._drop_other(col, r0, r1)
+        self._array(col, r1)[r0:r1 + 1] = values
+
+    def snapshot(self, col, r0, r1):
+        arr = self._array(col, r1)
+        other = self.other.get(col, {})
+        rows = self.other_rows.get(col, [])
+        kept = [(r, other[r]) for r in rows[bisect_left(rows, r0):bisect_right(rows, r1)]]
+        return col, r0, arr[r0:r1 + 1].copy(), kept
+
+    def restore(self, snap):
+        col, r0, values, kept = snap
+        self.set_column(col, r0, values)
+        for r, v in kept:
+            self.set(r, col, v)
+
+    # ── range reads ───────────────────────────────────────────────────────────
+    def _clip(self, r0, r1, c0, c1):
+        return r0, min(r1, max(self.max_row, r0)), c0, min(c1, max(self.max_col, c0))
+
+    def numbers(self, r0, r1, c0, c1):
+        r0, r1, c0, c1 = self._clip(r0, r1, c0, c1)
+        parts = [arr[r0:r1 + 1] for c, arr in self.nums.items() if c0 <= c <= c1]
+        if not parts:
+            return np.empty(0)
+        flat = np.concatenate(parts)
+        return flat[~np.isnan(flat)]
+
+    def first_error(self, r0, r1, c0, c1):
+        for c in range(c0, min(c1, self.max_col) + 1):
+            rows = self.other_rows.get(c)
+            if not rows:
+                continue
+            for r in rows[bisect_left(rows, r0):bisect_right(rows, r1)]:
+                if isinstance(self.other[c][r], XlError):
+                    return self.other[c][r]
+        return None
+
+    def grid(self, r0, r1, c0, c1):
+        """The rectangle's numbers as a 2-D float array (NaN elsewhere) and {(i, j): other value}."""
+        out = np.full((r1 - r0 + 1, c1 - c0 + 1), np.nan)
+        others = {}
+        for c in range(c0, min(c1, self.max_col) + 1):
+            arr = self.nums.get(c)
+            if arr is not None and r0 < len(arr):
+                span = arr[r0:r1 + 1]
+                out[:len(span), c - c0] = span
+            rows = self.other_rows.get(c)
+            if rows:
+                for r in rows[bisect_left(rows, r0):bisect_right(rows, r1)]:
+                    others[(r - r0, c - c0)] = self.other[c][r]
+        return out, others
+
+    def values(self, r0, r1, c0, c1):
+        r0, r1, c0, c1 = self._clip(r0, r1, c0, c1)
+        return [[self.get(r, c) for c in range(c0, c1 + 1)] for r in range(r0, r1 + 1)]
+
+    def column(self, col, r0, n):
+        """Rows r0..r0+n-1 of `col` as floats (empty = 0), or None if any is non-numeric."""
+        rows = self.other_rows.get(col)
+        if rows and bisect_left(rows, r0) < bisect_left(rows, r0 + n):
+            return None
+        arr = self.nums.get(col)
+        out = np.zeros(n)
+        if arr is not None and r0 < len(arr):
+            span = arr[r0:r0 + n]
+            out[:len(span)] = np.nan_to_num(span, nan=0.0)
+        return out
+
+
+class _Missing(_Sheet):
+    """Refs to a sheet the workbook doesn't have read as #REF!."""
+
+    def get(self, row, col):
+        return REF
+
+    def first_error(self, r0, r1, c0, c1):
+        return REF
+
+    def column(self, col, r0, n):
+        return None
+
+
+class RecalcEngine:
+    def __init__(self):
+        self.sheets = {}        # title -> _Sheet
+        self._titles = {}       # lower-cased title -> title
+        self.compiled = {}      # R1C1 key -> (node or None, vectorisable, template)
+        self.units = []         # [sheet, col, r0, r1, key]
+        self.pinned = set()     # formula cells overridden by set_value
+        self.cyclic = set()     # unit ids on a circular reference
+        self.stats = {}
+
+    # ── loading ───────────────────────────────────────────────────────────────
+    @classmethod
+    def from_workbook(cls, path: str):
+        """Parse formulas, load Excel's cached values, link units; recalculates if values are missing."""
+        eng, t0 = cls(), time.perf_counter()
+        runs, formulas = [], 0
+        wb = load_workbook(path, read_only=True, data_only=False)
+        try:
+            refs = RefResolver(wb)
+            for ws in wb.worksheets:
+                sheet = eng._add_sheet(ws.title)
+                store = eng.sheets[sheet]
+
+                def constant(r, c, val, store=store):
+                    if val is not None and not (isinstance(val, str) and val.startswith("=")):
+                        store.set(r, c, _cell_value(val))
+                found, _ = formula_runs(ws, refs, constant)
+                for key, formula, c, r0, r1 in found:
+                    formulas += r1 - r0 + 1
+                    eng._compile(key, formula, r0, c)
+                    runs.append([sheet, c, r0, r1, key])
+        finally:
+            wb.close()
+
+        # cached results of the formula cells
+        missing = 0
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            by_sheet = {}
+            for run in runs:
+                by_sheet.setdefault(run[0], []).append(run)
+            for ws in wb.worksheets:
+                mine = by_sheet.get(ws.title)
+                if not mine:
+                    continue
+                cells = {(r, c) for _, c, r0, r1, _ in mine for r in range(r0, r1 + 1)}
+                store = eng.sheets[ws.title]
+                for r, values in enumerate(ws.iter_rows(values_only=True), start=1):
+                    for c, val in enumerate(values, start=1):
+                        if (r, c) in cells:
+                            missing += val is None
+                            store.set(r, c, _cell_value(val))
+        finally:
+            wb.close()
+
+        eng.units = [list(run) for run in runs]
+        eng._link()
+        eng.stats = {"formulas": formulas, "units": len(eng.units), "keys": len(eng.compiled),
+                     "load_seconds": round(time.perf_counter() - t0, 4)}
+        if missing:
+            eng.stats["recalculated"] = eng.recalculate()
+        return eng
+
+    def _add_sheet(self, title):
+        self.sheets[title] = _Sheet()
+        self._titles[title.lower()] = title
+        return title
+
+    def _compile(self, key, formula, row, col):
+        if key in self.compiled:
+            return
+        try:
+            node = compile_formula(formula, row, col)
+        except Unsupported:
+            node = None
+        tpl = dependency_template(formula, row, col)
+        self.compiled[key] = (node, node is not None and vectorizable(node), tpl)
+
+    # ── dependency structure ──────────────────────────────────────────────────
+    def _regions(self, u):
+        sheet, col, r0, r1, key = self.units[u]
+        out = []
+        for ref_sheet, a, b in self.compiled[key][2]:
+            ref_sheet = self._title(ref_sheet) if ref_sheet else sheet
+            out.append((ref_sheet, *swept_bounds([k for k in (a, b) if k], r0, r1, col, col)))
+        return out
+
+    def _upward(self, u):
+        """Does every ref of run `u` that hits the run itself point strictly above the host row?"""
+        sheet, col, r0, r1, key = self.units[u]
+        for ref_sheet, a, b in self.compiled[key][2]:
+            corners = [k for k in (a, b) if k]
+            s = self._title(ref_sheet) if ref_sheet else sheet
+            lo, hi, c0, c1 = swept_bounds(corners, r0, r1, col, col)
+            if s != sheet or not (c0 <= col <= c1 and lo <= r1 and hi >= r0):
+                continue
+            if any(k[0] is None or k[1] or k[0] >= 0 for k in corners):
+                return False
+        return True
+
+    def _overlapping(self, sheet, r0, r1, c0, c1):
+        """Unit ids whose cells intersect the rectangle."""
+        cols = self._cols.get(sheet)
+        if not cols:
+            return []
+        keys = self._col_keys[sheet]
+        out = []
+        for c in keys[bisect_left(keys, c0):bisect_right(keys, c1)]:
+            spans = cols[c]     # sorted, disjoint (r0, r1, uid)
+            i = max(bisect_right(spans, (r0,)) - 1, 0)
+            while i < len(spans) and spans[i][0] <= r1:
+                if spans[i][1] >= r0:
+                    out.append(spans[i][2])
+                i += 1
+        return out
+
+    def _index_units(self):
+        self._cols, self._col_keys = {}, {}
+        for u, (sheet, col, r0, r1, _) in enumerate(self.units):
+            self._cols.setdefault(sheet, {}).setdefault(col, []).append((r0, r1, u))
+        for sheet, cols in self._cols.items():
+            for spans in cols.values():
+                spans.sort()
+            self._col_keys[sheet] = sorted(cols)
+
+    def _split(self, ids):
+        """Replace the given units by one unit per cell."""
+        ids = set(ids)
+        units = [u for i, u in enumerate(self.units) if i not in ids]
+        for i in sorted(ids):
+            sheet, col, r0, r1, key = self.units[i]
+            units.extend([sheet, col, r, r, key] for r in range(r0, r1 + 1))
+        self.units = units
+
+    def _link(self):
+        """Unit → unit edges, topological ranks and the readers index."""
+        self._index_units()
+        regions = [self._regions(u) for u in range(len(self.units))]
+        # runs that read their own cells: top-down if they only look upward
+        # (running totals), otherwise split into single cells
+        selfish, self.ordered = [], set()
+        for u, regs in enumerate(regions):
+            if self.units[u][3] > self.units[u][2] and any(u in self._overlapping(*reg) for reg in regs):
+                (self.ordered.add(u) if self._upward(u) else selfish.append(u))
+        if selfish:
+            self._split(selfish)
+            return self._link()
+
+        self.deps = [set() for _ in self.units]      # unit -> units reading it
+        indeg = [0] * len(self.units)
+        for u, regs in enumerate(regions):
+            for v in {v for reg in regs for v in self._overlapping(*reg)}:
+                if v != u:
+                    self.deps[v].add(u)
+                    indeg[u] += 1
+                elif u not in self.ordered:
+                    self.cyclic.add(u)      # a single cell reading itself
+
+        order = [u for u in range(len(self.units)) if not indeg[u]]
+        queue = deque(order)
+        while queue:
+            for w in self.deps[queue.popleft()]:
+                indeg[w] -= 1
+                if not indeg[w]:
+                    order.append(w)
+                    queue.append(w)
+        stuck = [u for u in range(len(self.units)) if indeg[u]]
+        if any(self.units[u][3] > self.units[u][2] for u in stuck):
+            self.cyclic.clear()
+            self._split([u for u in stuck if self.units[u][3] > self.units[u][2]])
+            return self._link()
+        self.cyclic.update(stuck)
+        self.rank = [0] * len(self.units)
+        for i, u in enumerate(order):
+            self.rank[u] = i
+        self.order = order
+        self._readers = RangeIndex((u, *reg) for u, regs in enumerate(regions) for reg in regs)
+
+    # ── reads (the interface evaluator.py expects) ────────────────────────────
+    def _title(self, sheet):
+        return self._titles.get(sheet.lower(), sheet)
+
+    def _sheet(self, sheet):
+        return self.sheets.get(sheet) or self.sheets.get(self._title(sheet)) or _Missing()
+
+    def value(self, sheet, row, col):
+        return self._sheet(sheet).get(row, col)
+
+    def numbers(self, sheet, r0, r1, c0, c1):
+        return self._sheet(sheet).numbers(r0, r1, c0, c1)
+
+    def first_error(self, sheet, r0, r1, c0, c1):
+        return self._sheet(sheet).first_error(r0, r1, c0, c1)
+
+    def values(self, sheet, r0, r1, c0, c1):
+        return self._sheet(sheet).values(r0, r1, c0, c1)
+
+    def grid(self, sheet, r0, r1, c0, c1):
+        return self._sheet(sheet).grid(r0, r1, c0, c1)
+
+    def column(self, sheet, col, r0, n):
+        return self._sheet(sheet).column(col, r0, n)
+
+    def extent(self, sheet):
+        s = self._sheet(sheet)
+        return max(s.max_row, 1), max(s.max_col, 1)
+
+    # ── evaluation ────────────────────────────────────────────────────────────
+    def _run(self, u, lo=None, hi=None, undo=None):
+        """Evaluate rows lo..hi (default: all) of unit `u`; returns cells computed."""
+        sheet, col, r0, r1, key = self.units[u]
+        node, vector, _ = self.compiled[key]
+        if node is None or u in self.cyclic:
+            return 0
+        lo, hi = r0 if lo is None else lo, r1 if hi is None else hi
+        store = self.sheets[sheet]
+        if undo is not None:
+            undo.append((store, store.snapshot(col, lo, hi)))
+        pinned = {r: store.get(r, col) for r in range(lo, hi + 1)
+                  if (sheet, r, col) in self.pinned} if self.pinned else {}
+        if u in self.ordered:
+            inc = running_increment(node, sheet, col)
+            if inc is not None and not pinned:
+                try:
+                    store.set_column(col, lo, evaluate_running(inc, self, sheet, lo, hi, col))
+                    return hi - lo + 1
+                except NotVector:
+                    pass
+            # top-down, each row sees the ones above it already updated
+            for r in range(lo, hi + 1):
+                if r not in pinned:
+                    store.set(r, col, evaluate_cell(node, self, sheet, r, col))
+            return hi - lo + 1
+        out = None
+        if vector and hi > lo:
+            try:
+                out = evaluate_block(node, self, sheet, lo, hi, col)
+            except NotVector:
+                pass
+        if out is None:
+            out = [evaluate_cell(node, self, sheet, r, col) for r in range(lo, hi + 1)]
+        if all(type(v) is float for v in out):
+            store.set_column(col, lo, np.asarray(out, dtype=float))
+        else:
+            for r, v in enumerate(out, start=lo):
+                store.set(r, col, v)
+        for r, v in pinned.items():
+            store.set(r, col, v)
+        return hi - lo + 1
+
+    def recalculate(self) -> int:
+        """Evaluate every formula in dependency order; returns cells computed."""
+        return sum(self._run(u) for u in self.order)
+
+    def _rows_hit(self, u, sheet, a, b, ca, cb):
+        """
+        Host rows of unit `u` whose refs touch rows a..b × cols ca..cb of
+        `sheet`, as one (lo, hi) hull, or None.  A ref's row bounds are each
+        constant or host row + delta, so every ref gives one interval.
+        """
+        home, col, r0, r1, key = self.units[u]
+        lo = hi = None
+        for ref_sheet, x, y in self.compiled[key][2]:
+            if (self._title(ref_sheet) if ref_sheet else home) != sheet:
+                continue
+            corners = [k for k in (x, y) if k]
+            cols = [c if c_abs else col + c for _, _, c, c_abs in corners if c is not None]
+            if cols and (max(cols) < ca or min(cols) > cb):
+                continue
+            if any(r is None for r, _, _, _ in corners):
+                p0, p1 = r0, r1
+            else:
+                # some corner at or above b, and some corner at or below a
+                p1 = max(b - r if not r_abs else (r1 if r <= b else r0 - 1) for r, r_abs, _, _ in corners)
+                p0 = min(a - r if not r_abs else (r0 if r >= a else r1 + 1) for r, r_abs, _, _ in corners)
+                p0, p1 = max(p0, r0), min(p1, r1)
+            if p0 <= p1:
+                lo, hi = (p0, p1) if lo is None else (min(lo, p0), max(hi, p1))
+        return None if lo is None else (lo, hi)
+
+    def _propagate(self, cells, undo=None) -> int:
+        """Recompute the dirty rows downstream of `cells` in topological order."""
+        dirty, heap = {}, []
+
+        def mark(u, *rect):
+            if u in self.cyclic or (span := self._rows_hit(u, *rect)) is None:
+                return
+            if u in dirty:
+                lo, hi = dirty[u]
+                dirty[u] = min(lo, span[0]), max(hi, span[1])
+            else:
+                dirty[u] = span
+                heappush(heap, (self.rank[u], u))
+
+        for sheet, row, col in cells:
+            for u in set(self._readers.containing(sheet, row, col)):
+                mark(u, sheet, row, row, col, col)
+        done = 0
+        while heap:
+            _, u = heappop(heap)
+            lo, hi = dirty.pop(u)
+            sheet, col, _, r1, _ = self.units[u]
+            if u in self.ordered:
+                hi = r1         # a change flows down the rest of the run
+            done += self._run(u, lo, hi, undo)
+            for w in self.deps[u]:
+                mark(w, sheet, lo, hi, col, col)
+        return done
+
+    def _parse(self, cell):
+        sheet, row, col = cell_coords(cell.replace("$", ""))
+        sheet = self._title(sheet.strip("'"))
+        if sheet not in self.sheets:
+            raise KeyError(f"no sheet {sheet!r}")
+        return sheet, row, col
+
+    def _apply(self, changes, undo=None):
+        """Write inputs, then recompute their dirty cone; returns (cells written, cells recomputed)."""
+        cells = []
+        for cell, v in changes.items():
+            sheet, row, col = self._parse(cell)
+            store = self.sheets[sheet]
+            if undo is not None:
+                undo.append((store, store.snapshot(col, row, row)))
+            # overriding a formula cell pins it until the override is undone
+            if self._overlapping(sheet, row, row, col, col):
+                self.pinned.add((sheet, row, col))
+            store.set(row, col, _cell_value(v))
+            cells.append((sheet, row, col))
+        return len(cells), self._propagate(cells, undo)
+
+    def set_values(self, changes: dict) -> int:
+        """Permanently write {"Sheet!A1": value, …}; returns formula cells recomputed."""
+        return self._apply(changes)[1]
+
+    def set_value(self, cell: str, value) -> int:
+        return self.set_values({cell: value})
+
+    def get(self, cell: str):
+        sheet, row, col = self._parse(cell)
+        return self.sheets[sheet].get(row, col)
+
+    def what_if(self, changes: dict, targets: list[str]) -> dict:
+        """
+        Values of `targets` had `changes` been made; the engine is left as it
+        was.  Only the dirty cone is recomputed, then rolled back.
+        """
+        t0 = time.perf_counter()
+        undo, pinned = [], set(self.pinned)
+        try:
+            written, recomputed = self._apply(changes, undo)
+            t1 = time.perf_counter()
+            values = {t: self.get(t) for t in targets}
+        finally:
+            for store, snap in reversed(undo):
+                store.restore(snap)
+            self.pinned = pinned
+        return {"values": values, "inputs": written, "recomputed": recomputed,
+                "ms": {"recalc": round((t1 - t0) * 1000, 3),
+                       "total": round((time.perf_counter() - t0) * 1000, 3)}}
+
+    @property
+    def stale(self) -> list[str]:
+        """Formula cells showing Excel's cached value: unsupported formulas and circular refs."""
+        out = []
+        for u, (sheet, col, r0, r1, key) in enumerate(self.units):
+            if self.compiled[key][0] is None or u in self.cyclic:
+                letter = get_column_letter(col)
+                out.append(f"{sheet}!{letter}{r0}" + (f":{letter}{r1}" if r1 > r0 else ""))
+        return out
@@ -0,0 +1,234 @@
+# src/refs.py
+"""
+Workbook-level reference resolution for ingest.
+
+Some refs only mean something against the workbook: defined names (`Rate`,
+global or sheet-scoped), Excel tables (`Sales[Amount]`, `[@Qty]`), 3D
+sheet spans (`Jan:Mar!B2`) and refs into other workbooks, which the file
+stores against an external-link index (`[1]Sheet1!A1`).  `RefResolver.rewrite` turns them into plain A1
+text before a formula is keyed and parsed, so the rest of the pipeline (R1C1
+templates, blocks, range nodes) only ever sees cells and rectangles.
+Nothing is expanded per cell: a table column is one rectangle, a 3D ref one
+ref per sheet in the span.
+"""
+
+import hashlib, re
+from typing import NamedTuple
+from urllib.parse import unquote
+
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.utils import get_column_letter, range_boundaries
+from openpyxl.worksheet.table import Table
+from openpyxl.xml.functions import fromstring
+
+from .parser import tokenize
+
+_MAX_DEPTH = 8          # names defined in terms of names
+_3D_RE = re.compile(r"(?:'[^']*:[^']*'|[A-Za-z_][\w.]*:[A-Za-z_][\w.]*)!")
+_ITEM_RE = re.compile(r"\[((?:'.|[^\[\]'])*)\]")
+_ESCAPE_RE = re.compile(r"'(.)")
+_BOOK_RE = re.compile(r"\[[^\[\]]+\]")                        # the `[1]` of [1]Sheet1!A1
+_EXTERNAL_RE = re.compile(r"(?:.*[\\/])?\[([^\[\]]+)\](.+)")   # [1]Sheet1, C:\dir\[Budget.xlsx]Sheet1
+
+
+class TableInfo(NamedTuple):
+    sheet: str
+    min_row: int
+    max_row: int
+    min_col: int
+    max_col: int
+    header_rows: int
+    totals_rows: int
+    columns: list[str]      # lower-cased, left to right
+
+
+def _quote(sheet: str) -> str:
+    return "'" + sheet.replace("'", "''") + "'"
+
+
+def _sheet_tables(wb, ws):
+    if hasattr(ws, "tables"):
+        return list(ws.tables.values())
+    # read-only worksheets don't load their tables; read the parts directly
+    archive = wb._archive
+    rels_path = get_rels_path(ws._worksheet_path)
+    if rels_path not in archive.namelist():
+        return []
+    rels = get_dependents(archive, rels_path)
+    return [Table.from_tree(fromstring(archive.read(rel.target)))
+            for rel in rels.find(Table._rel_type)]
+
+
+def load_tables(wb) -> dict[str, TableInfo]:
+    """{lower-cased display name: TableInfo} for every table in `wb`."""
+    tables = {}
+    for ws in wb.worksheets:
+        for t in _sheet_tables(wb, ws):
+            min_col, min_row, max_col, max_row = range_boundaries(t.ref)
+            tables[t.displayName.lower()] = TableInfo(
+                ws.title, min_row, max_row, min_col, max_col,
+                t.headerRowCount if t.headerRowCount is not None else 1,
+                t.totalsRowCount or 0,
+                [c.name.lower() for c in t.tableColumns],
+            )
+    return tables
+
+
+def load_links(wb) -> dict[str, str]:
+    """{"1": "Budget.xlsx", …}: the file name behind each external-link index."""
+    books = {}
+    for i, link in enumerate(getattr(wb, "_external_links", ()), start=1):
+        target = link.file_link.Target if link.file_link is not None else None
+        if target:
+            books[str(i)] = unquote(target.replace("\\", "/")).rsplit("/", 1)[-1]
+    return books
+
+
+class RefResolver:
+    """Rewrites names, structured refs and 3D refs of one workbook into A1 text."""
+
+    def __init__(self, wb):
+        self.sheets = [ws.title for ws in wb.worksheets]
+        self._sheet_pos = {s.lower(): i for i, s in enumerate(self.sheets)}
+        self.tables = load_tables(wb)
+        self.links = load_links(wb)
+        self._names = {n.lower(): d.attr_text for n, d in wb.defined_names.items()
+                       if not d.is_reserved}
+        self._local = {ws.title: {n.lower(): d.attr_text for n, d in ws.defined_names.items()
+                                  if not d.is_reserved}
+                       for ws in wb.worksheets}
+        every = set(self._names).union(*self._local.values())
+        self._names_re = re.compile(
+            r"(?<![\w.])(?:" + "|".join(map(re.escape, sorted(every, key=len, reverse=True)))
+            + r")(?![\w.(])", re.IGNORECASE) if every else None
+
+    def digest(self) -> str:
+        """Digest of everything `rewrite` looks up, e.g. to key cached per-sheet results."""
+        state = (self.sheets, sorted(self.tables.items()), sorted(self._names.items()),
+                 sorted((s, sorted(names.items())) for s, names in self._local.items()),
+                 sorted(self.links.items()))
+        return hashlib.blake2b(repr(state).encode(), digest_size=16).hexdigest()
+
+    def _needs(self, formula: str) -> bool:
+        """Cheap pre-check so ordinary formulas skip the extra lexing pass."""
+        return ("[" in formula
+                or self._names_re is not None and self._names_re.search(formula) is not None
+                or "!" in formula and _3D_RE.search(formula) is not None)
+
+    def rewrite(self, formula: str, sheet: str, row: int, col: int) -> str:
+        """`formula` as written in (sheet, row, col), with every workbook-level ref made A1."""
+        if not self._needs(formula):
+            return formula
+        return self._rewrite(formula, sheet, row, col, 0)
+
+    def _rewrite(self, formula, sheet, row, col, depth):
+        out, last = [], 0
+        toks = tokenize(formula)
+        for i, tok in enumerate(toks):
+            if tok.pos < last:
+                continue        # the ref half of an external [1]Sheet1!A1, already rewritten
+            new, end = None, tok.pos + len(tok.text)
+            nxt = toks[i + 1] if i + 1 < len(toks) else None
+            if tok.kind == "ref" and tok.sheet and "[" in tok.sheet:
+                new = self._external(tok.sheet, tok)
+            elif (tok.kind == "table" and nxt is not None and nxt.kind == "ref" and nxt.sheet
+                  and nxt.pos == end and _BOOK_RE.fullmatch(tok.text)):
+                new, end = self._external(tok.text + nxt.sheet, nxt), nxt.pos + len(nxt.text)
+            elif tok.kind == "ref" and tok.sheet and ":" in tok.sheet:
+                new = self._span(tok)
+            elif tok.kind == "table":
+                new = self._structured(tok.text, sheet, row, col)
+            elif tok.kind == "name" and depth < _MAX_DEPTH:
+                value = self._name(tok.text, sheet)
+                if value is not None:
+                    new = "(" + self._rewrite(value, sheet, row, col, depth + 1) + ")"
+            if new is not None:
+                out.append(formula[last:tok.pos])
+                out.append(new)
+                last = end
+        out.append(formula[last:])
+        return "".join(out)
+
+    # ── defined names ─────────────────────────────────────────────────────────
+    def _name(self, name, sheet):
+        key = name.lower()
+        value = self._local.get(sheet, {}).get(key, self._names.get(key))
+        if value is None:
+            return None
+        return value[1:] if value.startswith("=") else value
+
+    # ── external refs ─────────────────────────────────────────────────────────
+    def _external(self, sheet, tok):
+        """'[1]Sheet1' + '!A1' -> '[Budget.xlsx]Sheet1'!A1, the linked file by name only."""
+        m = _EXTERNAL_RE.fullmatch(sheet)
+        if m is None:
+            return None
+        coord = tok.text.rsplit("!", 1)[1]
+        if m[1] == "0":
+            return _quote(m[2]) + "!" + coord      # [0] is this workbook
+        return _quote(f"[{self.links.get(m[1], m[1])}]{m[2]}") + "!" + coord
+
+    # ── 3D refs ───────────────────────────────────────────────────────────────
+    def _span(self, tok):
+        """'Jan:Mar!B2' -> ('Jan'!B2,'Feb'!B2,'Mar'!B2), in workbook sheet order."""
+        first, last = (self._sheet_pos.get(s.lower()) for s in tok.sheet.split(":", 1))
+        if first is None or last is None:
+            return "#REF!"
+        first, last = sorted((first, last))
+        coord = tok.text.rsplit("!", 1)[1]
+        return "(" + ",".join(f"{_quote(s)}!{coord}" for s in self.sheets[first:last + 1]) + ")"
+
+    # ── structured refs ───────────────────────────────────────────────────────
+    def _table_at(self, sheet, row, col):
+        for t in self.tables.values():
+            if t.sheet == sheet and t.min_row <= row <= t.max_row and t.min_col <= col <= t.max_col:
+                return t
+        return None
+
+    def _structured(self, text, sheet, row, col):
+        """
+        'Sales[[#Headers],[Qty]:[Price]]' -> one A1 rectangle.  `@` / `#This
+        Row` becomes the host row with a relative row, so a table's
+        calculated column still fills into one block.
+        """
+        name, body = text.split("[", 1)
+        table = self.tables.get(name.lower()) if name else self._table_at(sheet, row, col)
+        if table is None:
+            return None
+        body = body[:-1].strip()
+        this_row = body.startswith("@")
+        if this_row:
+            body = body[1:].strip()
+        items = _ITEM_RE.findall(body) if body.startswith("[") else ([body] if body else [])
+        items = [_ESCAPE_RE.sub(r"\1", i).strip().lower() for i in items]
+        specials = {i for i in items if i.startswith("#")}
+        columns = [i for i in items if not i.startswith("#")]
+        this_row = this_row or "#this row" in specials
+
+        if columns:
+            try:
+                cols = [table.min_col + table.columns.index(c) for c in columns]
+            except ValueError:
+                return "#REF!"
+            c0, c1 = min(cols), max(cols)
+        else:
+            c0, c1 = table.min_col, table.max_col
+        c0, c1 = get_column_letter(c0), get_column_letter(c1)
+        ref = _quote(table.sheet) + "!"
+        if this_row:
+            return ref + (f"${c0}{row}" if c0 == c1 else f"${c0}{row}:${c1}{row}")
+
+        data = (table.min_row + table.header_rows, table.max_row - table.totals_rows)
+        spans = {
+            "#all": (table.min_row, table.max_row),
+            "#data": data,
+            "#headers": (table.min_row, table.min_row + table.header_rows - 1),
+            "#totals": (table.max_row - table.totals_rows + 1, table.max_row),
+        }
+        rows = [spans[s] for s in specials if s in spans] or [data]
+        r0, r1 = min(r for r, _ in rows), max(r for _, r in rows)
+        if r0 > r1:
+            return "#REF!"      # e.g. #Totals on a table without a totals row
+        if (c0, r0) == (c1, r1):
+            return ref + f"${c0}${r0}"
+        return ref + f"${c0}${r0}:${c1}${r1}"
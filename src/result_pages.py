@@ -0,0 +1,90 @@
+# src/result_pages.py
+"""
+Bounded reads of free-form Cypher results for /run.
+
+A result is never materialised whole.  The driver pulls records
+RUN_FETCH_SIZE at a time, and they are either cut into pages of at most
+`limit` rows, with a cursor for the next page (None on the last), or
+written out one NDJSON line per row.  Either way a query stops at
+RUN_MAX_ROWS rows, and the response says it was truncated.
+
+A paged read runs as rewritten by cypher_guard.paged: ordered on every
+result column, with the page cut out on the server by `SKIP $_skip LIMIT
+$_limit`, so a page costs its own rows rather than every row before it.
+A cursor carries that Cypher, its parameters, the row reached, the
+window of rows the original query returns (its own SKIP and LIMIT) and
+the graph version it was cut from; after a graph change the cursor is
+refused (409) and the client starts over.  Cursors are signed with a per-process key, so a
+client can't hand in Cypher of its own through one, and a restart
+invalidates them.
+"""
+
+import base64, binascii, hashlib, hmac, json, secrets
+
+from .viewport import CursorError, StaleCursor
+
+_KEY = secrets.token_bytes(16)
+
+
+def row(record) -> list:
+    """One record as a JSON-ready list: nodes and relationships become their properties."""
+    return list(record.data().values())
+
+
+# ── cursors ───────────────────────────────────────────────────────────────────
+def _sign(raw: bytes) -> str:
+    return hmac.new(_KEY, raw, hashlib.blake2b).hexdigest()[:32]
+
+
+def encode_cursor(cypher: str, params: dict, offset: int, window: tuple[int, int], version: int) -> str:
+    raw = json.dumps({"c": cypher, "p": params, "o": offset, "w": window, "v": version},
+                     separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=") + "." + _sign(raw)
+
+
+def decode_cursor(cursor: str, version: int) -> tuple[str, dict, int, tuple[int, int]]:
+    """(cypher, params, offset, window) of a cursor issued by this process for graph `version`."""
+    body, _, sig = cursor.partition(".")
+    try:
+        raw = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+    except (ValueError, binascii.Error):
+        raise CursorError("malformed cursor")
+    if not hmac.compare_digest(sig, _sign(raw)):
+        raise CursorError("unknown cursor (the server may have restarted)")
+    state = json.loads(raw)
+    if state["v"] != version:
+        raise StaleCursor("the graph changed since this cursor was issued")
+    return state["c"], state["p"], state["o"], tuple(state["w"])
+
+
+# ── reading ───────────────────────────────────────────────────────────────────
+async def read_page(result, limit: int) -> tuple[list, bool]:
+    """The first `limit` rows of an async result (already cut to a page), and whether any follow."""
+    rows = []
+    async for record in result:
+        if len(rows) == limit:
+            return rows, True
+        rows.append(row(record))
+    return rows, False
+
+
+async def ndjson(result, head: dict, max_rows: int):
+    """
+    `head`, then one JSON array per row, then a closing
+    {"done", "rows", "truncated"} line.  A failure part-way through ends
+    the stream with an {"error"} line instead, since the status code has
+    already gone out.
+    """
+    yield json.dumps(head, default=str) + "\n"
+    n, truncated = 0, False
+    try:
+        async for record in result:
+            if n == max_rows:
+                truncated = True
+                break
+            yield json.dumps(row(record), default=str) + "\n"
+            n += 1
+    except Exception as e:
+        yield json.dumps({"error": f"Cypher failed: {e}"}) + "\n"
+        return
+    yield json.dumps({"done": True, "rows": n, "truncated": truncated}) + "\n"
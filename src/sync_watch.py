@@ -1,37 +1,331 @@
-import time, pathlib, argparse
+import fnmatch, glob, hashlib, logging, os, threading, time, pathlib, zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple
+import networkx as nx
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+from .config import Settings
 from .ingest import build_nx_graph
-from .graph_store import clear_db, upsert_graph
+from .parse_cache import sheet_cache
+from .graph_store import backend
+from .metrics import STAGE_SECONDS, SYNC_CHANGES, serve, stage
 import requests
 
+_cfg = Settings()
+log = logging.getLogger(__name__)
+_GLOB_CHARS = set("*?[")
+
+
+def _digest(path: pathlib.Path) -> str | None:
+    """blake2b of the file's bytes, or None if it can't be read right now."""
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def _parse(path: str, book: str | None, known: str | None):
+    """
+    Pool task: (digest, graph, seconds) of one workbook; the graph is None
+    if it still hashes to `known`.  Timed here, since metrics recorded in
+    a pool process never reach the parent's /metrics.
+    """
+    t0 = time.perf_counter()
+    digest = _digest(pathlib.Path(path))
+    if digest is None or digest == known:
+        return digest, None, time.perf_counter() - t0
+    return digest, build_nx_graph(path, book=book, cache=sheet_cache()), time.perf_counter() - t0
+
+
+# ── what to watch ─────────────────────────────────────────────────────────────
+class Target(NamedTuple):
+    files: list[pathlib.Path]   # workbooks there right now
+    root: pathlib.Path          # directory handed to the observer
+    recursive: bool
+    pattern: str | None         # glob the workbooks match; None when watching one file
+
+    def matches(self, path: pathlib.Path) -> bool:
+        if self.pattern is None:
+            return path == self.files[0]
+        if path.name.startswith("~$"):          # Excel's lock file next to an open workbook
+            return False
+        return _glob_match(path.parts, pathlib.Path(self.pattern).parts)
+
+
+def _glob_match(parts, pattern) -> bool:
+    """Path components against glob components, as glob(recursive=True) matches them."""
+    if not pattern:
+        return not parts
+    if pattern[0] == "**":      # zero or more directories
+        return any(_glob_match(parts[i:], pattern[1:]) for i in range(len(parts) + 1))
+    # `*` and `?` stay within one component
+    return bool(parts) and fnmatch.fnmatch(parts[0], pattern[0]) and _glob_match(parts[1:], pattern[1:])
+
+
+def _target(spec: str) -> Target:
+    """A workbook, a directory (every .xlsx below it) or a glob ('share/**/*.xlsx')."""
+    p = pathlib.Path(spec).expanduser().absolute()
+    if p.is_dir():
+        p = p / "**" / "*.xlsx"
+    elif not _GLOB_CHARS & set(str(p)):
+        return Target([p], p.parent, False, None)
+    # watch from the deepest directory before the first wildcard
+    i = next(i for i, part in enumerate(p.parts) if _GLOB_CHARS & set(part))
+    t = Target([], pathlib.Path(*p.parts[:i]), i < len(p.parts) - 1, str(p))
+    found = (pathlib.Path(os.path.abspath(f)) for f in glob.glob(str(p), recursive=True))
+    t.files.extend(sorted(f for f in found if f.is_file() and t.matches(f)))
+    return t
+
+
+# ── scheduling ────────────────────────────────────────────────────────────────
+class SyncScheduler:
+    """
+    Turns bursts of file events into background syncs of the workbooks they touch.
+
+    Events only bump a per-workbook generation counter; one worker thread
+    waits until a workbook has had no event for `debounce` seconds, then
+    until its size and mtime hold still and it opens as a zip (so
+    half-written saves are never parsed).  Settled workbooks are hashed
+    and parsed on a pool of `workers` processes, and each result is
+    applied as it lands.  A save whose content hash matches what is loaded
+    is skipped.  A rebuild overtaken by a newer save is superseded: its
+    result is dropped unapplied and the workbook goes round again.
+
+    With `namespaced`, every workbook is built as '[Book.xlsx]Sheet!A1' and
+    synced against its own last graph; nodes another workbook's graph
+    still holds (a cell it links to) are never removed.
+    """
+
+    def __init__(self, paths, namespaced: bool = False, debounce: float | None = None,
+                 stable_interval: float | None = None, stable_timeout: float | None = None,
+                 workers: int | None = None):
+        self.namespaced = namespaced
+        self.debounce = _cfg.WATCH_DEBOUNCE if debounce is None else debounce
+        self.stable_interval = stable_interval or _cfg.WATCH_STABLE_INTERVAL
+        self.stable_timeout = stable_timeout or _cfg.WATCH_STABLE_TIMEOUT
+        self.stats = {"events": 0, "syncs": 0, "unchanged": 0, "superseded": 0, "failed": 0,
+                      "removed": 0}
+        self.graphs = {}                    # what the backend holds, per workbook
+        for p in paths:
+            if self._claim(p):
+                self.graphs[p] = nx.DiGraph()
+        self.digests = {}
+        self._gen = {}                      # bumped by every file event
+        self._done = {}                     # generation last taken up by the worker
+        self._last_event = {}
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._pool = ProcessPoolExecutor(workers or _cfg.WATCH_WORKERS)
+        self._worker = threading.Thread(target=self._run, name="sync-worker", daemon=True)
+
+    def _claim(self, path: pathlib.Path) -> bool:
+        """False for a second workbook of the same file name: links can't tell the two apart."""
+        if not self.namespaced or path in self.graphs:
+            return True
+        for q in self.graphs:
+            if q.name.lower() == path.name.lower():
+                log.warning("Skipping %s: %s already holds the name %s", path, q, path.name)
+                return False
+        return True
+
+    def _book(self, path: pathlib.Path) -> str | None:
+        return path.name if self.namespaced else None
+
+    def load(self) -> nx.DiGraph:
+        """Parse every workbook in parallel and load them all, replacing what the backend held."""
+        jobs = {p: self._pool.submit(_parse, str(p), self._book(p), None) for p in self.graphs}
+        G = nx.DiGraph()
+        for p, job in jobs.items():
+            try:
+                self.digests[p], self.graphs[p], secs = job.result()
+                STAGE_SECONDS.observe(secs, stage="parse_workbook")
+            except Exception as e:
+                # left empty: its next save loads it
+                log.error("Could not parse %s: %r", p.name, e)
+                continue
+            G.update(self.graphs[p])
+        backend().load(G, fresh=True)
+        return G
+
+    def start(self):
+        self._worker.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._worker.join()
+        self._pool.shutdown(cancel_futures=True)
+
+    def poke(self, path: pathlib.Path):
+        """`path` changed, appeared or went away (called from the watchdog thread)."""
+        with self._cond:
+            self._gen[path] = self._gen.get(path, 0) + 1
+            self._last_event[path] = time.monotonic()
+            self.stats["events"] += 1
+            self._cond.notify()
+
+    # ── worker ────────────────────────────────────────────────────────────────
+    def _settle(self) -> dict | None:
+        """
+        Wait until some workbooks have gone `debounce` seconds without
+        events; {path: generation reached}, or None when stopping.
+        """
+        with self._cond:
+            while not self._stopping:
+                now, wait, ready = time.monotonic(), None, {}
+                for p, gen in self._gen.items():
+                    if gen == self._done.get(p, 0):
+                        continue
+                    quiet = now - self._last_event[p]
+                    if quiet >= self.debounce:
+                        ready[p] = gen
+                    else:
+                        left = self.debounce - quiet
+                        wait = left if wait is None else min(wait, left)
+                if ready:
+                    self._done.update(ready)
+                    return ready
+                self._cond.wait(wait)
+        return None
+
+    def _stable(self, paths) -> set:
+        """Those of `paths` whose size and mtime hold still and that read as a zip."""
+        deadline = time.monotonic() + self.stable_timeout
+        prev, waiting, ready = {}, set(paths), set()
+        while waiting and time.monotonic() < deadline and not self._stopping:
+            for p in list(waiting):
+                try:
+                    st = p.stat()
+                    cur = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    cur = None
+                if cur is not None and cur == prev.get(p) and zipfile.is_zipfile(p):
+                    waiting.discard(p)
+                    ready.add(p)
+                prev[p] = cur
+            if waiting:
+                time.sleep(self.stable_interval)
+        return ready
+
+    def _run(self):
+        while True:
+            batch = self._settle()
+            if batch is None:
+                return
+            for p in list(batch):
+                if not p.exists():
+                    del batch[p]
+                    if p in self.graphs:
+                        self._remove(p)
+                elif not self._claim(p):
+                    del batch[p]
+            ready = self._stable(batch)
+            if self._stopping:
+                return
+            for p in batch.keys() - ready:
+                log.warning("%s never settled – waiting for the next save", p.name)
+            jobs = {self._pool.submit(_parse, str(p), self._book(p), self.digests.get(p)): p
+                    for p in ready}
+            for job in as_completed(jobs):
+                p = jobs[job]
+                try:
+                    (digest, gx, secs), error = job.result(), None
+                    STAGE_SECONDS.observe(secs, stage="parse_workbook")
+                except Exception as e:
+                    digest, gx, error = None, None, e
+                if self._gen[p] != batch[p]:
+                    # a newer save landed while we parsed (maybe under our feet): that one wins
+                    self.stats["superseded"] += 1
+                    log.info("%s: superseded by a newer save", p.name)
+                    continue
+                if error is not None:
+                    self.stats["failed"] += 1
+                    log.error("Could not parse %s: %r", p.name, error)
+                    continue
+                if gx is None:
+                    self.stats["unchanged"] += 1
+                    continue
+                log.info("%s changed – syncing…", p.name)
+                self._apply(p, gx, digest)
+
+    def _keep(self, path: pathlib.Path):
+        """Nodes the other workbooks' graphs still hold, or None when there is only one graph."""
+        if not self.namespaced:
+            return None
+        others = [g for q, g in self.graphs.items() if q != path]
+        return lambda n: any(n in g for g in others)
+
+    def _remove(self, path: pathlib.Path):
+        log.info("%s is gone – removing its graph", path.name)
+        self._apply(path, nx.DiGraph(), None)
+        del self.graphs[path]
+        self.digests.pop(path, None)
+        self.stats["removed"] += 1
+
+    def _apply(self, path: pathlib.Path, gx, digest: str | None):
+        with stage("sync"):
+            diff = backend().sync(self.graphs.get(path, nx.DiGraph()), gx, self._keep(path))
+        self.graphs[path], self.digests[path] = gx, digest
+        self.stats["syncs"] += 1
+        for k, v in diff.items():
+            SYNC_CHANGES.inc(len(v), change=k)
+        if not any(diff.values()):
+            log.info("No graph changes")
+            return
+        try:
+            requests.post("http://localhost:8000/notify_update", json=diff, timeout=10)
+        except requests.RequestException as e:
+            log.warning("Could not notify the API: %s", e)
+        log.info("%s synced: %s", path.name,
+                 ", ".join(f"{len(v)} {k.replace('_', ' ')}" for k, v in diff.items()))
+
+
 class _Handler(FileSystemEventHandler):
-    def __init__(self, path):
-        self.path = pathlib.Path(path).resolve()
+    def __init__(self, target: Target, scheduler: SyncScheduler):
+        self.target = target
+        self.scheduler = scheduler
+
+    def _poke(self, *paths):
+        for p in paths:
+            if p and self.target.matches(p := pathlib.Path(os.path.abspath(p))):
+                self.scheduler.poke(p)
 
     def on_modified(self, event):
-        if pathlib.Path(event.src_path).resolve() == self.path:
-            print(f"🔄  {self.path.name} changed – reloading…")
-            gx = build_nx_graph(str(self.path))
-            clear_db()
-            upsert_graph(gx)
-            requests.post("http://localhost:8000/notify_update")
-            print("✅  Graph reloaded")
-
-
-def main(xlsx_path: str):
-    p = pathlib.Path(xlsx_path).resolve()
-    gx = build_nx_graph(str(p))
-    clear_db()
-    upsert_graph(gx)
+        if not event.is_directory:
+            self._poke(event.src_path)
+
+    # editors often save to a temp file and rename it over the original
+    on_created = on_deleted = on_modified
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._poke(event.src_path, event.dest_path)
+
+
+def main(target: str):
+    """Watch one workbook, a directory of them or a glob; several are namespaced by file name."""
+    t = _target(target)
+    if _cfg.METRICS_PORT:
+        serve(_cfg.METRICS_PORT)
+    scheduler = SyncScheduler(t.files, namespaced=t.pattern is not None)
+    G = scheduler.load()
+    scheduler.start()
     obs = Observer()
-    obs.schedule(_Handler(p), p.parent, recursive=False)
+    obs.schedule(_Handler(t, scheduler), str(t.root), recursive=t.recursive)
     obs.start()
-    print(f"👀  Watching `{p}` for edits (Ctrl-C to exit)")
+    log.info("Watching %d workbook(s) under `%s` (%s nodes) for edits (Ctrl-C to exit)",
+             len(t.files), t.root, f"{G.number_of_nodes():,}")
     try:
         while True:
             time.sleep(1)
     finally:
         obs.stop()
         obs.join()
+        scheduler.stop()
@@ -0,0 +1,157 @@
+# src/translation_cache.py
+"""
+Cache of natural-language → Cypher translations for /run.
+
+Instructions are normalised before lookup: whitespace collapsed, case
+folded outside quotes (sheet names are case-sensitive), trailing
+punctuation dropped, and every cell / range address lifted out as a
+placeholder, so “Which cells break if I change Sheet1!A2?” and
+“which cells break if i change  Sheet1!B7” share one entry.  When the
+Cypher the LLM wrote quotes each address as a string literal, those
+literals become `$cell0`, `$cell1`, … parameters and the entry is reused for
+any cell; otherwise it is stored for the exact addresses only.
+
+Keys also carry a schema fingerprint (prompt, model, labels and
+relationship types), so a schema change never serves stale translations.
+Entries are evicted least-recently-used past `max_entries` and expire after
+`ttl` seconds; with a `path` they are persisted as JSON across restarts.
+"""
+
+import json, os, re, threading, time
+from collections import OrderedDict
+
+from .parser import ADDRESS, canonical_address
+
+_ADDRESS_RE = re.compile(rf"(?<![\w$!.']){ADDRESS}(?![\w(!])")
+_SPACE_RE = re.compile(r"\s+")
+# 'Q1', "Q1", “Q1”: a quote opens and closes outside a word, so "don't" isn't one
+_QUOTED_RE = re.compile(r"""(?<!\w)(?:'(?:[^']|'')+'|"[^"]+"|“[^”]+”)(?!\w)""")
+
+
+def _fold(text: str) -> str:
+    """`text` casefolded except inside quotes."""
+    out, at = [], 0
+    for m in _QUOTED_RE.finditer(text):
+        out += [text[at:m.start()].casefold(), m.group()]
+        at = m.end()
+    out.append(text[at:].casefold())
+    return "".join(out)
+
+
+def normalize(instruction: str):
+    """
+    (template, addresses): the instruction with addresses replaced by
+    {cell0}, {cell1}, … (repeats share a slot) and normalised, plus the
+    addresses in slot order.
+    """
+    addresses = []
+
+    def slot(m):
+        a = canonical_address(m.group())
+        if a not in addresses:
+            addresses.append(a)
+        return "\0" + str(addresses.index(a)) + "\0"
+
+    text = _ADDRESS_RE.sub(slot, instruction)
+    text = _fold(_SPACE_RE.sub(" ", text).strip().rstrip("?.! "))
+    return re.sub(r"\0(\d+)\0", r"{cell\1}", text), addresses
+
+
+def lift(cypher: str, addresses: list[str]) -> str | None:
+    """`cypher` with each address's string literal made a `$cellN` parameter, or None if one isn't quoted as-is."""
+    for i, a in enumerate(addresses):
+        pattern = re.compile(r"""(['"])""" + re.escape(a) + r"\1")
+        if not pattern.search(cypher):
+            return None
+        cypher = pattern.sub(f"$cell{i}", cypher)
+    return cypher
+
+
+class TranslationCache:
+    def __init__(self, max_entries: int, ttl: float, path: str | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path or None
+        self.hits = self.misses = self.expired = 0
+        self._entries = OrderedDict()   # key -> (cypher, parameterised, created_at)
+        self._lock = threading.Lock()
+        if self.path:
+            self._read()
+
+    @staticmethod
+    def keys(schema: str, instruction: str):
+        """(shared key, exact key, addresses) of an instruction under a schema fingerprint."""
+        template, addresses = normalize(instruction)
+        shared = f"{schema}|{template}"
+        return shared, shared + "|" + "|".join(addresses), addresses
+
+    def get(self, schema: str, instruction: str):
+        """(cypher, params) for a cached translation, or None."""
+        shared, exact, addresses = self.keys(schema, instruction)
+        now = time.time()
+        with self._lock:
+            for key in (shared, exact):
+                hit = self._entries.get(key)
+                if hit is None:
+                    continue
+                cypher, parameterised, created = hit
+                if now - created > self.ttl:
+                    del self._entries[key]
+                    self.expired += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                params = {f"cell{i}": a for i, a in enumerate(addresses)} if parameterised else {}
+                return cypher, params
+            self.misses += 1
+        return None
+
+    def put(self, schema: str, instruction: str, cypher: str):
+        """
+        Remember a translation that ran successfully; returns the (cypher,
+        params) form it was stored in, which runs the same as `cypher`.
+        """
+        shared, exact, addresses = self.keys(schema, instruction)
+        lifted = lift(cypher, addresses) if addresses else cypher
+        key, stored = (shared, lifted) if lifted is not None else (exact, cypher)
+        parameterised = lifted is not None and bool(addresses)
+        with self._lock:
+            self._entries[key] = (stored, parameterised, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self.path:
+                self._write()
+        return stored, ({f"cell{i}": a for i, a in enumerate(addresses)} if parameterised else {})
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path:
+                self._write()
+
+    # ── persistence ───────────────────────────────────────────────────────────
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, cypher, parameterised, created in rows:
+            if now - created <= self.ttl:
+                self._entries[key] = (cypher, parameterised, created)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _write(self):
+        # write-then-rename, so a crash never leaves a half-written file
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump([[k, *v] for k, v in self._entries.items()], f)
+        os.replace(tmp, self.path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits,
+                    "misses": self.misses, "expired": self.expired}
@@ -0,0 +1,159 @@
+# src/viewport.py
+"""
+Paged JSON views of the dependency graph for the /graph viewer.
+
+Two shapes, both cut into pages of at most `limit` nodes and `edge_limit`
+edges with an opaque `cursor` for the next page (None on the last):
+
+* the neighbourhood of a cell — everything within `hops` stored edges in
+  either direction, plus the range and block nodes a cell lies inside
+  (`member` edges), nearest rings first;
+* the whole graph, or one sheet, in name order (a keyset page, so it
+  stays cheap however deep the client scrolls).
+
+Every edge is sent exactly once, with the page holding its later
+endpoint, so a client that appends pages never sees a dangling edge.  A
+neighbourhood cursor is tied to the graph version it was cut from; after a
+change it is refused and the client starts over.
+"""
+
+import base64, binascii, hashlib, json
+
+from .graph_store import GraphBackend
+
+
+class CursorError(ValueError):
+    """A cursor that doesn't belong to this query."""
+
+
+class StaleCursor(CursorError):
+    """A neighbourhood cursor cut from an older graph version."""
+
+
+def _sheet_of(name: str) -> str:
+    return name.rsplit("!", 1)[0]
+
+
+# ── cursors ───────────────────────────────────────────────────────────────────
+def _query_key(*parts) -> str:
+    return hashlib.blake2b(json.dumps(parts).encode(), digest_size=6).hexdigest()
+
+
+def _encode(state: dict) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str, query: str) -> dict:
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise CursorError("malformed cursor")
+    if not isinstance(state, dict) or state.get("q") != query:
+        raise CursorError("cursor belongs to a different query")
+    return state
+
+
+# ── page assembly ─────────────────────────────────────────────────────────────
+def _fill(names: list[str], owned: dict, edge_limit: int):
+    """
+    (how many of `names` fit, their edges, truncated?) — nodes are taken in
+    order with the edges they own until `edge_limit`; the first node always
+    fits, with its edges cut to the limit if it alone has more.
+    """
+    edges, truncated = [], False
+    for i, n in enumerate(names):
+        mine = owned.get(n, ())
+        if i and len(edges) + len(mine) > edge_limit:
+            return i, edges, truncated
+        if len(mine) > edge_limit:
+            mine, truncated = mine[:edge_limit], True
+        edges.extend(mine)
+    return len(names), edges, truncated
+
+
+def _edge(a: str, b: str, member: bool = False) -> dict:
+    return {"from": a, "to": b, "member": True} if member else {"from": a, "to": b}
+
+
+def neighbourhood(store: GraphBackend, center: str, hops: int, sheet: str | None,
+                  max_nodes: int, fanout: int):
+    """
+    (names nearest-first, {name: hop}, [(a, b, member)]) around `center`,
+    stopping at `max_nodes` names.  With `sheet`, only that sheet's nodes
+    are kept (and walked through).
+    """
+    hop, order, frontier = {center: 0}, [center], [center]
+    edges = set()
+    for h in range(1, hops + 1):
+        found = set()
+        pairs = [(a, b, False) for a, b in store.edges_of(frontier, fanout)]
+        pairs += [(a, b, True) for a, b in store.containers(frontier)]
+        for a, b, member in pairs:
+            edges.add((a, b, member))
+            for n in (a, b):
+                if n not in hop and (sheet is None or _sheet_of(n) == sheet):
+                    found.add(n)
+        frontier = sorted(found)[:max_nodes - len(order)]
+        hop.update((n, h) for n in frontier)
+        order.extend(frontier)
+        if not frontier:
+            break
+    else:
+        # links between nodes of the outermost ring
+        edges.update((a, b, False) for a, b in store.edges_of(frontier, fanout))
+    return order, hop, [e for e in edges if e[0] in hop and e[1] in hop]
+
+
+def neighbourhood_page(store: GraphBackend, center: str, hops: int, sheet: str | None,
+                       cursor: str | None, limit: int, edge_limit: int,
+                       max_nodes: int, fanout: int) -> dict:
+    query = _query_key("n", center, hops, sheet)
+    version = store.impact.version
+    offset = 0
+    if cursor:
+        state = _decode(cursor, query)
+        if state.get("v") != version:
+            raise StaleCursor("the graph changed since this cursor was issued")
+        offset = state["o"]
+
+    order, hop, edges = neighbourhood(store, center, hops, sheet, max_nodes, fanout)
+    index = {n: i for i, n in enumerate(order)}
+    owned = {}
+    for a, b, member in sorted(edges):
+        owned.setdefault(order[max(index[a], index[b])], []).append(_edge(a, b, member))
+
+    names = order[offset:offset + limit]
+    taken, page_edges, truncated = _fill(names, owned, edge_limit)
+    names = names[:taken]
+    found = {n["id"]: n for n in store.nodes(names)}
+    nodes = [{**found.get(n, {"id": n, "color": None, "is_range": False, "is_block": False}),
+              "hop": hop[n]} for n in names]
+    end = offset + taken
+    return {
+        "nodes": nodes, "edges": page_edges, "version": version, "total": len(order),
+        "truncated": truncated or len(order) >= max_nodes,
+        "cursor": _encode({"q": query, "v": version, "o": end}) if end < len(order) else None,
+    }
+
+
+def graph_page(store: GraphBackend, sheet: str | None, cursor: str | None,
+               limit: int, edge_limit: int, fanout: int) -> dict:
+    query = _query_key("g", sheet)
+    after = _decode(cursor, query)["a"] if cursor else ""
+    nodes = store.node_page(sheet, after, limit)
+    names = [n["id"] for n in nodes]
+    here = set(names)
+    owned = {}
+    for a, b in sorted(set(store.edges_of(names, fanout))):
+        owner = max(a, b)       # the endpoint sent later; the other is already out
+        if owner in here and (sheet is None or _sheet_of(a) == _sheet_of(b) == sheet):
+            owned.setdefault(owner, []).append(_edge(a, b))
+
+    taken, page_edges, truncated = _fill(names, owned, edge_limit)
+    more = taken < len(names) or len(nodes) == limit
+    return {
+        "nodes": nodes[:taken], "edges": page_edges, "version": store.impact.version,
+        "truncated": truncated,
+        "cursor": _encode({"q": query, "a": names[taken - 1]}) if more and taken else None,
+    }
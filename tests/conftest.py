@@ -0,0 +1,4 @@
+import pathlib, sys
+
+# the code is imported as the `src` package, from the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
@@ -0,0 +1,77 @@
+import networkx as nx
+import pytest
+from openpyxl import Workbook
+
+from src.ingest import build_nx_graph, cell_coords, expand_blocks, range_bounds
+from src.range_index import BlockIndex, CellIndex, RangeIndex, walk_dependents, walk_precedents
+
+
+@pytest.fixture(scope="module")
+def graph(tmp_path_factory):
+    wb = Workbook()
+    s = wb.active
+    s.title = "S"
+    for r in range(1, 11):
+        s[f"A{r}"] = r
+        s[f"B{r}"] = f"=A{r}*2"                             # filled down
+        s[f"C{r}"] = f"=SUM($A$1:A{r})"                     # running total
+        s[f"D{r}"] = f"=B{r}*100" if r == 5 else f"=B{r}+1"  # a run broken at D5
+    for c in "BCDE":
+        s[f"{c}12"] = f"=SUM({c}1:{c}10)"                   # filled right
+    s["E1"] = 7
+    wb.create_sheet("T")["A1"] = "=SUM(S!B:B)+S!D12"
+    path = tmp_path_factory.mktemp("blocks") / "book.xlsx"
+    wb.save(path)
+    return build_nx_graph(str(path))
+
+
+def _blocks(G):
+    return sorted(n.split("#")[0] for n, d in G.nodes(data=True) if d.get("kind") == "block")
+
+
+def test_runs_become_blocks(graph):
+    assert _blocks(graph) == sorted(["S!B1:B10", "S!B12:E12", "S!C1:C10", "S!D1:D4", "S!D6:D10"])
+
+
+def _reference(G):
+    """
+    The per-cell graph with the range containment the walks resolve through
+    an index made explicit: cell → every range holding it for dependents;
+    formula cell → range for precedents (a walk continues into formulas only).
+    """
+    H = expand_blocks(G)
+    assert not any(d.get("kind") == "block" for _, d in H.nodes(data=True))
+    cells = [n for n, d in H.nodes(data=True) if d.get("kind") is None]
+    formulas = {n for n in cells if H.in_degree(n)}
+    down, up = H.copy(), H.copy()
+    for r, d in H.nodes(data=True):
+        if d.get("kind") != "range":
+            continue
+        sheet, r0, r1, c0, c1 = range_bounds(r)
+        for c in cells:
+            c_sheet, row, col = cell_coords(c)
+            if c_sheet == sheet and r0 <= row <= r1 and c0 <= col <= c1:
+                down.add_edge(c, r)
+                if c in formulas:
+                    up.add_edge(c, r)
+    return cells, down, up
+
+
+def test_block_walks_match_the_expanded_graph(graph):
+    cells, down, up = _reference(graph)
+    index, formulas, blocks = RangeIndex.from_graph(graph), CellIndex.from_graph(graph), BlockIndex.from_graph(graph)
+    deps = lambda cs, rs: [d for n in cs + rs if n in graph for d in graph.successors(n)]
+    precs = lambda names: [p for n in names if n in graph for p in graph.predecessors(n)]
+    for cell in cells:
+        assert walk_dependents(cell, index, deps, blocks) == \
+            sorted(n for n in nx.descendants(down, cell) if ":" not in n), cell
+        assert walk_precedents(cell, formulas, precs, blocks) == sorted(nx.ancestors(up, cell)), cell
+
+
+def test_the_broken_run_keeps_its_odd_cell_apart(graph):
+    index, blocks = RangeIndex.from_graph(graph), BlockIndex.from_graph(graph)
+    deps = lambda cs, rs: [d for n in cs + rs if n in graph for d in graph.successors(n)]
+    assert walk_dependents("S!A5", index, deps, blocks) == \
+        ["S!B12", "S!B5", "S!C10", "S!C12", "S!C5", "S!C6", "S!C7", "S!C8", "S!C9", "S!D12", "S!D5", "T!A1"]
+    assert blocks.precedents("S", 5, 4) == []       # D5 is not a block member
+    assert list(graph.predecessors("S!D5")) == ["S!B5"]
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from src.bench import WorkbookSpec, generate
+from src.compact import CompactGraph
+from src.ingest import build_nx_graph
+from src.memory_store import MemoryBackend
+from src.range_index import BlockIndex, CellIndex, RangeIndex, walk_dependents, walk_precedents
+
+
+@pytest.fixture(scope="module")
+def graph(tmp_path_factory):
+    """A small synthetic workbook: blocks, windowed ranges, cross-sheet reads and one-off constants."""
+    path = str(tmp_path_factory.mktemp("compact") / "book.xlsx")
+    generate(WorkbookSpec(sheets=3, cells=1_800, cols=6, range_width=4, scatter=0.1), path)
+    return build_nx_graph(path)
+
+
+def test_round_trip(graph):
+    back = CompactGraph.from_nx(graph).to_nx()
+    assert set(back) == set(graph)
+    assert set(back.edges) == set(graph.edges)
+
+
+def test_steps_match_networkx(graph):
+    cg = CompactGraph.from_nx(graph)
+    for n in random.Random(0).sample(sorted(graph), 200):
+        assert sorted(cg.successors([n])) == sorted(graph.successors(n))
+        assert sorted(cg.predecessors([n])) == sorted(graph.predecessors(n))
+    assert cg.successors(["Nowhere!A1"]) == []
+
+
+def test_walks_over_csr_match_walks_over_networkx(graph):
+    cg = CompactGraph.from_nx(graph)
+    index, formulas, blocks = RangeIndex.from_graph(graph), CellIndex.from_graph(graph), BlockIndex.from_graph(graph)
+    nx_deps = lambda cells, ranges: [d for n in cells + ranges if n in graph for d in graph.successors(n)]
+    nx_precs = lambda names: [p for n in names if n in graph for p in graph.predecessors(n)]
+    cells = [n for n, d in graph.nodes(data=True) if d.get("kind") is None]
+    for cell in random.Random(1).sample(cells, 60):
+        assert walk_dependents(cell, index, lambda c, r: cg.successors(c + r), blocks) == \
+            walk_dependents(cell, index, nx_deps, blocks)
+        assert walk_precedents(cell, formulas, cg.predecessors, blocks) == \
+            walk_precedents(cell, formulas, nx_precs, blocks)
+
+
+def test_memory_backend_walks_over_csr(graph, tmp_path):
+    store = MemoryBackend(str(tmp_path / "snapshot.pkl.gz"))
+    store.load(graph, fresh=True)
+    index, blocks = RangeIndex.from_graph(graph), BlockIndex.from_graph(graph)
+    nx_deps = lambda cells, ranges: [d for n in cells + ranges for d in graph.successors(n)]
+    inputs = [n for n, d in graph.nodes(data=True) if d.get("kind") is None and not graph.in_degree(n)]
+    expected = {c: walk_dependents(c, index, nx_deps, blocks) for c in inputs[::25]}
+    assert any(expected.values())
+    assert {c: store.dependents(c) for c in expected} == expected
@@ -0,0 +1,145 @@
+import pytest
+
+from src.cypher_guard import QueryRejected, bound, check_plan, paged
+
+
+def hops(cypher):
+    return bound(cypher, read=False, max_hops=10)
+
+
+def rows(cypher):
+    return bound(cypher, read=True, max_hops=10, limit=100)
+
+
+# ── traversals ────────────────────────────────────────────────────────────────
+@pytest.mark.parametrize("pattern, expected", [
+    ("*", "*1..10"),
+    ("*2..", "*2..10"),
+    ("*..50", "*1..10"),
+    ("*3..7", "*3..7"),
+    ("*3", "*3"),
+    ("* 1 .. 50", "*1..10"),
+    ("r:DEPENDS_ON*", "r:DEPENDS_ON*1..10"),
+])
+def test_variable_length_is_capped(pattern, expected):
+    assert hops(f"MATCH (a)-[{pattern}]->(b) RETURN b") == f"MATCH (a)-[{expected}]->(b) RETURN b"
+
+
+@pytest.mark.parametrize("pattern", ["*20", "*11..", "*12..40"])
+def test_too_long_a_pattern_is_refused(pattern):
+    with pytest.raises(QueryRejected):
+        hops(f"MATCH (a)-[{pattern}]->(b) RETURN b")
+
+
+def test_quoted_text_is_left_alone():
+    cypher = "MATCH (a)-[*]->(b) WHERE b.note = '-[*]-' AND b.`odd*name` = \"x]-[*\" RETURN b"
+    assert hops(cypher) == cypher.replace("[*]->(b)", "[*1..10]->(b)", 1)
+
+
+def test_a_quote_containing_an_escape_stays_masked():
+    cypher = r"MATCH (a) WHERE a.name = 'it\'s -[*]-' RETURN a LIMIT 5"
+    assert rows(cypher) == cypher
+
+
+# ── result rows ───────────────────────────────────────────────────────────────
+def test_read_without_limit_gets_one():
+    assert rows("MATCH (n) RETURN n;") == "MATCH (n) RETURN n LIMIT 100"
+
+
+def test_larger_limit_is_lowered_smaller_kept():
+    assert rows("MATCH (n) RETURN n LIMIT 5000") == "MATCH (n) RETURN n LIMIT 100"
+    assert rows("MATCH (n) RETURN n LIMIT 7") == "MATCH (n) RETURN n LIMIT 7"
+
+
+def test_only_the_final_return_counts():
+    cypher = "CALL { MATCH (n) RETURN n LIMIT 3 } RETURN n.name"
+    assert rows(cypher) == cypher + " LIMIT 100"
+
+
+def test_parameter_limit_is_left_alone():
+    assert rows("MATCH (n) RETURN n LIMIT $k") == "MATCH (n) RETURN n LIMIT $k"
+
+
+def test_a_union_is_limited_as_a_whole():
+    union = "MATCH (a) RETURN a.name AS x, a AS n UNION MATCH (b) RETURN b.name AS x, b AS n LIMIT 5"
+    assert rows(union + ";") == f"CALL {{ {union} }} RETURN x, n LIMIT 100"
+    assert rows("MATCH (a) RETURN DISTINCT a.name AS `the name` UNION ALL MATCH (b) RETURN b.name AS `the name`") == \
+        "CALL { MATCH (a) RETURN DISTINCT a.name AS `the name` UNION ALL " \
+        "MATCH (b) RETURN b.name AS `the name` } RETURN `the name` LIMIT 100"
+    with pytest.raises(QueryRejected):
+        rows("MATCH (a) RETURN a.name UNION MATCH (b) RETURN b.name")
+
+
+def test_a_union_inside_call_keeps_the_plain_limit():
+    cypher = "CALL { MATCH (a) RETURN a AS n UNION MATCH (b) RETURN b AS n } RETURN n.name AS name"
+    assert rows(cypher) == cypher + " LIMIT 100"
+
+
+def test_a_bounded_union_pages_inside_its_limit():
+    union = bound("MATCH (a) RETURN a.name AS x UNION MATCH (b) RETURN b.name AS x", read=True, limit=50)
+    text, skip, limit = paged(union, ["x"], {})
+    assert (skip, limit) == (0, 50)
+    assert text.endswith("} RETURN x ORDER BY `x` SKIP $_skip LIMIT $_limit")
+
+
+def test_limit_inside_a_string_is_not_the_limit():
+    assert rows("MATCH (n) RETURN 'LIMIT 1' AS s") == "MATCH (n) RETURN 'LIMIT 1' AS s LIMIT 100"
+
+
+def test_writes_get_no_limit():
+    assert bound("MATCH (n) SET n.color = 'red' RETURN n", read=False) == \
+        "MATCH (n) SET n.color = 'red' RETURN n"
+
+
+# ── plans ─────────────────────────────────────────────────────────────────────
+def _op(kind, rows=1.0, *children):
+    return {"operatorType": kind, "args": {"EstimatedRows": rows}, "children": list(children)}
+
+
+def test_affordable_plan_passes():
+    check_plan(_op("ProduceResults@neo4j", 10, _op("NodeIndexSeek@neo4j", 10)), max_rows=1000)
+    check_plan(None, max_rows=1000)
+
+
+def test_cartesian_product_is_refused_anywhere_in_the_plan():
+    plan = _op("ProduceResults", 1, _op("Filter", 1, _op("CartesianProduct@neo4j", 1)))
+    with pytest.raises(QueryRejected, match="cartesian"):
+        check_plan(plan, max_rows=1000)
+
+
+def test_expensive_operator_is_refused():
+    plan = _op("ProduceResults", 10, _op("Expand(All)", 5e6, _op("AllNodesScan", 1e4)))
+    with pytest.raises(QueryRejected, match="Expand"):
+        check_plan(plan, max_rows=1e6)
+
+
+# ── paging ────────────────────────────────────────────────────────────────────
+def test_paged_orders_on_every_column():
+    text, skip, limit = paged("MATCH (n) RETURN n.name, n AS node LIMIT 500", ["n.name", "node"], {})
+    assert text == "MATCH (n) RETURN n.name, n AS node ORDER BY n.name, `node` SKIP $_skip LIMIT $_limit"
+    assert (skip, limit) == (0, 500)
+
+
+def test_paged_keeps_the_query_order_and_its_window():
+    text, skip, limit = paged("MATCH (n) RETURN n.name AS name ORDER BY name DESC SKIP 5 LIMIT $k;",
+                              ["name"], {"k": 20})
+    assert text == "MATCH (n) RETURN n.name AS name ORDER BY name DESC, `name` SKIP $_skip LIMIT $_limit"
+    assert (skip, limit) == (5, 20)
+
+
+def test_paged_union_goes_through_call():
+    union = "MATCH (a) RETURN a.name AS x UNION MATCH (b) RETURN b.name AS x"
+    assert paged(union, ["x"], {})[0] == \
+        f"CALL {{ {union} }} RETURN `x` ORDER BY `x` SKIP $_skip LIMIT $_limit"
+    with pytest.raises(QueryRejected):
+        paged("MATCH (a) RETURN a.name UNION MATCH (a) RETURN a.name", ["a.name"], {})
+
+
+def test_paged_procedure_call_gets_a_return():
+    assert paged("CALL db.labels()", ["label"], {})[0] == \
+        "CALL db.labels() YIELD `label` RETURN `label` ORDER BY `label` SKIP $_skip LIMIT $_limit"
+
+
+def test_paged_refuses_a_limit_it_cannot_read():
+    with pytest.raises(QueryRejected):
+        paged("MATCH (n) RETURN n LIMIT $k", ["n"], {"k": "ten"})
@@ -0,0 +1,83 @@
+import json
+
+from src.events import EventHub, delta_size
+
+
+def _drain(q):
+    frames = []
+    while not q.empty():
+        frames.append(q.get_nowait())
+    return frames
+
+
+def _parse(frame):
+    fields = dict(line.split(": ", 1) for line in frame.strip().split("\n"))
+    return fields["id"], fields["event"], json.loads(fields["data"])
+
+
+def test_events_are_numbered_and_fanned_out():
+    hub = EventHub(queue_size=8, backlog=8)
+    a, b = hub.subscribe(), hub.subscribe()
+    hub.publish("delta", {"added_nodes": [{"id": "S!A1"}]})
+    hub.publish("resync", {})
+    fa, fb = _drain(a), _drain(b)
+    assert fa == fb and fa[0] is fb[0]          # formatted once, shared
+    assert [_parse(f)[:2] for f in fa] == [(f"{hub.epoch}:1", "delta"), (f"{hub.epoch}:2", "resync")]
+    assert _parse(fa[0])[2] == {"added_nodes": [{"id": "S!A1"}], "seq": 1}
+    hub.unsubscribe(a)
+    hub.publish("delta", {})
+    assert _drain(a) == [] and len(_drain(b)) == 1
+
+
+def test_a_full_queue_is_emptied_and_told_to_resync():
+    hub = EventHub(queue_size=3, backlog=16)
+    slow, fast = hub.subscribe(), hub.subscribe()
+    for i in range(3):
+        hub.publish("delta", {"i": i})
+    _drain(fast)
+    hub.publish("delta", {"i": 3})
+    frames = _drain(slow)
+    assert [_parse(f)[1:] for f in frames] == [("resync", {"seq": 4})]
+    assert _parse(frames[0])[0] == f"{hub.epoch}:4"     # a reconnect resumes after it
+    assert [_parse(f)[2]["i"] for f in _drain(fast)] == [3]
+    assert hub.stats()["dropped"] == 1
+    hub.publish("delta", {"i": 4})
+    assert [_parse(f)[2]["i"] for f in _drain(slow)] == [4]
+
+
+def test_a_reconnect_replays_what_it_missed():
+    hub = EventHub(queue_size=8, backlog=4)
+    for i in range(6):
+        hub.publish("delta", {"i": i})
+    q = hub.subscribe(f"{hub.epoch}:4")
+    assert [_parse(f)[0] for f in _drain(q)] == [f"{hub.epoch}:5", f"{hub.epoch}:6"]
+    assert _drain(hub.subscribe(f"{hub.epoch}:6")) == []
+    # seq 2 is the newest the backlog (3..6) can resume after
+    assert [_parse(f)[1] for f in _drain(hub.subscribe(f"{hub.epoch}:2"))] == ["delta"] * 4
+
+
+def test_a_reconnect_the_backlog_cant_serve_resyncs():
+    hub = EventHub(queue_size=8, backlog=4)
+    for i in range(6):
+        hub.publish("delta", {"i": i})
+    for last in (f"{hub.epoch}:1", "deadbeef:5", f"{hub.epoch}:x", "garbage"):
+        frames = _drain(hub.subscribe(last))
+        assert [_parse(f)[1:] for f in frames] == [("resync", {"seq": 6})], last
+
+
+def test_a_replay_longer_than_the_queue_resyncs():
+    hub = EventHub(queue_size=2, backlog=8)
+    for i in range(5):
+        hub.publish("delta", {"i": i})
+    frames = _drain(hub.subscribe(f"{hub.epoch}:1"))
+    assert [_parse(f)[1] for f in frames] == ["resync", "delta"]
+
+
+def test_stats_and_delta_size():
+    hub = EventHub(queue_size=8, backlog=8)
+    hub.subscribe()
+    q = hub.subscribe()
+    hub.publish("delta", {})
+    q.get_nowait()
+    assert hub.stats() == {"clients": 2, "seq": 1, "dropped": 0, "queued": 1, "max_queue": 1}
+    assert delta_size({"added_nodes": [1, 2], "removed_edges": [[1, 2]], "version": 3}) == 3
@@ -0,0 +1,57 @@
+from src.impact_cache import ImpactCache, _sizeof
+
+
+def _computed(calls):
+    def compute(cell):
+        calls.append(cell)
+        return [f"{cell}>{i}" for i in range(3)]
+    return compute
+
+
+def test_hits_are_served_without_recomputing():
+    cache, calls = ImpactCache(max_bytes=1 << 20), []
+    first = cache.get("S!A1", _computed(calls))
+    assert cache.get("S!A1", _computed(calls)) is first
+    assert calls == ["S!A1"]
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["bytes"] == _sizeof(first)
+
+
+def test_a_new_version_drops_every_entry():
+    cache, calls = ImpactCache(max_bytes=1 << 20), []
+    cache.get("S!A1", _computed(calls))
+    cache.invalidate()
+    assert cache.stats()["version"] == 1 and cache.stats()["entries"] == cache.stats()["bytes"] == 0
+    cache.get("S!A1", _computed(calls))
+    assert calls == ["S!A1", "S!A1"]
+
+
+def test_a_result_computed_on_an_old_version_is_not_kept():
+    cache = ImpactCache(max_bytes=1 << 20)
+
+    def compute(cell):
+        cache.invalidate()          # the graph changes while the walk runs
+        return ["S!B1"]
+    assert cache.get("S!A1", compute) == ["S!B1"]
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_is_evicted_past_the_byte_cap():
+    one = _sizeof(_computed([])("S!A1"))
+    cache, calls = ImpactCache(max_bytes=2 * one), []
+    cache.get("S!A1", _computed(calls))
+    cache.get("S!A2", _computed(calls))
+    cache.get("S!A1", _computed(calls))        # A1 is now the most recent
+    cache.get("S!A3", _computed(calls))        # evicts A2
+    assert cache.stats()["entries"] == 2 and cache.bytes <= cache.max_bytes
+    cache.get("S!A1", _computed(calls))
+    cache.get("S!A2", _computed(calls))
+    assert calls == ["S!A1", "S!A2", "S!A3", "S!A2"]
+
+
+def test_a_result_bigger_than_the_cap_is_returned_but_not_kept():
+    cache = ImpactCache(max_bytes=64)
+    big = [f"S!A{i}" for i in range(100)]
+    assert cache.get("S!A1", lambda cell: big) == big
+    assert cache.stats()["entries"] == 0 and cache.bytes == 0
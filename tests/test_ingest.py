@@ -0,0 +1,38 @@
+import networkx as nx
+import pytest
+from openpyxl import Workbook
+
+from src.ingest import AddressError, build_nx_graph, cell_coords
+
+
+def _graph(tmp_path, cells, **kw):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "S"
+    for addr, value in cells.items():
+        ws[addr] = value
+    path = tmp_path / "book.xlsx"
+    wb.save(path)
+    return build_nx_graph(str(path), **kw)
+
+
+def test_a_range_around_its_own_cell_is_carved(tmp_path):
+    G = _graph(tmp_path, {**{f"A{r}": r for r in range(1, 11) if r != 5}, "A5": "=SUM(A1:A10)"})
+    assert set(G.predecessors("S!A5")) == {"S!A1:A4", "S!A6:A10"}
+    assert nx.is_directed_acyclic_graph(G)
+
+
+def test_whole_column_refs_are_clipped_to_the_used_rows(tmp_path):
+    G = _graph(tmp_path, {**{f"A{r}": r for r in range(1, 6)}, "C1": "=SUM(A:A)", "C2": "=SUM(E:E)"})
+    assert list(G.predecessors("S!C1")) == ["S!A1:A5"]
+    assert list(G.predecessors("S!C2")) == []       # column E is empty
+
+
+@pytest.mark.parametrize("name", ["A1", "S!", "S!A0", "S!XFE1", "S!A1048577", "S!hello"])
+def test_bad_addresses_are_refused(name):
+    with pytest.raises(AddressError):
+        cell_coords(name)
+
+
+def test_sheet_names_may_hold_a_bang():
+    assert cell_coords("Q1!x!B3") == ("Q1!x", 3, 2)
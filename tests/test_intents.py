@@ -0,0 +1,45 @@
+import pytest
+
+from src.intents import route
+
+
+@pytest.mark.parametrize("question, name, args", [
+    ("Which cells would break if I change Sheet1!b7?", "dependents", {"cell": "Sheet1!B7"}),
+    ("what depends on 'My Sheet'!$B$7", "dependents", {"cell": "My Sheet!B7"}),
+    ("dependents of  Data Sheet!c4 .", "dependents", {"cell": "Data Sheet!C4"}),
+    ("what does 'It''s'!A1 depend on", "precedents", {"cell": "It's!A1"}),
+    ("inputs to Sheet1!A1:b3", "precedents", {"cell": "Sheet1!A1:B3"}),
+    ("path from Sheet1!A1 to Out!$C$2", "path", {"src": "Sheet1!A1", "dst": "Out!C2"}),
+    ("does Out!C2 depend on Sheet1!A1", "path", {"src": "Sheet1!A1", "dst": "Out!C2"}),
+    ("list formulas on sheet 'Q1 plan'", "cells", {"what": "formulas", "sheet": "Q1 plan"}),
+    ("who references Sheet1!A1:A9", "references", {"ref": "Sheet1!A1:A9"}),
+    ("how many edges are there", "count", {"what": "edges"}),
+    ("how many formulas on Sheet1", "count", {"what": "formulas", "sheet": "Sheet1"}),
+    ("how many cells depend on Sheet1!A1", "count_dependents", {"cell": "Sheet1!A1"}),
+    ("how many inputs does Sheet1!A1 have", "count_precedents", {"cell": "Sheet1!A1"}),
+    ("highlight dependents of Sheet1!A1 in RED", "highlight",
+     {"scope": "dependents", "cell": "Sheet1!A1", "color": "red"}),
+    ("colour Sheet1!a1 and its inputs #FF8800", "highlight",
+     {"also": " and its inputs", "scope": "inputs", "cell": "Sheet1!A1", "color": "#ff8800"}),
+    ("mark Sheet1!A1 as grey", "highlight", {"cell": "Sheet1!A1", "color": "grey"}),
+    ("paint Sheet1!A1 #abc", "highlight", {"cell": "Sheet1!A1", "color": "#abc"}),
+    ("clear colours on 'Q1 plan'", "clear_highlight", {"sheet": "Q1 plan"}),
+    ("reset highlights", "clear_highlight", {}),
+])
+def test_routes(question, name, args):
+    it, got = route(question)
+    assert (it.name, got) == (name, args)
+    assert it.write == (name in ("highlight", "clear_highlight"))
+
+
+@pytest.mark.parametrize("question", [
+    "mark Sheet1!A1 as done",           # not a colour
+    "colour Sheet1!A1 in banana",
+    "paint Sheet1!A1 #ff000",           # not a hex colour length
+    "paint Sheet1!A1 #ggg",
+    "what depends on B7",               # no sheet
+    "why does Sheet1!A1 show #REF!",
+    "dependents of Sheet1!A1 and Sheet2!B2",
+])
+def test_falls_through_to_the_llm(question):
+    assert route(question) is None
@@ -0,0 +1,112 @@
+import os
+
+import networkx as nx
+from openpyxl import Workbook, load_workbook
+
+import src.parse_cache as pc
+from src.ingest import BLOCK_MIN_CELLS, _parse_sheet, build_nx_graph
+from src.parse_cache import SheetCache, _decode, _encode
+from src.refs import RefResolver
+
+
+def _book(path, t_value=1):
+    wb = Workbook()
+    s = wb.active
+    s.title = "S"
+    for r in range(1, 21):
+        s[f"A{r}"] = r
+        s[f"B{r}"] = f"=A{r}*2"                 # a block
+        s[f"C{r}"] = f"=SUM($A$1:A{r})"
+    s["E3"] = "=SUM(B:B)+T!A1"                  # whole column, cross-sheet
+    s["G25"] = 1                                # ragged used range
+    t = wb.create_sheet("T")
+    t["A1"] = t_value
+    t["A2"] = "=S!C20*A1"
+    wb.save(path)
+
+
+def _same_graph(G, H):
+    assert dict(G.nodes(data=True)) == dict(H.nodes(data=True))
+    assert set(G.edges) == set(H.edges)
+
+
+def test_encode_decode_reproduces_the_parsed_sheet(tmp_path):
+    _book(tmp_path / "book.xlsx")
+    wb = load_workbook(tmp_path / "book.xlsx", read_only=True)
+    try:
+        refs = RefResolver(wb)
+        for ws in wb.worksheets:
+            S = nx.DiGraph()
+            rows, width = _parse_sheet(S, ws, ws.title, refs, BLOCK_MIN_CELLS)
+            back, r2, w2 = _decode(_encode(S, rows, width), ws.title)
+            assert (r2, w2) == (rows, width)
+            _same_graph(back, S)
+    finally:
+        wb.close()
+
+
+def test_a_cached_build_matches_a_fresh_one(tmp_path):
+    _book(tmp_path / "book.xlsx")
+    cache = SheetCache(str(tmp_path / "cache"), 64)
+    fresh = build_nx_graph(str(tmp_path / "book.xlsx"))
+    _same_graph(build_nx_graph(str(tmp_path / "book.xlsx"), cache=cache), fresh)
+    assert cache.stats == {"hits": 0, "misses": 2}
+    _same_graph(build_nx_graph(str(tmp_path / "book.xlsx"), cache=cache), fresh)
+    assert cache.stats == {"hits": 2, "misses": 2}
+
+
+def test_an_edited_sheet_misses(tmp_path):
+    cache = SheetCache(str(tmp_path / "cache"), 64)
+    _book(tmp_path / "book.xlsx")
+    build_nx_graph(str(tmp_path / "book.xlsx"), cache=cache)
+    _book(tmp_path / "book.xlsx", t_value=2)    # only T's XML changes
+    G = build_nx_graph(str(tmp_path / "book.xlsx"), cache=cache)
+    assert cache.stats == {"hits": 1, "misses": 3}
+    _same_graph(G, build_nx_graph(str(tmp_path / "book.xlsx")))
+
+
+def test_a_format_bump_misses(tmp_path, monkeypatch):
+    cache = SheetCache(str(tmp_path / "cache"), 64)
+    _book(tmp_path / "book.xlsx")
+    build_nx_graph(str(tmp_path / "book.xlsx"), cache=cache)
+    monkeypatch.setattr(pc, "FORMAT", pc.FORMAT + 1)
+    build_nx_graph(str(tmp_path / "book.xlsx"), cache=cache)
+    assert cache.stats == {"hits": 0, "misses": 4}
+
+
+def test_a_torn_entry_is_a_miss(tmp_path):
+    cache = SheetCache(str(tmp_path / "cache"), 64)
+    cache.put("k", nx.DiGraph([("S!A1", "S!B1")]), 1, 2)
+    cache._path("k").write_bytes(b"not zlib")
+    assert cache.get("k", "S") is None and cache.stats["misses"] == 1
+
+
+def test_prune_drops_the_least_recently_used(tmp_path):
+    cache = SheetCache(str(tmp_path / "cache"), 64)
+    S = nx.DiGraph([(f"S!A{i}", f"S!B{i}") for i in range(50)])
+    for i, k in enumerate("abcd"):
+        cache.put(k, S, 50, 2)
+        os.utime(cache._path(k), (1000 + i, 1000 + i))
+    assert cache.get("a", "S") is not None      # read: now the most recent
+    one = cache._path("a").stat().st_size
+    cache.max_bytes = 3 * one                   # 4 entries over a cap of 3: prune to 2
+    cache.prune()
+    assert sorted(p.stem for p in cache.root.glob("*.sheet")) == ["a", "d"]
+    assert cache._size == 2 * one
+
+
+def test_a_put_past_the_cap_prunes(tmp_path):
+    cache = SheetCache(str(tmp_path / "cache"), 64)
+    cache.put("a", nx.DiGraph(), 1, 1)
+    os.utime(cache._path("a"), (1000, 1000))
+    cache.max_bytes = cache._size * 3 // 2
+    cache.put("b", nx.DiGraph(), 1, 1)
+    assert [p.stem for p in cache.root.glob("*.sheet")] == ["b"]
+
+
+def test_a_relative_root_survives_a_chdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = SheetCache("cache", 64)
+    monkeypatch.chdir(tmp_path.parent)
+    cache.put("a", nx.DiGraph(), 1, 1)
+    assert (tmp_path / "cache" / "a.sheet").exists()
@@ -0,0 +1,72 @@
+import pytest
+
+from src.parser import (canonical_address, dependency_template, extract_dependencies,
+                        place_template, to_r1c1, tokenize, unwrap)
+
+
+# ── tokenizer ─────────────────────────────────────────────────────────────────
+def test_tokens_carry_kind_sheet_and_corners():
+    toks = tokenize("=SUM('My Sheet'!$A$1:B2, Data!C:C, 3:3) + \"A1\" + Rate")
+    assert [t.kind for t in toks] == ["op", "func", "paren", "ref", "sep", "ref", "sep", "ref",
+                                      "paren", "op", "string", "op", "name"]
+    refs = [(t.sheet, t.start, t.end) for t in toks if t.kind == "ref"]
+    assert refs == [("My Sheet", "$A$1", "B2"), ("Data", "C", "C"), (None, "3", "3")]
+
+
+def test_a_ref_inside_a_string_is_not_a_ref():
+    assert extract_dependencies('=IF(A1="B2", C3, "D4")') == [(None, "A1"), (None, "C3")]
+
+
+def test_extract_dependencies_normalises_coordinates():
+    assert extract_dependencies("=SUM('My Sheet'!$a$1:b2, Data!C:C, 3:3)") == \
+        [("My Sheet", "A1:B2"), ("Data", "C:C"), (None, "3:3")]
+
+
+def test_unwrap_google_sheets_dummy_function():
+    assert unwrap('=__xludf.DUMMYFUNCTION("SUM(A1)")') == "=(SUM(A1))"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Sheet1!$a$1", "Sheet1!A1"),
+    ("'Q1 ''x'''!b2:c3", "Q1 'x'!B2:C3"),
+    ("d4", "D4"),
+])
+def test_canonical_address(text, expected):
+    assert canonical_address(text) == expected
+
+
+# ── templates ─────────────────────────────────────────────────────────────────
+def test_filled_down_formulas_share_an_r1c1_key():
+    assert to_r1c1("=A1+$B$2+Sheet2!C3", 2, 2) == "=R[-1]C[-1]+R2C2+Sheet2!R[1]C[1]"
+    assert to_r1c1("=A2+$B$2+Sheet2!C4", 3, 2) == to_r1c1("=A1+$B$2+Sheet2!C3", 2, 2)
+
+
+def test_filled_down_formulas_share_one_template():
+    first = dependency_template("=A1*2+SUM($B$1:B1)", 2, 2)
+    assert first is dependency_template("=A5*2+SUM($B$1:B5)", 6, 2)
+    assert first == ((None, (-1, False, -1, False), None),
+                     (None, (1, True, 2, True), (-1, False, 0, False)))
+
+
+def test_place_template_matches_plain_extraction():
+    tpl = dependency_template("=A1*2+SUM($B$1:B1)", 2, 2)
+    assert place_template(tpl, 10, 2) == extract_dependencies("=A9*2+SUM($B$1:B9)") == \
+        [(None, "A9"), (None, "B1:B9")]
+
+
+def test_refs_shifted_off_the_sheet_are_dropped():
+    tpl = dependency_template("=A1+$C$3", 2, 2)
+    assert place_template(tpl, 1, 1) == [(None, "C3")]
+
+
+def test_refs_shifted_past_the_last_row_or_column_are_dropped():
+    down = dependency_template("=A3+$C$3", 2, 1)                # one row below the host
+    assert place_template(down, 1_048_575, 1) == [(None, "A1048576"), (None, "C3")]
+    assert place_template(down, 1_048_576, 1) == [(None, "C3")]
+    right = dependency_template("=B1", 1, 1)
+    assert place_template(right, 1, 16_384) == []
+
+
+def test_host_cell_form_matches_plain_form():
+    formula = "=SUM(Data!$A2:A10)/COUNT(C:C)"
+    assert extract_dependencies(formula, 4, 5) == extract_dependencies(formula)
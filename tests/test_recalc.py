@@ -0,0 +1,266 @@
+import pytest
+from openpyxl import Workbook
+
+from src.evaluator import (DIV0, FUNCTIONS, NA, NUM, VALUE, NotVector, Unsupported,
+                           compile_formula, evaluate_block, evaluate_cell, evaluate_running,
+                           running_increment, vectorizable)
+from src.recalc import RecalcEngine
+
+
+def _engine(tmp_path, fill):
+    wb = Workbook()
+    wb.remove(wb.active)
+    fill(wb)
+    path = tmp_path / "book.xlsx"
+    wb.save(path)
+    return RecalcEngine.from_workbook(str(path))
+
+
+def _same(got, want):
+    if isinstance(want, float) and not isinstance(want, str):
+        return isinstance(got, float) and got == pytest.approx(want, rel=1e-12)
+    return type(got) is type(want) and got == want
+
+
+# ── scalar evaluation: every function in FUNCTIONS ───────────────────────────
+@pytest.fixture(scope="module")
+def data(tmp_path_factory):
+    def fill(wb):
+        d = wb.create_sheet("D")
+        for r, (a, b) in enumerate(zip([1, 2, 3, 4, 5], "xyxzx"), start=1):
+            d[f"A{r}"], d[f"B{r}"] = a, b
+        d["C1"], d["C2"], d["C3"], d["C5"] = "hello", True, "#N/A", " a  b "
+    return _engine(tmp_path_factory.mktemp("data"), fill)
+
+
+CASES = [
+    ("SUM(A1:A5)", 15.0), ("PRODUCT(A1:A5)", 120.0), ("MIN(A1:A5)", 1.0), ("MAX(A1:A5, 9)", 9.0),
+    ("AVERAGE(A1:A5)", 3.0), ("COUNT(A1:C5)", 5.0), ("COUNTA(B1:C5)", 9.0),
+    ('IF(A1>0, "p", "n")', "p"), ("IF(A1>1, 2)", False),
+    ("IFERROR(1/0, 7)", 7.0), ("IFERROR(A2, 7)", 2.0), ("IFNA(C3, 3)", 3.0),
+    ("AND(TRUE, A1)", True), ("OR(FALSE, 0)", False), ("NOT(A1)", False),
+    ("ABS(-2)", 2.0), ("INT(-1.5)", -2.0), ("SQRT(16)", 4.0), ("SQRT(-1)", NUM), ("EXP(0)", 1.0),
+    ("LN(1)", 0.0), ("LOG10(1000)", 3.0), ("LOG(8, 2)", 3.0), ("LOG(100)", 2.0),
+    ("MOD(-7, 3)", 2.0), ("MOD(7, -3)", -2.0), ("MOD(1, 0)", DIV0), ("POWER(2, 10)", 1024.0),
+    ("ROUND(2.675, 2)", 2.68), ("ROUND(-2.5, 0)", -3.0), ("ROUNDUP(1.21, 1)", 1.3),
+    ("ROUNDDOWN(-1.29, 1)", -1.2), ("PI()", 3.141592653589793), ("NA()", NA),
+    ('SUMIF(B1:B5, "x", A1:A5)', 9.0), ('COUNTIF(A1:A5, ">=3")', 3.0),
+    ('AVERAGEIF(B1:B5, "x", A1:A5)', 3.0), ('SUMIFS(A1:A5, B1:B5, "x", A1:A5, ">1")', 8.0),
+    ('COUNTIFS(B1:B5, "x", A1:A5, "<5")', 2.0), ('AVERAGEIFS(A1:A5, B1:B5, "x", A1:A5, ">1")', 4.0),
+    ("SUMPRODUCT(A1:A5, A1:A5)", 55.0),
+    ("VLOOKUP(3, A1:B5, 2, FALSE)", "x"), ("VLOOKUP(3.5, A1:B5, 2)", "x"),
+    ('MATCH("z", B1:B5, 0)', 4.0), ("INDEX(A1:B5, 2, 2)", "y"),
+    ('XLOOKUP("z", B1:B5, A1:A5)', 4.0), ('XLOOKUP("q", B1:B5, A1:A5, -1)', -1.0),
+    ('CONCAT("a", A1)', "a1"), ('CONCATENATE("a", A1, "-", B1)', "a1-x"),
+    ('LEN("abc")', 3.0), ('LEFT("abc", 2)', "ab"), ('RIGHT("abc")', "c"), ('MID("abcdef", 2, 3)', "bcd"),
+    ('UPPER("aB")', "AB"), ('LOWER("aB")', "ab"), ("TRIM(C5)", "a b"),
+    ('VALUE("12")', 12.0), ('VALUE("x")', VALUE), ("N(B1)", 0.0), ("N(A3)", 3.0),
+    ("ISBLANK(C4)", True), ("ISNUMBER(A1)", True), ("ISTEXT(B1)", True), ("ISTEXT(C3)", False),
+    ("ISERROR(1/0)", True), ("ISNA(C3)", True),
+    ("SUBTOTAL(9, A1:A5)", 15.0), ("SUBTOTAL(101, A1:A5)", 3.0),
+]
+
+
+def test_cases_cover_every_function():
+    named = {f.split("(")[0] for f, _ in CASES}
+    assert named == set(FUNCTIONS)
+
+
+@pytest.mark.parametrize("formula, want", CASES)
+def test_functions(data, formula, want):
+    node = compile_formula("=" + formula, 20, 10)
+    assert _same(evaluate_cell(node, data, "D", 20, 10), want)
+
+
+@pytest.mark.parametrize("formula, want", [
+    ("-2^2", 4.0), ("2*3+4", 10.0), ('"a"&1.5&TRUE', "a1.5TRUE"), ("50%", 0.5),
+    ('"B"="b"', True), ('1<"a"', True), ("1/0+1", DIV0), ("D!A2*D!$A$3", 6.0),
+])
+def test_operators(data, formula, want):
+    node = compile_formula(formula, 20, 10)
+    assert _same(evaluate_cell(node, data, "D", 20, 10), want)
+
+
+def test_unknown_functions_are_unsupported():
+    with pytest.raises(Unsupported):
+        compile_formula("=FOO(1)", 1, 1)
+
+
+# ── evaluate_block against evaluate_cell ─────────────────────────────────────
+A = [2.675, -2.5, 0.125, -7, 7, 1.005, 3, -3, 10, 0.5]
+B = [3, -3, 0.5, 2, -2, 4, 1, 0.25, 3, 2]
+
+
+@pytest.fixture(scope="module")
+def runs(tmp_path_factory):
+    def fill(wb):
+        v = wb.create_sheet("V")
+        for r, (a, b) in enumerate(zip(A, B), start=1):
+            v[f"A{r}"], v[f"B{r}"] = a, b
+            v[f"C{r}"] = 0 if r == 4 else b                 # one zero divisor
+            v[f"D{r}"] = "n/a" if r == 6 else a             # one text cell
+            v[f"E{r}"] = "#VALUE!" if r == 8 else a         # one error
+    return _engine(tmp_path_factory.mktemp("runs"), fill)
+
+
+def _per_cell(node, book, n, col=6):
+    return [evaluate_cell(node, book, "V", r, col) for r in range(1, n + 1)]
+
+
+@pytest.mark.parametrize("formula", [
+    "=A1*2+B1", "=A1/B1", "=A1-B1^2", "=-A1%", "=IF(A1>B1, A1, B1)",
+    "=IFERROR(A1/C1, -1)", "=IFERROR(SQRT(A1), -1)", "=MOD(A1, B1)",
+    "=ROUND(A1, 2)", "=ROUND(A1, 0)", "=ROUNDUP(A1, 1)", "=ROUNDDOWN(A1, 1)",
+    "=INT(A1)", "=ABS(A1)+SQRT(ABS(B1))", "=MAX(A1, B1, 0)", "=MIN(A1, B1)",
+    "=AVERAGE(A1, B1)", "=SUM(A1, B1, 1)", "=PRODUCT(A1, B1)", "=POWER(ABS(A1), 0.5)",
+    "=EXP(B1)-LN(ABS(A1))", "=$A$1+A1", "=A$1*B1", "=SUM($A$1:$A$10)-A1",
+    "=IF(AND(A1>0, B1>0), 1, IF(OR(A1<0, NOT(B1>0)), 2, 3))",
+])
+def test_block_matches_cells(runs, formula):
+    node = compile_formula(formula, 1, 6)
+    assert vectorizable(node)
+    block = evaluate_block(node, runs, "V", 1, len(A), 6)
+    assert all(_same(float(x), y) for x, y in zip(block, _per_cell(node, runs, len(A))))
+
+
+@pytest.mark.parametrize("formula, row, error", [
+    ("=A1/C1", 4, DIV0),            # #DIV/0! in the run
+    ("=MOD(A1, C1)", 4, DIV0),
+    ("=SQRT(A1)", 2, NUM),          # NaN is #NUM!
+    ("=A1+D1", 6, VALUE),           # text
+    ("=A1+E1", 8, VALUE),           # an error value
+    ("=A1>B1", None, None),         # logical result
+])
+def test_block_falls_back(runs, formula, row, error):
+    node = compile_formula(formula, 1, 6)
+    assert vectorizable(node)
+    with pytest.raises(NotVector):
+        evaluate_block(node, runs, "V", 1, len(A), 6)
+    cells = _per_cell(node, runs, len(A))
+    if row:
+        assert cells[row - 1] == error
+
+
+@pytest.mark.parametrize("formula, want", [
+    ("=ROUND(A1, 2)", [2.68, -2.5, 0.13, -7.0, 7.0]),       # half away from zero
+    ("=ROUND(A1, 0)", [3.0, -3.0, 0.0, -7.0, 7.0]),
+    ("=MOD(A1, B1)", [2.675, -2.5, 0.125, 1.0, -1.0]),      # the divisor's sign
+    ("=IFERROR(A1/C1, -1)", [2.675 / 3, 2.5 / 3, 0.25, -1.0, -3.5]),
+])
+def test_vector_round_mod_iferror_follow_the_scalar_path(runs, formula, want):
+    node = compile_formula(formula, 1, 6)
+    assert list(evaluate_block(node, runs, "V", 1, 5, 6)) == pytest.approx(want)
+    assert _per_cell(node, runs, 5) == pytest.approx(want)
+
+
+# ── running totals ───────────────────────────────────────────────────────────
+@pytest.fixture
+def ledger(tmp_path):
+    def fill(wb):
+        s = wb.create_sheet("R")
+        s["A1"], s["D1"] = 100, 100
+        for r in range(2, 51):
+            s[f"B{r}"], s[f"C{r}"] = r * 0.1, (r % 7) * 0.3
+            s[f"A{r}"] = f"=A{r - 1}+B{r}-C{r}"
+            s[f"D{r}"] = f"=B{r}+D{r - 1}"
+    return _engine(tmp_path, fill)
+
+
+def _chain(eng, formula, col, r0=2, r1=50):
+    """The same rows, one cell at a time, each reading the one just written."""
+    node = compile_formula(formula, r0, col)
+    out = []
+    for r in range(r0, r1 + 1):
+        out.append(evaluate_cell(node, eng, "R", r, col))
+        eng.sheets["R"].set(r, col, out[-1])
+    return out
+
+
+@pytest.mark.parametrize("formula, col, exact", [("=A1+B2-C2", 1, False), ("=B2+D1", 4, True)])
+def test_running_total_matches_the_chain(ledger, formula, col, exact):
+    node = compile_formula(formula, 2, col)
+    inc = running_increment(node, "R", col)
+    assert inc is not None
+    running = list(evaluate_running(inc, ledger, "R", 2, 50, col))
+    loaded = [ledger.value("R", r, col) for r in range(2, 51)]
+    chain = _chain(ledger, formula, col)
+    # x - y is summed as one increment, so only `above + x` is bit-for-bit the chain
+    assert running == (chain if exact else pytest.approx(chain, rel=1e-12))
+    assert loaded == pytest.approx(chain, rel=1e-12)
+
+
+@pytest.mark.parametrize("formula", ["=A1*B2", "=A1+A3", "=A1+SUM(A$1:A1)", "=B2-A1"])
+def test_running_increment_rejects(formula):
+    assert running_increment(compile_formula(formula, 2, 1), "R", 1) is None
+
+
+def test_edits_flow_down_a_running_total(ledger):
+    ledger.set_value("R!B10", 50)
+    got = [ledger.value("R", r, 1) for r in range(2, 51)]
+    assert got == pytest.approx(_chain(ledger, "=A1+B2-C2", 1), rel=1e-12)
+
+
+# ── linking: cycles, self-reading runs, stale cells ──────────────────────────
+@pytest.fixture
+def loops(tmp_path):
+    def fill(wb):
+        s = wb.create_sheet("Y")
+        s["A1"], s["B1"] = "=B1+1", "=A1+1"                 # a true cycle
+        for r in range(1, 6):
+            s[f"C{r}"] = f"=C{r + 1}+1"                     # a run reading downward
+        for r in range(1, 4):
+            s[f"E{r}"] = f"=F{r}+1"                         # two runs reading each other,
+            s[f"F{r}"] = f"=E{r + 1}*2"                     # but no cell cycle
+        s["G1"] = "=G1+1"                                   # a cell reading itself
+        s["H1"] = "=FOO(1)"                                 # unsupported
+    return _engine(tmp_path, fill)
+
+
+def test_cycles_and_unsupported_are_stale(loops):
+    assert sorted(loops.stale) == ["Y!A1", "Y!B1", "Y!G1", "Y!H1"]
+
+
+def test_self_reading_runs_are_split(loops):
+    assert [loops.get(f"Y!C{r}") for r in range(1, 6)] == [5.0, 4.0, 3.0, 2.0, 1.0]
+    assert [loops.get(f"Y!E{r}") for r in range(1, 4)] == [7.0, 3.0, 1.0]
+    assert [loops.get(f"Y!F{r}") for r in range(1, 4)] == [6.0, 2.0, 0.0]
+    assert all(u[2] == u[3] for u in loops.units if u[1] in (3, 5, 6))
+    loops.set_value("Y!C5", 10)
+    assert loops.get("Y!C1") == 14.0
+
+
+# ── what_if ──────────────────────────────────────────────────────────────────
+@pytest.fixture
+def model(tmp_path):
+    def fill(wb):
+        s = wb.create_sheet("S")
+        for r in range(1, 11):
+            s[f"A{r}"] = r
+            s[f"B{r}"] = f"=A{r}*2"
+            s[f"C{r}"] = f"=SUM($A$1:A{r})"
+        s["D1"] = "=SUM(B1:B10)+C10"
+    return _engine(tmp_path, fill)
+
+
+def _all(eng):
+    return {f"S!{c}{r}": eng.get(f"S!{c}{r}") for c in "ABCD" for r in range(1, 11)}
+
+
+def test_what_if_leaves_the_engine_as_it_was(model):
+    before = _all(model)
+    res = model.what_if({"S!A3": 100, "S!B5": -1}, ["S!B3", "S!B5", "S!C10", "S!D1"])
+    assert res["values"] == {"S!B3": 200.0, "S!B5": -1.0, "S!C10": 152.0,
+                             "S!D1": 445.0}
+    assert res["inputs"] == 2 and res["recomputed"] > 0
+    assert _all(model) == before
+    assert model.pinned == set()
+
+
+def test_what_if_rolls_back_on_error(model):
+    model.set_value("S!B2", 0)          # a permanent override stays pinned
+    before = _all(model)
+    with pytest.raises(KeyError):
+        model.what_if({"S!A1": 5, "Nope!A1": 1}, ["S!D1"])
+    assert _all(model) == before
+    assert model.pinned == {("S", 2, 2)}
+    assert model.what_if({"S!A2": 9}, ["S!B2"])["values"] == {"S!B2": 0.0}
@@ -0,0 +1,65 @@
+import pytest
+from openpyxl import Workbook, load_workbook
+from openpyxl.workbook.defined_name import DefinedName
+from openpyxl.worksheet.table import Table
+
+from src.refs import RefResolver
+
+
+@pytest.fixture(scope="module")
+def book(tmp_path_factory):
+    """Jan, Feb, Mar and a Sales sheet holding the Orders table, plus some names; opened read-only."""
+    wb = Workbook()
+    wb.active.title = "Jan"
+    wb.create_sheet("Feb")
+    wb.create_sheet("Mar")
+    sales = wb.create_sheet("Sales")
+    for row in [["Item", "Qty", "Price"], ["a", 1, 2], ["b", 3, 4], ["c", 5, 6]]:
+        sales.append(row)
+    sales.add_table(Table(displayName="Orders", ref="A1:C4"))
+    wb.defined_names["Rate"] = DefinedName("Rate", attr_text="Jan!$B$1")
+    wb.defined_names["Twice"] = DefinedName("Twice", attr_text="Rate*2")
+    sales.defined_names["Local"] = DefinedName("Local", attr_text="Sales!$A$1")
+    path = tmp_path_factory.mktemp("refs") / "book.xlsx"
+    wb.save(path)
+    wb = load_workbook(path, read_only=True)
+    yield wb
+    wb.close()
+
+
+@pytest.fixture(scope="module")
+def refs(book):
+    return RefResolver(book)
+
+
+@pytest.mark.parametrize("formula, sheet, row, col, expected", [
+    # defined names, nested and sheet-scoped
+    ("=Rate+1", "Jan", 1, 1, "=(Jan!$B$1)+1"),
+    ("=Twice", "Jan", 1, 1, "=((Jan!$B$1)*2)"),
+    ("=Local", "Sales", 5, 1, "=(Sales!$A$1)"),
+    ("=Local", "Jan", 5, 1, "=Local"),
+    # structured refs
+    ("=SUM(Orders[Qty])", "Jan", 1, 1, "=SUM('Sales'!$B$2:$B$4)"),
+    ("=Orders[@Price]*2", "Sales", 3, 4, "='Sales'!$C3*2"),
+    ("=SUM(Orders[[#All],[Qty]:[Price]])", "Jan", 1, 1, "=SUM('Sales'!$B$1:$C$4)"),
+    ("=SUM(Orders[#Headers])", "Jan", 1, 1, "=SUM('Sales'!$A$1:$C$1)"),
+    ("=Orders[Nope]", "Jan", 1, 1, "=#REF!"),
+    # 3D and external refs
+    ("=SUM(Jan:Mar!B2)", "Sales", 1, 1, "=SUM(('Jan'!B2,'Feb'!B2,'Mar'!B2))"),
+    ("=SUM(Feb:Nope!B2)", "Sales", 1, 1, "=SUM(#REF!)"),
+    ("=[0]Feb!A1", "Jan", 1, 1, "='Feb'!A1"),
+    # nothing workbook-level: untouched
+    ("=A1+B2", "Jan", 1, 1, "=A1+B2"),
+])
+def test_rewrite(refs, formula, sheet, row, col, expected):
+    assert refs.rewrite(formula, sheet, row, col) == expected
+
+
+def test_tables_are_read_from_a_read_only_workbook(refs):
+    orders = refs.tables["orders"]
+    assert (orders.sheet, orders.min_row, orders.max_row, orders.header_rows) == ("Sales", 1, 4, 1)
+    assert orders.columns == ["item", "qty", "price"]
+
+
+def test_digest_is_stable(book, refs):
+    assert RefResolver(book).digest() == refs.digest()
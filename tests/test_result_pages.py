@@ -0,0 +1,78 @@
+import asyncio, base64, json
+
+import pytest
+
+from src.result_pages import decode_cursor, encode_cursor, ndjson, read_page
+from src.viewport import CursorError, StaleCursor
+
+
+class _Record:
+    def __init__(self, n):
+        self.n = n
+
+    def data(self):
+        return {"n": self.n}
+
+
+class _Result:
+    """Stands in for the driver's AsyncResult: records 0…count-1, optionally failing part-way."""
+
+    def __init__(self, count, fail_at=None):
+        self.count, self.fail_at = count, fail_at
+
+    async def __aiter__(self):
+        for i in range(self.count):
+            if i == self.fail_at:
+                raise RuntimeError("connection lost")
+            yield _Record(i)
+
+
+# ── cursors ───────────────────────────────────────────────────────────────────
+def test_cursor_round_trip():
+    cursor = encode_cursor("MATCH (n) RETURN n", {"cell0": "S!A1"}, 500, (0, 1001), version=7)
+    assert decode_cursor(cursor, 7) == ("MATCH (n) RETURN n", {"cell0": "S!A1"}, 500, (0, 1001))
+
+
+def test_cursor_from_an_older_graph_is_stale():
+    cursor = encode_cursor("RETURN 1", {}, 10, (0, 20), version=7)
+    with pytest.raises(StaleCursor):
+        decode_cursor(cursor, 8)
+
+
+def test_edited_cursor_is_refused():
+    sig = encode_cursor("RETURN 1", {}, 10, (0, 20), version=7).split(".")[1]
+    forged = json.dumps({"c": "MATCH (n) DETACH DELETE n", "p": {}, "o": 0, "w": [0, 1], "v": 7})
+    body = base64.urlsafe_b64encode(forged.encode()).decode().rstrip("=")
+    with pytest.raises(CursorError):
+        decode_cursor(f"{body}.{sig}", 7)
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!.abc", "e30.0000"])
+def test_malformed_cursor_is_refused(cursor):
+    with pytest.raises(CursorError):
+        decode_cursor(cursor, 7)
+
+
+# ── reading ───────────────────────────────────────────────────────────────────
+def test_read_page_stops_one_row_past_the_page():
+    assert asyncio.run(read_page(_Result(5), 3)) == ([[0], [1], [2]], True)
+    assert asyncio.run(read_page(_Result(3), 3)) == ([[0], [1], [2]], False)
+
+
+async def _lines(result, max_rows):
+    return [json.loads(line) async for line in ndjson(result, {"columns": ["n"]}, max_rows)]
+
+
+def test_ndjson_head_rows_and_done():
+    assert asyncio.run(_lines(_Result(2), 10)) == [
+        {"columns": ["n"]}, [0], [1], {"done": True, "rows": 2, "truncated": False}]
+
+
+def test_ndjson_marks_truncation():
+    assert asyncio.run(_lines(_Result(5), 3))[-1] == {"done": True, "rows": 3, "truncated": True}
+
+
+def test_ndjson_failure_ends_with_an_error_line():
+    lines = asyncio.run(_lines(_Result(5, fail_at=2), 10))
+    assert lines[1:3] == [[0], [1]]
+    assert "connection lost" in lines[-1]["error"]
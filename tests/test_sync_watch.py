@@ -0,0 +1,227 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from openpyxl import Workbook
+
+import src.sync_watch as sw
+from src.graph_store import diff_graphs
+
+
+class _Store:
+    """Records what the scheduler loads and syncs."""
+
+    def __init__(self):
+        self.loads, self.diffs = [], []
+
+    def load(self, G, fresh=False):
+        self.loads.append(G)
+
+    def sync(self, old, new, keep=None):
+        diff = diff_graphs(old, new, keep)
+        self.diffs.append(diff)
+        return diff
+
+
+def _save(path, value):
+    wb = Workbook()
+    wb.active.title = "S"
+    wb.active["A1"] = value
+    wb.active["B1"] = "=A1*2"
+    wb.active["C1"] = "=A1+B1" if value == 1 else "=B1*3"
+    wb.save(path)
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)         # the parse cache lands in the test's directory
+    sw.sheet_cache.cache_clear()
+    store = _Store()
+    monkeypatch.setattr(sw, "backend", lambda: store)
+    monkeypatch.setattr(sw.requests, "post", lambda *a, **kw: None)
+    yield store
+    sw.sheet_cache.cache_clear()
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Parse in threads, so a test can see (and interleave with) each parse."""
+    calls, real = [], sw._parse
+
+    def parse(path, book, known):
+        calls.append(path)
+        return real(path, book, known)
+    monkeypatch.setattr(sw, "_parse", parse)
+    return calls
+
+
+def _scheduler(paths, **kw):
+    s = sw.SyncScheduler(paths, debounce=0.05, stable_interval=0.01, stable_timeout=2, workers=1, **kw)
+    s._pool.shutdown()
+    s._pool = ThreadPoolExecutor(1)
+    return s
+
+
+def _wait(pred, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not pred():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+# ── debouncing ────────────────────────────────────────────────────────────────
+def test_settle_waits_for_quiet_and_coalesces(tmp_path):
+    a, b = tmp_path / "a.xlsx", tmp_path / "b.xlsx"
+    s = sw.SyncScheduler([], debounce=0.05)
+    try:
+        t0 = time.monotonic()
+        for _ in range(5):
+            s.poke(a)
+        s.poke(b)
+        assert s._settle() == {a: 5, b: 1}
+        assert time.monotonic() - t0 >= 0.05
+        assert s.stats["events"] == 6
+        s.poke(a)
+        time.sleep(0.06)
+        s.poke(b)                       # still inside b's quiet period
+        assert s._settle() == {a: 6}
+        assert s._settle() == {b: 2}
+    finally:
+        s._pool.shutdown()
+
+
+def test_settle_returns_none_when_stopping(tmp_path):
+    s = sw.SyncScheduler([], debounce=10)
+    s.poke(tmp_path / "a.xlsx")
+    s._stopping = True
+    assert s._settle() is None
+    s._pool.shutdown()
+
+
+# ── the worker ────────────────────────────────────────────────────────────────
+def test_a_burst_of_saves_is_one_sync(tmp_path, store, parses):
+    p = tmp_path / "a.xlsx"
+    _save(p, 1)
+    s = _scheduler([p])
+    s.load()
+    s.start()
+    try:
+        _save(p, 2)
+        for _ in range(5):
+            s.poke(p)
+        _wait(lambda: s.stats["syncs"])
+        time.sleep(0.1)
+        assert (s.stats["syncs"], len(parses)) == (1, 2)        # the initial load and one sync
+        assert list(store.diffs[0]["removed_edges"]) == [("S!A1", "S!C1")]
+        assert not store.diffs[0]["added_edges"]
+    finally:
+        s.stop()
+
+
+def test_an_unchanged_save_is_skipped(tmp_path, store, parses):
+    p = tmp_path / "a.xlsx"
+    _save(p, 1)
+    s = _scheduler([p])
+    s.load()
+    s.start()
+    try:
+        s.poke(p)                       # e.g. a save with no edits: same bytes
+        _wait(lambda: s.stats["unchanged"])
+        assert s.stats["syncs"] == 0 and store.diffs == []
+    finally:
+        s.stop()
+
+
+def test_a_parse_overtaken_by_a_newer_save_is_superseded(tmp_path, store, monkeypatch):
+    p = tmp_path / "a.xlsx"
+    _save(p, 1)
+    s = _scheduler([p])
+    s.load()
+    real, calls = sw._parse, []
+
+    def parse(path, book, known):
+        calls.append(path)
+        if len(calls) == 1:
+            s.poke(p)                   # the next save lands while this parse runs
+        return real(path, book, known)
+    monkeypatch.setattr(sw, "_parse", parse)
+    s.start()
+    try:
+        _save(p, 2)
+        s.poke(p)
+        _wait(lambda: s.stats["syncs"])
+        assert s.stats["superseded"] == 1 and len(calls) == 2
+        assert len(store.diffs) == 1
+    finally:
+        s.stop()
+
+
+def test_a_deleted_workbook_is_removed(tmp_path, store, parses):
+    p = tmp_path / "a.xlsx"
+    _save(p, 1)
+    s = _scheduler([p])
+    s.load()
+    s.start()
+    try:
+        p.unlink()
+        s.poke(p)
+        _wait(lambda: s.stats["removed"])
+        assert p not in s.graphs
+        assert sorted(store.diffs[0]["removed_nodes"]) == ["S!A1", "S!B1", "S!C1"]
+    finally:
+        s.stop()
+
+
+# ── what to watch ─────────────────────────────────────────────────────────────
+@pytest.fixture
+def share(tmp_path):
+    for rel in ("a.xlsx", "sub/b.xlsx", "sub/deep/c.xlsx", "sub/~$b.xlsx", "notes.txt"):
+        (tmp_path / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / rel).write_bytes(b"")
+    return tmp_path
+
+
+def test_a_single_workbook(share):
+    t = sw._target(str(share / "a.xlsx"))
+    assert t == sw.Target([share / "a.xlsx"], share, False, None)
+    assert t.matches(share / "a.xlsx") and not t.matches(share / "sub" / "b.xlsx")
+
+
+@pytest.mark.parametrize("spec, root, recursive, files", [
+    ("", "", True, ["a.xlsx", "sub/b.xlsx", "sub/deep/c.xlsx"]),         # a directory
+    ("sub/*.xlsx", "sub", False, ["sub/b.xlsx"]),
+    ("**/*.xlsx", "", True, ["a.xlsx", "sub/b.xlsx", "sub/deep/c.xlsx"]),
+    ("sub/**/c.xlsx", "sub", True, ["sub/deep/c.xlsx"]),
+    ("s?b/[bc].xlsx", "", True, ["sub/b.xlsx"]),
+])
+def test_directories_and_globs(share, spec, root, recursive, files):
+    t = sw._target(str(share / spec) if spec else str(share))
+    assert (t.root, t.recursive) == (share / root if root else share, recursive)
+    assert t.files == [share / f for f in files]
+
+
+def test_matching_later_files(share):
+    t = sw._target(str(share / "**" / "b*.xlsx"))
+    assert t.matches(share / "b2.xlsx")                     # `**/` may match no directory
+    assert t.matches(share / "x" / "y" / "b3.xlsx")
+    assert not t.matches(share / "x" / "c.xlsx")
+    assert not t.matches(share / "bx" / "c.xlsx")           # `*` stays within a file name
+    assert not t.matches(share / "sub" / "~$b.xlsx")        # Excel's lock file
+    assert not sw._target(str(share / "sub" / "*.xlsx")).matches(share / "sub" / "deep" / "c.xlsx")
+
+
+def test_namespaced_workbooks_claim_their_file_name(tmp_path):
+    a, b, c = tmp_path / "x" / "Book.xlsx", tmp_path / "y" / "book.xlsx", tmp_path / "y" / "Other.xlsx"
+    s = sw.SyncScheduler([a, b, c], namespaced=True)
+    try:
+        assert list(s.graphs) == [a, c]
+        assert s._claim(a) and not s._claim(tmp_path / "z" / "BOOK.xlsx")
+        assert s._claim(tmp_path / "z" / "New.xlsx")
+        assert s._book(a) == "Book.xlsx"
+    finally:
+        s._pool.shutdown()
+    s = sw.SyncScheduler([a, b], namespaced=False)
+    try:
+        assert list(s.graphs) == [a, b] and s._book(a) is None
+    finally:
+        s._pool.shutdown()
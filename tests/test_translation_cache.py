@@ -0,0 +1,83 @@
+import pytest
+
+from src import translation_cache
+from src.translation_cache import TranslationCache, lift, normalize
+
+
+# ── normalize ─────────────────────────────────────────────────────────────────
+def test_addresses_become_slots_and_text_is_folded():
+    assert normalize("Which cells break if I change  Sheet1!A2?") == \
+        ("which cells break if i change {cell0}", ["Sheet1!A2"])
+    assert normalize("which cells break if i change Sheet1!B7")[0] == \
+        "which cells break if i change {cell0}"
+
+
+def test_repeated_addresses_share_a_slot():
+    assert normalize("compare S!A1, S!$B$2 and s!a1") == \
+        ("compare {cell0}, {cell1} and {cell2}", ["S!A1", "S!B2", "s!A1"])
+    assert normalize("compare S!A1 with S!$A$1") == ("compare {cell0} with {cell0}", ["S!A1"])
+
+
+def test_quoted_sheet_names_keep_their_case():
+    upper, _ = normalize("Cells on sheet 'Q1' that DON'T feed 'Q1'!a1")
+    lower, _ = normalize("cells on sheet 'q1' that don't feed 'q1'!A1")
+    assert upper == "cells on sheet 'Q1' that don't feed {cell0}"
+    assert upper != lower
+    assert normalize("what feeds 'Q1'!A1")[1] != normalize("what feeds 'q1'!A1")[1]
+
+
+def test_function_calls_are_not_addresses():
+    assert normalize("cells using LOG10(A1)") == ("cells using log10({cell0})", ["A1"])
+
+
+# ── lift ──────────────────────────────────────────────────────────────────────
+def test_lift_parameterises_quoted_addresses():
+    cypher = "MATCH (c {name: 'S!A1'})-[*]->(d) WHERE d.name <> \"S!B2\" RETURN d"
+    assert lift(cypher, ["S!A1", "S!B2"]) == \
+        "MATCH (c {name: $cell0})-[*]->(d) WHERE d.name <> $cell1 RETURN d"
+    assert lift("MATCH (c) WHERE c.name STARTS WITH 'S!A' RETURN c", ["S!A1"]) is None
+
+
+# ── the cache ─────────────────────────────────────────────────────────────────
+def test_a_parameterised_entry_serves_any_cell():
+    cache = TranslationCache(max_entries=10, ttl=60)
+    assert cache.get("v1", "what feeds S!A1?") is None
+    cache.put("v1", "what feeds S!A1?", "MATCH (c {name: 'S!A1'}) RETURN c")
+    assert cache.get("v1", "What feeds S!C9") == ("MATCH (c {name: $cell0}) RETURN c", {"cell0": "S!C9"})
+    assert cache.get("v2", "what feeds S!C9") is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 2, "expired": 0}
+
+
+def test_an_unliftable_entry_serves_its_exact_addresses_only():
+    cache = TranslationCache(max_entries=10, ttl=60)
+    cache.put("v1", "what feeds S!A1", "MATCH (c) WHERE c.name = 'S!' + 'A1' RETURN c")
+    assert cache.get("v1", "what feeds S!A1") == ("MATCH (c) WHERE c.name = 'S!' + 'A1' RETURN c", {})
+    assert cache.get("v1", "what feeds S!A2") is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = TranslationCache(max_entries=2, ttl=60)
+    for q in ("one", "two"):
+        cache.put("v1", q, f"RETURN '{q}'")
+    cache.get("v1", "one")
+    cache.put("v1", "three", "RETURN 'three'")
+    assert cache.get("v1", "two") is None
+    assert cache.get("v1", "one") is not None
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(translation_cache.time, "time", lambda: now[0])
+    cache = TranslationCache(max_entries=10, ttl=60)
+    cache.put("v1", "count cells", "MATCH (c) RETURN count(c)")
+    now[0] += 61
+    assert cache.get("v1", "count cells") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.json")
+    TranslationCache(max_entries=10, ttl=60, path=path).put("v1", "what feeds S!A1",
+                                                            "MATCH (c {name: 'S!A1'}) RETURN c")
+    assert TranslationCache(max_entries=10, ttl=60, path=path).get("v1", "what feeds S!B1") == \
+        ("MATCH (c {name: $cell0}) RETURN c", {"cell0": "S!B1"})
@@ -0,0 +1,122 @@
+from collections import Counter
+
+import networkx as nx
+import pytest
+from openpyxl import Workbook
+
+from src.ingest import build_nx_graph
+from src.memory_store import MemoryBackend
+from src.viewport import CursorError, StaleCursor, graph_page, neighbourhood, neighbourhood_page
+
+FANOUT = 1000
+
+
+@pytest.fixture
+def store(tmp_path):
+    wb = Workbook()
+    s = wb.active
+    s.title = "S"
+    for r in range(1, 13):
+        s[f"A{r}"] = r
+        s[f"B{r}"] = f"=A{r}+A{r % 12 + 1}"
+        s[f"C{r}"] = f"=B{r}*$A$1" if r % 3 else f"=SUM(A1:A{r})"
+    s["D1"] = "=SUM(B1:B12)"
+    t = wb.create_sheet("T")
+    t["A1"] = "=S!D1+S!C4"
+    t["A2"] = "=A1*2"
+    path = tmp_path / "book.xlsx"
+    wb.save(path)
+    store = MemoryBackend(str(tmp_path / "graph.pkl"))
+    store.load(build_nx_graph(str(path)), fresh=True)
+    return store
+
+
+def _pages(fetch):
+    """Every page, following cursors; checks no edge arrives before both its ends."""
+    pages, sent, cursor = [], set(), None
+    while True:
+        page = fetch(cursor)
+        sent.update(n["id"] for n in page["nodes"])
+        for e in page["edges"]:
+            assert e["from"] in sent and e["to"] in sent
+        pages.append(page)
+        cursor = page["cursor"]
+        if cursor is None:
+            return pages
+
+
+def _flat(pages):
+    nodes = [n["id"] for p in pages for n in p["nodes"]]
+    edges = [(e["from"], e["to"]) for p in pages for e in p["edges"]]
+    return nodes, edges
+
+
+@pytest.mark.parametrize("limit, edge_limit", [(5, 1000), (50, 1000), (7, 4)])
+def test_graph_pages_send_each_node_and_edge_once(store, limit, edge_limit):
+    pages = _pages(lambda c: graph_page(store, None, c, limit, edge_limit, FANOUT))
+    nodes, edges = _flat(pages)
+    assert nodes == sorted(store.graph)
+    assert len(edges) == len(set(edges)) and set(edges) == set(store.graph.edges)
+    assert all(len(p["nodes"]) <= limit and len(p["edges"]) <= edge_limit for p in pages)
+    assert not any(p["truncated"] for p in pages)
+
+
+def test_a_sheet_page_keeps_to_its_sheet(store):
+    nodes, edges = _flat(_pages(lambda c: graph_page(store, "T", c, 1, 1000, FANOUT)))
+    assert nodes == ["T!A1", "T!A2"]
+    assert edges == [("T!A1", "T!A2")]
+
+
+def test_a_node_owning_more_than_edge_limit_is_truncated(store):
+    owned = Counter(max(a, b) for a, b in store.graph.edges)
+    pages = _pages(lambda c: graph_page(store, None, c, 1, 1, FANOUT))
+    for p in filter(lambda p: p["nodes"], pages):     # a keyset walk may end on an empty page
+        n = p["nodes"][0]["id"]
+        assert p["truncated"] == (owned[n] > 1) and len(p["edges"]) == min(owned[n], 1)
+    assert any(p["truncated"] for p in pages)
+
+
+@pytest.mark.parametrize("limit, edge_limit", [(3, 1000), (4, 5), (1000, 1000)])
+def test_neighbourhood_pages_match_the_neighbourhood(store, limit, edge_limit):
+    center, hops = "S!B4", 2
+    pages = _pages(lambda c: neighbourhood_page(store, center, hops, None, c, limit, edge_limit,
+                                                500, FANOUT))
+    nodes, edges = _flat(pages)
+    order, hop, expected = neighbourhood(store, center, hops, None, 500, FANOUT)
+    assert nodes == order and nodes[0] == center
+    assert len(edges) == len(set(edges)) and set(edges) == {(a, b) for a, b, _ in expected}
+    hops_seen = [n["hop"] for p in pages for n in p["nodes"]]
+    assert hops_seen == sorted(hops_seen) and max(hops_seen) <= hops
+    assert {p["total"] for p in pages} == {len(order)}
+
+
+def test_neighbourhood_reaches_what_the_graph_does(store):
+    order, hop, _ = neighbourhood(store, "S!A4", 1, None, 500, FANOUT)
+    G = store.graph
+    direct = set(G.successors("S!A4")) | set(G.predecessors("S!A4"))
+    assert direct <= set(order) and all(hop[n] == 1 for n in direct)
+    # the ranges and blocks A4 lies inside come in as member edges
+    members = {n for n in order if hop[n] == 1} - direct
+    assert members and all(":" in n for n in members)
+    assert nx.is_directed_acyclic_graph(G)
+
+
+def test_a_neighbourhood_cursor_goes_stale_when_the_graph_changes(store):
+    page = neighbourhood_page(store, "S!B4", 2, None, None, 3, 1000, 500, FANOUT)
+    assert page["cursor"]
+    extra = nx.DiGraph()
+    extra.add_edge("T!A2", "T!A3")
+    store.load(extra)
+    with pytest.raises(StaleCursor):
+        neighbourhood_page(store, "S!B4", 2, None, page["cursor"], 3, 1000, 500, FANOUT)
+    assert neighbourhood_page(store, "S!B4", 2, None, None, 3, 1000, 500, FANOUT)["version"] > page["version"]
+
+
+def test_cursors_belong_to_one_query(store):
+    cursor = graph_page(store, None, None, 5, 1000, FANOUT)["cursor"]
+    with pytest.raises(CursorError):
+        graph_page(store, "S", cursor, 5, 1000, FANOUT)
+    with pytest.raises(CursorError):
+        neighbourhood_page(store, "S!B4", 2, None, cursor, 3, 1000, 500, FANOUT)
+    with pytest.raises(CursorError):
+        graph_page(store, None, "not a cursor!", 5, 1000, FANOUT)